@@ -1,48 +1,48 @@
-# -*- coding: utf-8 -*-
-"""
-/***************************************************************************
- Batch_Hillshader
-                                 A QGIS plugin  to generate a three light 
-                                 exposure hillshade (shaded relief by 
-                                 combining three light exposures)
-  
-    For more information, see the program documentation.
-                                 
-    If you uses as input LiDAR data, note that plugin uses LASTools library.
-        See LASTools License at  <https://rapidlasso.com/lastools/>
-        
-    Plugin also use in LiDAR data mode FUSION LDV. 
-        See FUSION LDV License at <http://forsys.cfr.washington.edu/fusion.html>
-                              -------------------
-        begin                : 2016-07-13
-        git sha              : $Format:%H$
-        copyright            : (C) 2017 by PANOimagen S.L.
-        email                : info@panoimagen.com
- ***************************************************************************/
-
-/***************************************************************************
- *                                                                         *
- *   This program is free software: you can redistribute it and/or modify  *
- *   it under the terms of the GNU General Public License as published by  *
- *   the Free Software Foundation, either version 3 of the License, or     *
- *   (at your option) any later version.                                   *
- *                                                                         *
- *   This program is distributed in the hope that it will be useful,       * 
- *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
- *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
- *   GNU General Public License for more details.                          *
- *                                                                         *
- *   You should have received a copy of the GNU General Public License     *
- *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
- ***************************************************************************/
-"""
-# noinspection PyPep8Naming
-def classFactory(iface):  # pylint: disable=invalid-name
-    """Load batchHillshader class from file batch_hillshader.
-
-    :param iface: A QGIS interface instance.
-    :type iface: QgsInterface
-    """
-    #
-    from .batch_hillshader import batchHillshader
-    return batchHillshader(iface)
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ Batch_Hillshader
+                                 A QGIS plugin  to generate a three light 
+                                 exposure hillshade (shaded relief by 
+                                 combining three light exposures)
+  
+    For more information, see the program documentation.
+                                 
+    If you uses as input LiDAR data, note that plugin uses LASTools library.
+        See LASTools License at  <https://rapidlasso.com/lastools/>
+        
+    Plugin also use in LiDAR data mode FUSION LDV. 
+        See FUSION LDV License at <http://forsys.cfr.washington.edu/fusion.html>
+                              -------------------
+        begin                : 2016-07-13
+        git sha              : $Format:%H$
+        copyright            : (C) 2017 by PANOimagen S.L.
+        email                : info@panoimagen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software: you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation, either version 3 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ *   This program is distributed in the hope that it will be useful,       * 
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+ *   GNU General Public License for more details.                          *
+ *                                                                         *
+ *   You should have received a copy of the GNU General Public License     *
+ *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
+ ***************************************************************************/
+"""
+# noinspection PyPep8Naming
+def classFactory(iface):  # pylint: disable=invalid-name
+    """Load batchHillshader class from file batch_hillshader.
+
+    :param iface: A QGIS interface instance.
+    :type iface: QgsInterface
+    """
+    #
+    from .batch_hillshader import batchHillshader
+    return batchHillshader(iface)
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ Batch_Hillshader
+                                 A QGIS plugin  to generate a three light
+                                 exposure hillshade (shaded relief by
+                                 combining three light exposures)
+
+    For more information, see the program documentation.
+
+    Plugin uses LASzip, see <https://laszip.org/>
+                              -------------------
+        begin                : 2016-07-13
+        git sha              : $Format:%H$
+        copyright            : (C) 2017 by PANOimagen S.L.
+        email                : info@panoimagen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software: you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation, either version 3 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ *   This program is distributed in the hope that it will be useful,       *
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+ *   GNU General Public License for more details.                          *
+ *                                                                         *
+ *   You should have received a copy of the GNU General Public License     *
+ *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
+ ***************************************************************************/
+ Command line entry point, runs the plugin process without QGIS:
+
+    python -m batch_hillshader dem_1.tif dem_2.tif -o output_folder
+"""
+
+import argparse
+import os
+import sys
+
+from . import batch_processing
+from . import hillshade
+from .plugin_utils import raster_funs
+
+def parse_args(argv=None):
+    """Parse the command line arguments
+    """
+    defaults = batch_processing.DEFAULT_HILL_PARAMS
+    exposures = range(1, 4)
+
+    parser = argparse.ArgumentParser(
+            prog='batch_hillshader',
+            description='Generate a three light exposure hillshade from ' +
+                        'DEM rasters (GeoTIFF / ASCII) or LiDAR files (las)')
+    parser.add_argument('input_files', nargs='+',
+                        help='DEM or LiDAR files to process')
+    parser.add_argument('-o', '--output', required=True,
+                        help='output folder')
+    parser.add_argument('--azimuths', nargs='+', type=float,
+                        default=[defaults['azimuth{}'.format(i)]
+                                 for i in exposures],
+                        help='azimuth of each light exposure (degrees)')
+    parser.add_argument('--altitudes', nargs='+', type=float,
+                        default=[defaults['angle_altitude{}'.format(i)]
+                                 for i in exposures],
+                        help='altitude of each light exposure (degrees)')
+    parser.add_argument('--transparencies', nargs='+', type=float,
+                        default=[defaults['transparency{}'.format(i)] * 100
+                                 for i in exposures],
+                        help='transparency of each light exposure (%%)')
+    parser.add_argument('--shading',
+                        default=hillshade.DEFAULT_SHADING_METHOD,
+                        choices=sorted(hillshade.SHADING_METHODS),
+                        help='shading engine: trigonometric (slope and ' +
+                             'aspect) or normal (surface normal vectors)')
+    parser.add_argument('--kernel',
+                        default=hillshade.DEFAULT_GRADIENT_KERNEL,
+                        choices=hillshade.GRADIENT_KERNELS,
+                        help='stencil used to compute the DEM derivatives')
+    parser.add_argument('--z-factor', type=float, default=None,
+                        help='elevations to pixel size units factor ' +
+                             '(default: 1, or computed for geographic DEMs)')
+    parser.add_argument('--partials', action='store_true',
+                        help='save the intermediate files')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='number of files processed at the same time')
+    parser.add_argument('--threads', type=int,
+                        default=hillshade.DEFAULT_SHADING_THREADS,
+                        help='threads that shade each file')
+    parser.add_argument('--fused', action='store_true',
+                        help='shade and blend in a single pass (compiled ' +
+                             'if numba is installed)')
+    parser.add_argument('--pixel-size', type=float, default=2.,
+                        help='DEM pixel size for LiDAR files (meters)')
+    parser.add_argument('--method', default='nearest',
+                        choices=batch_processing.INTERPOLATION_METHODS,
+                        help='interpolation method for LiDAR files')
+    parser.add_argument('--output-profile',
+                        default=raster_funs.DEFAULT_OUTPUT_PROFILE,
+                        choices=sorted(raster_funs.OUTPUT_PROFILES),
+                        help='creation options of the output rasters ' +
+                             '(tiling, compression, cog)')
+    parser.add_argument('--surfaces', action='store_true',
+                        help='surfaces hillshade (first returns) for ' +
+                             'LiDAR files instead of terrain hillshade')
+    parser.add_argument('--cache', default=None, metavar='CACHE_DIR',
+                        help='folder of the results cache: unchanged ' +
+                             'files and params are not processed again')
+    parser.add_argument('--cache-hash', action='store_true',
+                        help='identify the cached files by their content ' +
+                             'hash, not only by their size and date')
+    parser.add_argument('--cache-size', type=float, default=10.,
+                        metavar='GB',
+                        help='size limit of the results cache, the least ' +
+                             'recently used results are removed')
+    parser.add_argument('--reblend', action='store_true',
+                        help='blend again, with the new transparencies, the ' +
+                             'partial hillshades saved (--partials) in the ' +
+                             'last results folder of each file')
+    parser.add_argument('--tile-set', action='store_true',
+                        help='the DEM files are tiles of a mosaic: shade ' +
+                             'each one with the data of its neighbours, ' +
+                             'without seams between tiles')
+    parser.add_argument('--mosaic', action='store_true',
+                        help='build a virtual mosaic (vrt) of the ' +
+                             'composed hillshades, with overviews')
+
+    return parser.parse_args(argv)
+
+def print_progress(done, total, result):
+    """Print the result of each processed file
+    """
+    _, filename = os.path.split(result['input_file'])
+    if result['error']:
+        sys.stderr.write('({}/{}) Error processing {}: {}\n'.format(
+                done, total, filename, result['error']))
+    else:
+        print('({}/{}) {} -> {}'.format(done, total, filename,
+                                        result['composed_hillshade']))
+
+def main(argv=None):
+    """Run the process for the files given in the command line. Returns the
+    exit status: 1 if any file failed
+    """
+    args = parse_args(argv)
+    try:
+        hill_params = batch_processing.create_hill_params(
+                args.azimuths, args.altitudes,
+                [transparency / 100 for transparency in args.transparencies],
+                args.shading, args.kernel, args.z_factor, args.threads,
+                args.fused)
+    except ValueError as message:
+        sys.stderr.write('{}\n'.format(message))
+        return 2
+
+    results = batch_processing.hillshade_files(args.input_files,
+                                               args.output,
+                                               hill_params,
+                                               args.workers,
+                                               args.partials,
+                                               args.pixel_size,
+                                               args.method,
+                                               args.surfaces,
+                                               print_progress,
+                                               args.output_profile,
+                                               args.cache,
+                                               args.cache_hash,
+                                               args.reblend,
+                                               args.tile_set,
+                                               int(args.cache_size * 2 ** 30))
+
+    if args.mosaic:
+        mosaic_path = batch_processing.build_results_mosaic(
+                results, args.output, max(args.workers, args.threads))
+        if mosaic_path is not None:
+            print('Mosaic -> {}'.format(mosaic_path))
+
+    return 1 if any(result['error'] for result in results) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,55 +1,86 @@
-# -*- coding: utf-8 -*-
-"""
-/***************************************************************************
- Batch_Hillshader
-                                 A QGIS plugin  to generate a three light 
-                                 exposure hillshade (shaded relief by 
-                                 combining three light exposures)
-  
-    For more information, see the program documentation.
-                                 
-    If you uses as input LiDAR data, note that plugin uses LASTools library.
-        See LASTools License at  <https://rapidlasso.com/lastools/>
-        
-    Plugin also use in LiDAR data mode FUSION LDV. 
-        See FUSION LDV License at <http://forsys.cfr.washington.edu/fusion.html>
-                              -------------------
-        begin                : 2016-07-13
-        git sha              : $Format:%H$
-        copyright            : (C) 2017 by PANOimagen S.L.
-        email                : info@panoimagen.com
- ***************************************************************************/
-
-/***************************************************************************
- *                                                                         *
- *   This program is free software: you can redistribute it and/or modify  *
- *   it under the terms of the GNU General Public License as published by  *
- *   the Free Software Foundation, either version 3 of the License, or     *
- *   (at your option) any later version.                                   *
- *                                                                         *
- *   This program is distributed in the hope that it will be useful,       * 
- *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
- *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
- *   GNU General Public License for more details.                          *
- *                                                                         *
- *   You should have received a copy of the GNU General Public License     *
- *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
- ***************************************************************************/
-"""
-import numpy as np
-from .plugin_utils import raster_funs
-
-def merge_arrays(input_arrays, alpha_values,
-        dem_array, no_data_value, background_value=255):
-    '''Merge several input_arrays with given transparency values.
-
-    Alpha values is a list of floats between 0 and 1 with the same size as
-    the list of input_arrays.'''
-
-    output = background_value * np.ones(input_arrays[0].shape, dtype = float)
-    for array, alpha in zip(input_arrays, alpha_values):
-        output = array * alpha + (1 - alpha) * output
-        
-    eroded_hill = raster_funs.raster_erosion(output, dem_array, no_data_value)
-
-    return eroded_hill.astype(array[0].dtype)
\ No newline at end of file
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ Batch_Hillshader
+                                 A QGIS plugin  to generate a three light 
+                                 exposure hillshade (shaded relief by 
+                                 combining three light exposures)
+  
+    For more information, see the program documentation.
+                                 
+    If you uses as input LiDAR data, note that plugin uses LASTools library.
+        See LASTools License at  <https://rapidlasso.com/lastools/>
+        
+    Plugin also use in LiDAR data mode FUSION LDV. 
+        See FUSION LDV License at <http://forsys.cfr.washington.edu/fusion.html>
+                              -------------------
+        begin                : 2016-07-13
+        git sha              : $Format:%H$
+        copyright            : (C) 2017 by PANOimagen S.L.
+        email                : info@panoimagen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software: you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation, either version 3 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ *   This program is distributed in the hope that it will be useful,       * 
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+ *   GNU General Public License for more details.                          *
+ *                                                                         *
+ *   You should have received a copy of the GNU General Public License     *
+ *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
+ ***************************************************************************/
+"""
+import numpy as np
+from .plugin_utils import raster_funs
+
+def layer_weights(alpha_values, background_value=255):
+    '''Get the closed form weights of the blend done by merge_arrays.
+
+    Blending layer by layer, output = array * alpha + (1 - alpha) * output,
+    gives output = offset + sum(weight * array), with the weight of each
+    layer its alpha times the (1 - alpha) of the layers over it and offset
+    the background value times every (1 - alpha). Returns
+    (weights, offset).
+    '''
+    weights = []
+    remaining = 1.
+    for alpha in reversed(alpha_values):
+        weights.append(alpha * remaining)
+        remaining *= 1 - alpha
+    weights.reverse()
+
+    return weights, background_value * remaining
+
+def merge_arrays(input_arrays, alpha_values,
+        dem_array, no_data_value, background_value=255, mask=None):
+    '''Merge several input_arrays with given transparency values.
+
+    Alpha values is a list of floats between 0 and 1 with the same size as
+    the list of input_arrays, that can have any number of arrays. The
+    layers are accumulated in place in a single float32 buffer and the
+    DEM no data mask (eroded) is applied while quantising to uint8. mask is
+    the raster_funs.ValidityMask of the DEM, computed from dem_array and
+    no_data_value if it is not given.'''
+    weights, offset = layer_weights(alpha_values, background_value)
+
+    output = np.full(input_arrays[0].shape, offset, dtype=np.float32)
+    term = np.empty_like(output)
+    for array, weight in zip(input_arrays, weights):
+        output += np.multiply(array, weight, out=term)
+    del term
+
+    if mask is None:
+        mask = raster_funs.ValidityMask(dem_array, no_data_value)
+    valid = mask.array()
+
+    merged_array = np.zeros(output.shape, dtype=np.uint8)
+    np.copyto(merged_array, output, casting='unsafe',
+              where=True if valid is None else valid)
+
+    return merged_array
@@ -0,0 +1,676 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ Batch_Hillshader
+                                 A QGIS plugin  to generate a three light
+                                 exposure hillshade (shaded relief by
+                                 combining three light exposures)
+
+    For more information, see the program documentation.
+
+    Plugin uses LASzip, see <https://laszip.org/>
+                              -------------------
+        begin                : 2016-07-13
+        git sha              : $Format:%H$
+        copyright            : (C) 2017 by PANOimagen S.L.
+        email                : info@panoimagen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software: you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation, either version 3 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ *   This program is distributed in the hope that it will be useful,       *
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+ *   GNU General Public License for more details.                          *
+ *                                                                         *
+ *   You should have received a copy of the GNU General Public License     *
+ *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
+ ***************************************************************************/
+"""
+
+import multiprocessing
+import os
+import queue
+import sys
+import traceback
+from concurrent import futures
+
+from . import hillshade
+from . import hillshader_process
+from .plugin_utils import raster_funs
+from .plugin_utils import files_and_dirs_funs
+from .plugin_utils import result_cache
+from .plugin_utils import tile_index
+from .bh_errors import ProcessCanceledError
+
+LASPY_MODE = 'laspyInput'
+DEM_MODE = 'DEMInput'
+
+LIDAR_EXTENSIONS = ('.las',)
+
+# Seconds between the checks of a caller that waits for a pooled job (see
+# PooledJob)
+POOL_POLL_INTERVAL = 0.2
+
+# Virtual mosaic of the composed hillshades of a batch, in its output folder
+MOSAIC_FILENAME = 'ComposedHillshade_mosaic.vrt'
+
+# Marks the halo pixels that no tile covers while a tile without its own no
+# data value is read, they are then filled (see raster_funs.read_with_halo)
+TILE_NO_DATA_VALUE = -99999
+
+# LiDAR rasterization methods, see laspy_utils.RasterizeLiDAR
+INTERPOLATION_METHODS = ['nearest', 'linear', 'cubic', 'idw',
+                         'min', 'max', 'mean']
+
+# Same default values as the plugin dialog
+DEFAULT_HILL_PARAMS = {'azimuth1': 350.,
+                       'azimuth2': 15.,
+                       'azimuth3': 270.,
+                       'angle_altitude1': 70.,
+                       'angle_altitude2': 60.,
+                       'angle_altitude3': 55.,
+                       'transparency1': 0.65,
+                       'transparency2': 0.50,
+                       'transparency3': 0.70}
+
+def create_job(input_file, out_path, mode, hill_params, partials=False,
+               load_composed=True, pixel_size=None, method='nearest',
+               terrain=True, surfaces=False, streaming=True,
+               output_profile=raster_funs.DEFAULT_OUTPUT_PROFILE,
+               cache_dir=None, cache_hash=False, reblend=False,
+               neighbours=None, cache_size=result_cache.DEFAULT_MAX_SIZE):
+    """Create the dictionary with every parameter needed to process one
+    input file (see process_file).
+
+    out_path is the results folder of this file (i.e. <name>_r<N>).
+    streaming reads LiDAR files in chunks (see laspy_utils.LiDAR) and
+    output_profile sets the rasters creation options (see
+    raster_funs.OUTPUT_PROFILES). cache_dir is the folder of the results
+    cache (see result_cache.ResultCache, None to not use it), with
+    cache_hash the input files are identified by their content hash and
+    cache_size is its size limit in bytes (older results are removed). With
+    reblend the partial hillshades saved in out_path by a previous process
+    are blended again instead of shading the DEM (see
+    hillshader_process.ReblendHillshaderDEM). neighbours are the DEM tiles
+    around a DEM input file (see tile_index.tile_neighbours), the file is
+    shaded with a halo of their data so there are no seams between tiles
+    """
+    return {'input_file': input_file,
+            'out_path': out_path,
+            'mode': mode,
+            'hill_params': hill_params,
+            'partials': partials,
+            'load_composed': load_composed,
+            'pixel_size': pixel_size,
+            'method': method,
+            'terrain': terrain,
+            'surfaces': surfaces,
+            'streaming': streaming,
+            'output_profile': output_profile,
+            'cache_dir': cache_dir,
+            'cache_hash': cache_hash,
+            'cache_size': cache_size,
+            'reblend': reblend,
+            'neighbours': neighbours}
+
+def job_stages(job):
+    """Get the stages (see hillshader_process.READ_STAGE...) of a job in the
+    order they are run
+    """
+    if job['mode'] == LASPY_MODE and not job.get('reblend'):
+        return (hillshader_process.READ_STAGE,
+                hillshader_process.RASTERIZE_STAGE,
+                hillshader_process.SHADE_STAGE,
+                hillshader_process.WRITE_STAGE)
+
+    return (hillshader_process.READ_STAGE,
+            hillshader_process.SHADE_STAGE,
+            hillshader_process.WRITE_STAGE)
+
+def empty_result(job, error=None):
+    """Create the result dictionary of a job that has not produced results
+    """
+    return {'input_file': job['input_file'],
+            'out_path': job['out_path'],
+            'composed_hillshade': None,
+            'layers': [],
+            'error': error,
+            'traceback': None,
+            'canceled': False}
+
+def process_file(job, stage_callback=None, cancel_check=None):
+    """Run the whole hillshade process for one input file.
+
+    This function does not use the QGIS interface so it can run in a worker
+    process. Errors are caught and returned in the result dictionary, the
+    layers to load into canvas are returned as (full_path, layer_name) pairs.
+    stage_callback is called with each stage (see job_stages) when it
+    starts; raising bh_errors.ProcessCanceledError from it stops the process
+    and the result is marked as canceled. cancel_check is called the same
+    way inside the long loops (LiDAR tiles, DEM blocks), so a canceled job
+    stops without waiting for the next stage
+    """
+    result = empty_result(job)
+    try:
+        cache = job_cache(job)
+        if job.get('reblend'):
+            hill_dem, layers = _reblend(job, stage_callback, cancel_check)
+        elif job['mode'] == LASPY_MODE:
+            hill_dem, layers = _process_lidar(job, stage_callback, cache,
+                                              cancel_check)
+        else:
+            hill_dem, layers = _process_dem(job, stage_callback, cache,
+                                            cancel_check)
+        result['composed_hillshade'] = hill_dem.paths['composed_hillshade']
+        result['layers'] = layers + hill_dem.result_layers()
+
+    except ProcessCanceledError as error:
+        result['error'] = str(error) or u"Canceled"
+        result['canceled'] = True
+
+    except Exception as error:
+        result['error'] = str(error) or error.__class__.__name__
+        result['traceback'] = traceback.format_exc()
+
+    return result
+
+def job_result_dir(out_path, base_name, reblend=False):
+    """Get the results folder of a file in out_path: a new <base_name>_r<N>
+    folder, created now so the next file with the same name gets another
+    one, or the last one to reblend its partial hillshades
+    """
+    dir_funs = files_and_dirs_funs.DirAndPaths()
+    if reblend:
+        result_dir = dir_funs.last_result_dir(out_path, base_name)
+        if result_dir is not None:
+            return result_dir
+        # Not created, the reblend job reports the missing results
+        return dir_funs.next_result_dir(out_path, base_name)
+
+    result_dir = dir_funs.next_result_dir(out_path, base_name)
+    dir_funs.create_dir(result_dir)
+
+    return result_dir
+
+def job_cache(job):
+    """Get the result_cache.ResultCache of a job, None if it does not use
+    the cache
+    """
+    if not job.get('cache_dir'):
+        return None
+
+    return result_cache.ResultCache(
+            job['cache_dir'], job.get('cache_hash', False),
+            job.get('cache_size', result_cache.DEFAULT_MAX_SIZE))
+
+def prune_caches(jobs):
+    """Remove the least recently used results of the caches of a batch of
+    jobs that are over their size limit (see result_cache.ResultCache.prune),
+    once when the whole batch is processed
+    """
+    cache_limits = {}
+    for job in jobs:
+        if job.get('cache_dir'):
+            cache_limits[job['cache_dir']] = job.get(
+                    'cache_size', result_cache.DEFAULT_MAX_SIZE)
+
+    for cache_dir, cache_size in cache_limits.items():
+        if os.path.isdir(cache_dir):
+            result_cache.ResultCache(cache_dir,
+                                     max_size=cache_size).prune()
+
+def _report_stage(stage_callback, stage):
+    """Report the start of a stage to the stage callback, if any
+    """
+    if stage_callback is not None:
+        stage_callback(stage)
+
+def _process_lidar(job, stage_callback=None, cache=None, cancel_check=None):
+    """Rasterize a LiDAR file and generate its hillshades
+    """
+    from . import laspy_utils
+
+    full_filename = job['input_file']
+    out_path = job['out_path']
+    partials = job['partials']
+    layers = []
+
+    if not os.path.exists(out_path):
+        os.makedirs(out_path)
+
+    dem_raster = dem_key = None
+    if cache is not None:
+        dem_key = cache.key('lidar_dem', cache.fingerprint(full_filename),
+                            job['pixel_size'], job['method'],
+                            job['terrain'], job['surfaces'])
+        dem_raster = cache.get_raster(dem_key)
+
+    _report_stage(stage_callback, hillshader_process.READ_STAGE)
+    laspy_lidar = lidar_results = None
+    if dem_raster is None or partials:
+        # With a cached DEM the file is only read to export the
+        # intermediate LAS file
+        laspy_lidar = laspy_utils.LiDAR(full_filename, out_path, partials,
+                                        job['terrain'], job['surfaces'],
+                                        job['streaming'])
+        lidar_results = laspy_lidar.process()
+
+    _report_stage(stage_callback, hillshader_process.RASTERIZE_STAGE)
+    if dem_raster is None:
+        laspy_rasterize = laspy_utils.RasterizeLiDAR(full_filename,
+                                                     lidar_results,
+                                                     out_path,
+                                                     job['terrain'],
+                                                     job['surfaces'],
+                                                     job['method'],
+                                                     job['pixel_size'])
+        # The DEM stays in memory, it is only written if the user asked for
+        # the intermediate results
+        dem_raster = laspy_rasterize.grid_2_raster(
+                laspy_rasterize.interpolate_grid(cancel_check))
+        if cache is not None:
+            cache.put_raster(dem_key, dem_raster)
+    del lidar_results
+    dem_full_path = laspy_utils.dem_output_path(full_filename, out_path,
+                                                job['terrain'],
+                                                job['surfaces'])
+
+    if partials:
+        files_and_dirs_funs.DirAndPaths().create_dir(
+                os.path.dirname(dem_full_path))
+        dem_raster.save(dem_full_path, output_profile=job['output_profile'])
+        dem_filename, _ = os.path.splitext(os.path.split(dem_full_path)[-1])
+        layers.append((dem_full_path, dem_filename))
+
+    hill_dem = hillshader_process.HillshaderDEM(dem_full_path,
+                                                dem_raster.array,
+                                                dem_raster.no_data_value,
+                                                partials,
+                                                job['load_composed'],
+                                                job['hill_params'],
+                                                out_path,
+                                                load_results=False,
+                                                output_profile=job[
+                                                        'output_profile'],
+                                                template=dem_raster,
+                                                stage_callback=stage_callback,
+                                                cache=cache,
+                                                cancel_check=cancel_check,
+                                                cache_key=dem_key)
+    if laspy_lidar is not None:
+        laspy_lidar.wait_las_file()
+
+    return hill_dem, layers
+
+def _process_dem(job, stage_callback=None, cache=None, cancel_check=None):
+    """Generate the hillshades of a DEM file
+    """
+    full_filename = job['input_file']
+    _report_stage(stage_callback, hillshader_process.READ_STAGE)
+
+    rows, cols = raster_funs.raster_shape(full_filename)
+    if job.get('neighbours'):
+        # Tile of a tile set: read with a halo from its neighbours (the
+        # halo changes the results, so they are not cached)
+        dem_raster, read_window, write_window = read_tile(job)
+        hill_dem = hillshader_process.HillshaderDEM(
+                full_filename, dem_raster.array, dem_raster.no_data_value,
+                job['partials'], job['load_composed'], job['hill_params'],
+                job['out_path'], load_results=False,
+                output_profile=job['output_profile'],
+                template=full_filename, stage_callback=stage_callback,
+                windows=(read_window, write_window),
+                cancel_check=cancel_check)
+        del dem_raster
+    elif rows * cols > hillshader_process.BLOCK_PROCESS_MIN_PIXELS:
+        # Large DEM: stream it in blocks instead of loading it (the cache
+        # is not used, the results are not held in memory)
+        hill_dem = hillshader_process.BlockHillshaderDEM(
+                full_filename, job['partials'], job['load_composed'],
+                job['hill_params'], job['out_path'], load_results=False,
+                output_profile=job['output_profile'],
+                stage_callback=stage_callback, cancel_check=cancel_check)
+    else:
+        # Mapped in memory when the format allows it, not copied
+        dem_raster = raster_funs.read_raster(full_filename)
+        dem_key = None
+        if cache is not None:
+            dem_key = cache.key('dem', cache.fingerprint(full_filename))
+        hill_dem = hillshader_process.HillshaderDEM(
+                full_filename, dem_raster.array, dem_raster.no_data_value,
+                job['partials'], job['load_composed'], job['hill_params'],
+                job['out_path'], load_results=False,
+                output_profile=job['output_profile'], template=dem_raster,
+                stage_callback=stage_callback, cache=cache,
+                cache_key=dem_key, cancel_check=cancel_check)
+        del dem_raster
+
+    return hill_dem, []
+
+def read_tile(job):
+    """Read the DEM tile of a job with a halo (the pixels the shading and
+    the no data erosion need around it) from its neighbour tiles.
+
+    Returns the raster_funs.read_with_halo results
+    """
+    halo = max(1, hillshader_process.erosion_radius(job['hill_params']))
+
+    return raster_funs.read_with_halo(job['input_file'], job['neighbours'],
+                                      halo, TILE_NO_DATA_VALUE)
+
+def _reblend(job, stage_callback=None, cancel_check=None):
+    """Blend again the partial hillshades saved by a previous process of a
+    file (the DEM itself, or the DEM rasterized from a LiDAR file, gives the
+    no data mask)
+    """
+    full_filename = job['input_file']
+    if not os.path.isdir(job['out_path']):
+        raise ValueError(u"Error: There are no previous results of {} to "
+                         u"reblend".format(os.path.basename(full_filename)))
+
+    if job['mode'] == LASPY_MODE:
+        from . import laspy_utils
+        dem_full_path = laspy_utils.dem_output_path(full_filename,
+                                                    job['out_path'],
+                                                    job['terrain'],
+                                                    job['surfaces'])
+        if not os.path.exists(dem_full_path):
+            raise ValueError(u"Error: DEM {} not found, the file must be "
+                             u"processed with the intermediate "
+                             u"files".format(dem_full_path))
+    else:
+        dem_full_path = full_filename
+
+    _report_stage(stage_callback, hillshader_process.READ_STAGE)
+    windows = None
+    if job.get('neighbours') and job['mode'] != LASPY_MODE:
+        # Same halo as when the tile was shaded, for the same no data mask
+        dem_raster, read_window, write_window = read_tile(job)
+        windows = (read_window, write_window)
+    else:
+        dem_raster = raster_funs.read_raster(dem_full_path)
+    hill_dem = hillshader_process.ReblendHillshaderDEM(
+            full_filename, dem_raster.array, dem_raster.no_data_value,
+            job['partials'], job['load_composed'], job['hill_params'],
+            job['out_path'], load_results=False,
+            output_profile=job['output_profile'], template=dem_full_path,
+            stage_callback=stage_callback, windows=windows,
+            cancel_check=cancel_check)
+    del dem_raster
+
+    return hill_dem, []
+
+def create_hill_params(azimuths, altitudes, transparencies,
+                       shading_method=hillshade.DEFAULT_SHADING_METHOD,
+                       gradient_kernel=hillshade.DEFAULT_GRADIENT_KERNEL,
+                       z_factor=None,
+                       shading_threads=hillshade.DEFAULT_SHADING_THREADS,
+                       fused_kernel=False):
+    """Create the hillshade params dictionary from the lists of azimuths,
+    altitudes (degrees) and transparencies (0 to 1) of the light exposures,
+    the shading method (see hillshade.SHADING_METHODS), the gradient kernel
+    (see hillshade.GRADIENT_KERNELS), the z factor (None to get it from
+    the DEM crs), the threads that shade each DEM and if the fused shading
+    and blend kernel is used (see fused_shading)
+    """
+    if not len(azimuths) == len(altitudes) == len(transparencies):
+        raise ValueError(u"Error: Every light exposure needs an azimuth, " +
+                         u"an altitude and a transparency")
+
+    hill_params = {}
+    for index, (azimuth, altitude, transparency) in enumerate(
+            zip(azimuths, altitudes, transparencies), 1):
+        hill_params['azimuth{}'.format(index)] = azimuth
+        hill_params['angle_altitude{}'.format(index)] = altitude
+        hill_params['transparency{}'.format(index)] = transparency
+    hill_params['shading_method'] = shading_method
+    hill_params['gradient_kernel'] = gradient_kernel
+    hill_params['z_factor'] = z_factor
+    hill_params['shading_threads'] = shading_threads
+    hill_params['fused_kernel'] = fused_kernel
+
+    return hill_params
+
+def hillshade_files(input_files, out_path, hill_params=None, workers=1,
+                    partials=False, pixel_size=2., method='nearest',
+                    surfaces=False, progress=None,
+                    output_profile=raster_funs.DEFAULT_OUTPUT_PROFILE,
+                    cache_dir=None, cache_hash=False, reblend=False,
+                    tile_set=False, cache_size=result_cache.DEFAULT_MAX_SIZE):
+    """Generate the composed hillshade of several DEM or LiDAR files.
+
+    This is the python entry point to run the plugin process without QGIS.
+    LiDAR files are detected by their extension (LIDAR_EXTENSIONS), each
+    file gets its own <name>_r<N> results folder inside out_path. With a
+    cache_dir the results of previous runs are reused (up to cache_size
+    bytes of them), with reblend the
+    partial hillshades of the last results folder of each file are blended
+    again (see create_job). With tile_set the DEM files are tiles of a
+    mosaic and each one is shaded with a halo from its neighbours, so there
+    are no seams (see dem_tile_neighbours). Returns the results of
+    run_batch.
+    """
+    if hill_params is None:
+        hill_params = DEFAULT_HILL_PARAMS
+
+    neighbours = {}
+    if tile_set:
+        neighbours = dem_tile_neighbours(input_files, hill_params)
+
+    jobs = []
+    for input_file in input_files:
+        base_name, ext = os.path.splitext(os.path.basename(input_file))
+        result_dir = job_result_dir(out_path, base_name, reblend)
+
+        if ext.lower() in LIDAR_EXTENSIONS:
+            jobs.append(create_job(input_file, result_dir, LASPY_MODE,
+                                   hill_params, partials, False,
+                                   pixel_size, method,
+                                   not surfaces, surfaces,
+                                   output_profile=output_profile,
+                                   cache_dir=cache_dir,
+                                   cache_hash=cache_hash,
+                                   cache_size=cache_size,
+                                   reblend=reblend))
+        else:
+            jobs.append(create_job(input_file, result_dir, DEM_MODE,
+                                   hill_params, partials, False,
+                                   output_profile=output_profile,
+                                   cache_dir=cache_dir,
+                                   cache_hash=cache_hash,
+                                   cache_size=cache_size,
+                                   reblend=reblend,
+                                   neighbours=neighbours.get(input_file)))
+
+    return run_batch(jobs, workers, progress)
+
+def dem_tile_neighbours(input_files, hill_params):
+    """Get a dictionary with the neighbour tiles of each DEM file of a tile
+    set (LiDAR files are left out), see tile_index.tile_neighbours
+    """
+    dem_files = [input_file for input_file in input_files
+                 if os.path.splitext(input_file)[1].lower()
+                 not in LIDAR_EXTENSIONS]
+    halo = max(1, hillshader_process.erosion_radius(hill_params))
+
+    return tile_index.tile_neighbours(dem_files, halo)
+
+def build_results_mosaic(results, out_path, threads=1):
+    """Build a virtual mosaic (VRT) of the composed hillshades of a batch
+    (the results of run_batch without errors) in out_path, to load them as a
+    single layer. The overviews of the composed hillshades are built in
+    threads (see raster_funs.build_mosaic). Returns the mosaic path, None if
+    there are no composed hillshades
+    """
+    composed_hillshades = [result['composed_hillshade']
+                           for result in results
+                           if not result['error'] and
+                           result['composed_hillshade']]
+    if not composed_hillshades:
+        return None
+
+    return raster_funs.build_mosaic(os.path.join(out_path, MOSAIC_FILENAME),
+                                    composed_hillshades, threads)
+
+def python_executable():
+    """Get the python interpreter used to start the worker processes.
+
+    Inside QGIS sys.executable is the QGIS binary, so the interpreter of the
+    QGIS python environment is searched instead
+    """
+    executable_name = os.path.basename(sys.executable).lower()
+    if executable_name.startswith('python'):
+        return sys.executable
+
+    for candidate in (os.path.join(sys.exec_prefix, 'pythonw.exe'),
+                      os.path.join(sys.exec_prefix, 'python.exe'),
+                      os.path.join(sys.exec_prefix, 'bin', 'python3')):
+        if os.path.exists(candidate):
+            return candidate
+
+    return sys.executable
+
+def pool_context():
+    """Get the multiprocessing context of the worker processes: spawn (no
+    fork of the QGIS process) with the interpreter of python_executable
+    """
+    context = multiprocessing.get_context('spawn')
+    context.set_executable(python_executable())
+
+    return context
+
+class ProcessPool(object):
+    """Pool of worker processes shared by several callers, i.e. the QGIS
+    tasks of a batch (one per file, see hillshader_task.HillshaderTask).
+
+    Each caller submits its job and waits for it in its own thread, the job
+    reports its stages and checks for cancel through a queue and an event of
+    a multiprocessing manager, so it can be followed and canceled as if it
+    ran in the caller thread.
+    """
+
+    def __init__(self, workers):
+        context = pool_context()
+        self.manager = context.Manager()
+        self.executor = futures.ProcessPoolExecutor(max_workers=workers,
+                                                    mp_context=context)
+
+    def submit(self, job):
+        """Start processing a job (see create_job) in a worker process,
+        returns its PooledJob
+        """
+        stage_queue = self.manager.Queue()
+        cancel_event = self.manager.Event()
+        future = self.executor.submit(_pooled_process_file, job,
+                                      stage_queue, cancel_event)
+
+        return PooledJob(job, future, stage_queue, cancel_event)
+
+    def shutdown(self):
+        """Stop the worker processes, once every job has finished
+        """
+        self.executor.shutdown()
+        self.manager.shutdown()
+
+class PooledJob(object):
+    """A job running in a ProcessPool
+    """
+
+    def __init__(self, job, future, stage_queue, cancel_event):
+        self.job = job
+        self.future = future
+        self.stage_queue = stage_queue
+        self.cancel_event = cancel_event
+
+    def cancel(self):
+        """Cancel the job: it is not started or it stops as when
+        process_file is canceled
+        """
+        self.future.cancel()
+        self.cancel_event.set()
+
+    def started_stages(self):
+        """Get the stages (see job_stages) started since the last call
+        """
+        stages = []
+        while True:
+            try:
+                stages.append(self.stage_queue.get_nowait())
+            except queue.Empty:
+                return stages
+
+    def result(self, timeout=None):
+        """Get the result of the job (see process_file), waiting up to
+        timeout seconds (futures.TimeoutError if it has not finished)
+        """
+        try:
+            return self.future.result(timeout)
+        except futures.CancelledError:
+            result = empty_result(self.job, u"Canceled")
+            result['canceled'] = True
+            return result
+        except futures.TimeoutError:
+            raise
+        except Exception as error:
+            # The worker died (i.e. out of memory)
+            return empty_result(self.job,
+                                str(error) or error.__class__.__name__)
+
+def _pooled_process_file(job, stage_queue, cancel_event):
+    """Run process_file in a worker process of a ProcessPool
+    """
+    def check_canceled():
+        if cancel_event.is_set():
+            raise ProcessCanceledError(u"Canceled")
+
+    def stage_started(stage):
+        check_canceled()
+        stage_queue.put(stage)
+
+    return process_file(job, stage_started, check_canceled)
+
+def run_batch(jobs, workers=1, progress=None):
+    """Process a list of jobs (see create_job) and return their results in
+    the same order.
+
+    With workers > 1 the files are processed in a pool of worker processes.
+    progress is called as progress(done, total, result) in the calling
+    thread each time a file finishes, an error in a file does not stop the
+    rest of the batch. The results caches are pruned at the end (see
+    prune_caches).
+    """
+    total = len(jobs)
+    results = [None] * total
+
+    if workers <= 1 or total <= 1:
+        for index, job in enumerate(jobs):
+            results[index] = process_file(job)
+            if progress is not None:
+                progress(index + 1, total, results[index])
+        prune_caches(jobs)
+        return results
+
+    with futures.ProcessPoolExecutor(max_workers=min(workers, total),
+                                     mp_context=pool_context()) as executor:
+        pending = {executor.submit(process_file, job): index
+                   for index, job in enumerate(jobs)}
+        for done, future in enumerate(futures.as_completed(pending), 1):
+            index = pending[future]
+            try:
+                results[index] = future.result()
+            except Exception as error:
+                # The worker died (i.e. out of memory)
+                results[index] = empty_result(
+                        jobs[index],
+                        str(error) or error.__class__.__name__)
+            if progress is not None:
+                progress(done, total, results[index])
+    prune_caches(jobs)
+
+    return results
@@ -1,2 +1,5 @@
 class LasPyNotFoundError(ModuleNotFoundError):
-    pass
\ No newline at end of file
+    pass
+
+class ProcessCanceledError(Exception):
+    pass
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ Batch_Hillshader
+                                 A QGIS plugin  to generate a three light
+                                 exposure hillshade (shaded relief by
+                                 combining three light exposures)
+
+    For more information, see the program documentation.
+
+    Plugin uses LASzip, see <https://laszip.org/>
+                              -------------------
+        begin                : 2016-07-13
+        git sha              : $Format:%H$
+        copyright            : (C) 2017 by PANOimagen S.L.
+        email                : info@panoimagen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software: you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation, either version 3 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ *   This program is distributed in the hope that it will be useful,       *
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+ *   GNU General Public License for more details.                          *
+ *                                                                         *
+ *   You should have received a copy of the GNU General Public License     *
+ *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
+ ***************************************************************************/
+"""
+
+import numpy as np
+from numpy import pi, sin, cos
+
+from . import hillshade as hill
+from . import bandCalc
+
+try:
+    import numba
+    HAS_NUMBA = True
+except ImportError:
+    # numba is optional, the NumPy row blocks kernel is used without it
+    numba = None
+    HAS_NUMBA = False
+
+# DEM rows shaded and blended at once by the NumPy kernel, small enough for
+# the work arrays of a block to stay in the CPU cache
+ROW_BLOCK_SIZE = 64
+
+# Gradient kernels of the compiled kernel, see hillshade.GRADIENT_KERNELS
+_KERNEL_CODES = {'numpy': 0, 'horn': 1, 'zevenbergen_thorne': 2}
+
+def light_vectors(exposures):
+    """Get the (sin(altitude), cos(altitude) * cos(azimuth),
+    cos(altitude) * sin(azimuth)) rows of the exposures, a list of
+    (azimuth, angle_altitude, transparency) tuples
+    """
+    vectors = np.empty((len(exposures), 3))
+    for index, (azimuth, altitude, _) in enumerate(exposures):
+        azimuthrad = azimuth * pi / 180.
+        altituderad = altitude * pi / 180.
+        vectors[index] = (sin(altituderad),
+                          cos(altituderad) * cos(azimuthrad),
+                          cos(altituderad) * sin(azimuthrad))
+
+    return vectors
+
+def shade_dem_fused(dem_array, exposures, valid=None, partials=False,
+                    dtype=hill.DEFAULT_DTYPE, spacing=(1., 1.), z_factor=1.,
+                    kernel=hill.DEFAULT_GRADIENT_KERNEL, use_numba=None,
+                    background_value=255):
+    """Shade a DEM with every exposure and blend them in a single pass.
+
+    The gradient, the shading of the exposures (normal vectors, see
+    hillshade.SurfaceNormals), the blend (see bandCalc.layer_weights) and
+    the masked uint8 quantisation are done for each pixel (compiled numba
+    kernel, if numba is installed and use_numba is not False) or for each
+    block of ROW_BLOCK_SIZE rows (NumPy kernel). valid is the boolean no
+    data mask (see raster_funs.ValidityMask), None if every pixel is valid.
+
+    Returns (partial_arrays, composed_array) as
+    hillshader_process.shade_dem, the results are the same within one gray
+    level.
+    """
+    if kernel not in _KERNEL_CODES:
+        raise ValueError(u"Error: Unknown gradient kernel " + str(kernel))
+    if use_numba is None:
+        use_numba = HAS_NUMBA
+    if use_numba and not HAS_NUMBA:
+        raise ValueError(u"Error: numba is not installed")
+
+    weights, offset = bandCalc.layer_weights(
+            [transparency for _, _, transparency in exposures],
+            background_value)
+    rows, cols = dem_array.shape
+    partial_arrays = np.zeros((len(exposures) if partials else 0, rows, cols),
+                              dtype=np.uint8)
+    composed_array = np.zeros((rows, cols), dtype=np.uint8)
+    if valid is None:
+        valid = np.ones((rows, cols), dtype=bool)
+
+    if use_numba:
+        rows_factor, cols_factor = hill.axis_z_factors(z_factor)
+        _numba_kernel(np.asarray(dem_array, dtype=np.float64),
+                      _KERNEL_CODES[kernel], rows_factor / spacing[0],
+                      cols_factor / spacing[1], light_vectors(exposures),
+                      np.asarray(weights, dtype=np.float64), offset, valid,
+                      partial_arrays, composed_array)
+    else:
+        _numpy_kernel(dem_array, exposures, weights, offset, valid,
+                      partial_arrays, composed_array, dtype, spacing,
+                      z_factor, kernel)
+
+    return (list(partial_arrays) if partials else None), composed_array
+
+def _numpy_kernel(dem_array, exposures, weights, offset, valid,
+                  partial_arrays, composed_array, dtype, spacing, z_factor,
+                  kernel):
+    """Shade and blend the DEM by blocks of ROW_BLOCK_SIZE rows, each block
+    read with a one row halo so the gradient is the same as for the whole
+    DEM
+    """
+    rows = dem_array.shape[0]
+    for start in range(0, rows, ROW_BLOCK_SIZE):
+        stop = min(start + ROW_BLOCK_SIZE, rows)
+        halo_start = max(start - 1, 0)
+        halo_stop = min(stop + 1, rows)
+        normals = hill.SurfaceNormals(dem_array[halo_start:halo_stop],
+                                      dtype, spacing, z_factor, kernel)
+        block = normals.band(start - halo_start, stop - halo_start)
+
+        blended = np.full(block.shape, offset, dtype=block.dtype)
+        partial = np.empty(block.shape, dtype=np.uint8)
+        # Weighted partial, without a temporary array per exposure
+        term = np.empty(block.shape, dtype=block.dtype)
+        for index, ((azimuth, altitude, _), weight) in enumerate(
+                zip(exposures, weights)):
+            hill.shade(block, azimuth, altitude, out=partial)
+            np.multiply(partial, weight, out=term)
+            blended += term
+            if len(partial_arrays):
+                np.copyto(partial_arrays[index, start:stop], partial,
+                          where=valid[start:stop])
+
+        np.copyto(composed_array[start:stop], blended, casting='unsafe',
+                  where=valid[start:stop])
+
+if HAS_NUMBA:
+
+    # Not cached on disk (cache=True): the plugin folder may be read only
+    # or replaced when the plugin is updated
+    @numba.njit(parallel=True)
+    def _numba_kernel(dem_array, kernel_code, row_factor, col_factor,
+                      lights, weights, offset, valid, partial_arrays,
+                      composed_array):
+        """Compiled fused kernel, see shade_dem_fused. Rows are processed in
+        parallel
+        """
+        rows, cols = dem_array.shape
+        for row in numba.prange(rows):
+            up = max(row - 1, 0)
+            down = min(row + 1, rows - 1)
+            for col in range(cols):
+                left = max(col - 1, 0)
+                right = min(col + 1, cols - 1)
+                if kernel_code == 1:
+                    # horn
+                    x = ((dem_array[down, left] + 2 * dem_array[down, col]
+                          + dem_array[down, right])
+                         - (dem_array[up, left] + 2 * dem_array[up, col]
+                            + dem_array[up, right])) / 8.
+                    y = ((dem_array[up, right] + 2 * dem_array[row, right]
+                          + dem_array[down, right])
+                         - (dem_array[up, left] + 2 * dem_array[row, left]
+                            + dem_array[down, left])) / 8.
+                elif kernel_code == 2 or (0 < row < rows - 1
+                                          and 0 < col < cols - 1):
+                    # zevenbergen_thorne, the same as numpy inside the DEM
+                    x = (dem_array[down, col] - dem_array[up, col]) / 2.
+                    y = (dem_array[row, right] - dem_array[row, left]) / 2.
+                else:
+                    # numpy at the borders: one sided differences
+                    x = ((dem_array[down, col] - dem_array[up, col])
+                         / max(down - up, 1))
+                    y = ((dem_array[row, right] - dem_array[row, left])
+                         / max(right - left, 1))
+                x *= row_factor
+                y *= col_factor
+                inverse_norm = 1. / np.sqrt(1. + x * x + y * y)
+
+                blended = offset
+                for index in range(lights.shape[0]):
+                    shaded = ((lights[index, 0] + lights[index, 1] * y
+                               - lights[index, 2] * x) * inverse_norm)
+                    level = (shaded + 1.) * 127.5
+                    if not level >= 0.:
+                        # no data (nan)
+                        level = 0.
+                    partial = np.uint8(level)
+                    blended += weights[index] * partial
+                    if partial_arrays.shape[0] and valid[row, col]:
+                        partial_arrays[index, row, col] = partial
+
+                if valid[row, col]:
+                    composed_array[row, col] = np.uint8(blended)
+
+else:
+    _numba_kernel = None
@@ -1,64 +1,369 @@
-# -*- coding: utf-8 -*-
-"""
-/***************************************************************************
- Batch_Hillshader
-                                 A QGIS plugin  to generate a three light 
-                                 exposure hillshade (shaded relief by 
-                                 combining three light exposures)
-  
-    For more information, see the program documentation.
-                                 
-    If you uses as input LiDAR data, note that plugin uses LASTools library.
-        See LASTools License at  <https://rapidlasso.com/lastools/>
-        
-    Plugin also use in LiDAR data mode FUSION LDV. 
-        See FUSION LDV License at <http://forsys.cfr.washington.edu/fusion.html>
-                              -------------------
-        begin                : 2016-07-13
-        git sha              : $Format:%H$
-        copyright            : (C) 2017 by PANOimagen S.L.
-        email                : info@panoimagen.com
- ***************************************************************************/
-
-/***************************************************************************
- *                                                                         *
- *   This program is free software: you can redistribute it and/or modify  *
- *   it under the terms of the GNU General Public License as published by  *
- *   the Free Software Foundation, either version 3 of the License, or     *
- *   (at your option) any later version.                                   *
- *                                                                         *
- *   This program is distributed in the hope that it will be useful,       * 
- *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
- *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
- *   GNU General Public License for more details.                          *
- *                                                                         *
- *   You should have received a copy of the GNU General Public License     *
- *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
- ***************************************************************************/
-"""
-
-import numpy as np
-from numpy import (gradient, pi, arctan, arctan2, sin, cos, sqrt)
-
-def hillshade(array, no_data_value, azimuth, angle_altitude):
-    '''Hillshade the input numpy array and return a uint8 array.
-
-    This function calculates the value of the hillshade array,
-    given an altitudes array, an azimuth and an altitude angle
-    https://github.com/rveciana/geoexamples/blob/master/python/shaded_relief/shaded_relief.py
-    '''
-
-    x, y = gradient(array)
-    slope = pi/2. - arctan(sqrt(x * x + y * y))
-    aspect = arctan2(-x, y)
-    azimuthrad = azimuth * pi / 180.
-    altituderad = angle_altitude * pi / 180.
-
-
-    shaded = (sin(altituderad) * sin(slope)
-                    + cos(altituderad) * cos(slope)
-                    * cos(azimuthrad - aspect))
-
-    hillshade_array = 255 * (shaded + 1) / 2
-
-    return hillshade_array.astype(dtype=np.uint8)
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ Batch_Hillshader
+                                 A QGIS plugin  to generate a three light 
+                                 exposure hillshade (shaded relief by 
+                                 combining three light exposures)
+  
+    For more information, see the program documentation.
+                                 
+    If you uses as input LiDAR data, note that plugin uses LASTools library.
+        See LASTools License at  <https://rapidlasso.com/lastools/>
+        
+    Plugin also use in LiDAR data mode FUSION LDV. 
+        See FUSION LDV License at <http://forsys.cfr.washington.edu/fusion.html>
+                              -------------------
+        begin                : 2016-07-13
+        git sha              : $Format:%H$
+        copyright            : (C) 2017 by PANOimagen S.L.
+        email                : info@panoimagen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software: you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation, either version 3 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ *   This program is distributed in the hope that it will be useful,       * 
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+ *   GNU General Public License for more details.                          *
+ *                                                                         *
+ *   You should have received a copy of the GNU General Public License     *
+ *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
+ ***************************************************************************/
+"""
+
+from concurrent import futures
+
+import numpy as np
+from numpy import (gradient, pi, arctan, arctan2, sin, cos, sqrt)
+
+# Floating point type of the shading computations. float32 is accurate
+# enough for a uint8 hillshade and halves the memory of the work arrays
+DEFAULT_DTYPE = np.float32
+
+# Threads that shade row bands of the DEM at the same time, see
+# shade_exposures
+DEFAULT_SHADING_THREADS = 1
+
+# 3x3 stencils that give the DEM derivatives, see gradients
+GRADIENT_KERNELS = ['numpy', 'horn', 'zevenbergen_thorne']
+DEFAULT_GRADIENT_KERNEL = 'numpy'
+
+def axis_z_factors(z_factor):
+    '''Get the (rows, cols) z factors from a z factor that is a number
+    (the same for both axes) or a (rows, cols) pair
+    '''
+    if np.ndim(z_factor) == 0:
+        return z_factor, z_factor
+
+    rows_factor, cols_factor = z_factor
+    return rows_factor, cols_factor
+
+def gradients(array, dtype=DEFAULT_DTYPE, spacing=(1., 1.), z_factor=1.,
+              kernel=DEFAULT_GRADIENT_KERNEL):
+    '''Get the (x, y) derivatives of a DEM array along its rows and cols.
+
+    spacing is the (rows, cols) pixel size and z_factor converts the
+    elevations to the pixel size units, a number or a (rows, cols) pair if
+    the units of the axes differ (see raster_funs.default_z_factor).
+    kernel is one of GRADIENT_KERNELS:
+    numpy: central differences, one sided at the borders (numpy.gradient)
+    horn: Horn weighted 3x3 differences
+    zevenbergen_thorne: central differences, border pixels repeated
+    '''
+    array = np.asarray(array, dtype=dtype)
+
+    if kernel == 'numpy':
+        x, y = gradient(array)
+        denominator = 1.
+    elif kernel in ('horn', 'zevenbergen_thorne'):
+        padded = np.pad(array, 1, mode='edge')
+        rows_difference = np.subtract(padded[2:], padded[:-2])
+        cols_difference = np.subtract(padded[:, 2:], padded[:, :-2])
+        if kernel == 'horn':
+            x = np.multiply(rows_difference[:, 1:-1], 2)
+            x += rows_difference[:, :-2]
+            x += rows_difference[:, 2:]
+            y = np.multiply(cols_difference[1:-1], 2)
+            y += cols_difference[:-2]
+            y += cols_difference[2:]
+            denominator = 8.
+        else:
+            x = rows_difference[:, 1:-1]
+            y = cols_difference[1:-1]
+            denominator = 2.
+    else:
+        raise ValueError(u"Error: Unknown gradient kernel " + str(kernel))
+
+    rows_factor, cols_factor = axis_z_factors(z_factor)
+    x *= rows_factor / (denominator * spacing[0])
+    y *= cols_factor / (denominator * spacing[1])
+
+    return x, y
+
+class TerrainDerivatives(object):
+    """Slope and aspect of a DEM array.
+
+    Only the light source changes between the exposures of a multiple
+    hillshade, so the derivatives (and their sines and cosines) are
+    computed once per DEM and shared by every exposure. Every array is
+    computed in place, with dtype precision, and only the sines and cosines
+    are kept: the slope and aspect arrays become the work buffers of shade.
+    spacing, z_factor and kernel set how the derivatives are computed, see
+    gradients.
+    """
+
+    # Arrays shaped as the DEM, see band
+    ARRAYS = ('sin_slope', 'cos_slope', 'sin_aspect', 'cos_aspect')
+
+    def __init__(self, array, dtype=DEFAULT_DTYPE, spacing=(1., 1.),
+                 z_factor=1., kernel=DEFAULT_GRADIENT_KERNEL):
+        """Compute the slope, the aspect and their sin/cos arrays
+        """
+        self.dtype = np.dtype(dtype)
+        x, y = gradients(array, self.dtype, spacing, z_factor, kernel)
+
+        slope = np.multiply(x, x)
+        aspect = np.multiply(y, y)
+        slope += aspect
+        sqrt(slope, out=slope)
+        arctan(slope, out=slope)
+        np.subtract(pi/2., slope, out=slope)
+
+        np.negative(x, out=x)
+        arctan2(x, y, out=aspect)
+
+        # x and y are reused as the slope sin/cos buffers
+        self.sin_slope = sin(slope, out=x)
+        self.cos_slope = cos(slope, out=y)
+        self.sin_aspect = sin(aspect)
+        self.cos_aspect = cos(aspect)
+
+        # Not needed any more, reused as the work buffers
+        self._work = (slope, aspect)
+
+    @property
+    def shape(self):
+        """Shape of the DEM array
+        """
+        return getattr(self, self.ARRAYS[0]).shape
+
+    def band(self, start, stop):
+        """Get the derivatives of the DEM rows start:stop. The arrays are
+        views of these ones (no copy), the work buffers too if they are
+        already allocated, so bands of different rows can be shaded at the
+        same time
+        """
+        band = object.__new__(type(self))
+        band.dtype = self.dtype
+        for name in self.ARRAYS:
+            setattr(band, name, getattr(self, name)[start:stop])
+        band._work = None
+        if self._work is not None:
+            band._work = tuple(work[start:stop] for work in self._work)
+
+        return band
+
+    def work_buffers(self):
+        """Get the pair of work arrays used by shade, allocated once (if
+        they are not reused from the derivatives computation)
+        """
+        if self._work is None:
+            self._work = (np.empty(self.shape, dtype=self.dtype),
+                          np.empty(self.shape, dtype=self.dtype))
+
+        return self._work
+
+    def illuminate(self, azimuthrad, altituderad, work):
+        """Compute the cosine of the light incidence angle into work[0]
+        """
+        shaded, term = work
+
+        np.multiply(self.cos_aspect, cos(azimuthrad), out=shaded)
+        shaded += np.multiply(self.sin_aspect, sin(azimuthrad), out=term)
+        shaded *= self.cos_slope
+        shaded *= cos(altituderad)
+        shaded += np.multiply(self.sin_slope, sin(altituderad), out=term)
+
+        return shaded
+
+class SurfaceNormals(TerrainDerivatives):
+    """Surface normal vectors of a DEM array.
+
+    Trigonometry free alternative to TerrainDerivatives: the light incidence
+    is the dot product of the normal (-x, -y, 1) / sqrt(1 + x**2 + y**2)
+    and the light vector, that only needs a sqrt per pixel, computed once.
+    Results are the same as with TerrainDerivatives.
+    """
+
+    ARRAYS = ('x', 'y', 'inverse_norm')
+
+    def __init__(self, array, dtype=DEFAULT_DTYPE, spacing=(1., 1.),
+                 z_factor=1., kernel=DEFAULT_GRADIENT_KERNEL):
+        """Compute the gradients and the inverse norm of the normal vectors
+        """
+        self.dtype = np.dtype(dtype)
+        self.x, self.y = gradients(array, self.dtype, spacing, z_factor,
+                                   kernel)
+
+        self.inverse_norm = np.multiply(self.x, self.x)
+        self.inverse_norm += self.y * self.y
+        self.inverse_norm += 1
+        sqrt(self.inverse_norm, out=self.inverse_norm)
+        np.divide(1, self.inverse_norm, out=self.inverse_norm)
+
+        self._work = None
+
+    def illuminate(self, azimuthrad, altituderad, work):
+        """Compute the cosine of the light incidence angle into work[0]
+        """
+        shaded, term = work
+
+        np.multiply(self.y, cos(azimuthrad), out=shaded)
+        shaded -= np.multiply(self.x, sin(azimuthrad), out=term)
+        shaded *= cos(altituderad)
+        shaded += sin(altituderad)
+        shaded *= self.inverse_norm
+
+        return shaded
+
+# Shading engines, see terrain_derivatives
+SHADING_METHODS = {'trigonometric': TerrainDerivatives,
+                   'normal': SurfaceNormals}
+DEFAULT_SHADING_METHOD = 'trigonometric'
+
+def terrain_derivatives(array, dtype=DEFAULT_DTYPE,
+                        method=DEFAULT_SHADING_METHOD, spacing=(1., 1.),
+                        z_factor=1., kernel=DEFAULT_GRADIENT_KERNEL):
+    '''Get the derivatives of a DEM array used by shade with the given
+    shading method (a SHADING_METHODS key). See gradients for spacing,
+    z_factor and kernel
+    '''
+    try:
+        derivatives_class = SHADING_METHODS[method]
+    except KeyError:
+        raise ValueError(u"Error: Unknown shading method " + str(method))
+
+    return derivatives_class(array, dtype, spacing, z_factor, kernel)
+
+def shade(derivatives, azimuth, angle_altitude, out=None, work=None):
+    '''Shade precomputed terrain derivatives and return a uint8 array.
+
+    derivatives is a TerrainDerivatives or a SurfaceNormals. cos(azimuth -
+    aspect) is expanded so no transcendental function is evaluated over the
+    array, only over the light source angles. The result is computed in the
+    work arrays (a pair of arrays shaped as the DEM,
+    derivatives.work_buffers() by default) and quantised into out, a new
+    uint8 array if None.
+    '''
+    azimuthrad = azimuth * pi / 180.
+    altituderad = angle_altitude * pi / 180.
+    if work is None:
+        work = derivatives.work_buffers()
+    shaded = derivatives.illuminate(azimuthrad, altituderad, work)
+
+    # 255 * (shaded + 1) / 2
+    shaded += 1
+    shaded *= 127.5
+
+    if out is None:
+        out = np.empty(shaded.shape, dtype=np.uint8)
+    np.copyto(out, shaded, casting='unsafe')
+
+    return out
+
+def row_bands(rows, bands):
+    '''Split rows in (start, stop) bands of about the same height
+    '''
+    bands = max(1, min(bands, rows))
+    limits = [rows * index // bands for index in range(bands + 1)]
+
+    return list(zip(limits[:-1], limits[1:]))
+
+def shade_exposures(derivatives, exposures, threads=DEFAULT_SHADING_THREADS):
+    '''Shade the terrain derivatives with several light exposures.
+
+    exposures is a list of (azimuth, angle_altitude) tuples, the result is
+    a list of uint8 arrays in the same order. With several threads the DEM
+    is split in row bands shaded at the same time (NumPy releases the GIL),
+    each band reads views of the derivatives and writes into its rows of the
+    results.
+    '''
+    if threads <= 1:
+        return [shade(derivatives, azimuth, angle_altitude)
+                for azimuth, angle_altitude in exposures]
+
+    hillshade_arrays = [np.empty(derivatives.shape, dtype=np.uint8)
+                        for _ in exposures]
+
+    def shade_band(start, stop):
+        band = derivatives.band(start, stop)
+        for hillshade_array, (azimuth, angle_altitude) in zip(
+                hillshade_arrays, exposures):
+            shade(band, azimuth, angle_altitude,
+                  out=hillshade_array[start:stop])
+
+    with futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        for band_future in [executor.submit(shade_band, start, stop)
+                            for start, stop in row_bands(
+                                    derivatives.shape[0], threads)]:
+            band_future.result()
+
+    return hillshade_arrays
+
+def shade_dem_exposures(array, exposures, threads=DEFAULT_SHADING_THREADS,
+                        dtype=DEFAULT_DTYPE, method=DEFAULT_SHADING_METHOD,
+                        spacing=(1., 1.), z_factor=1.,
+                        kernel=DEFAULT_GRADIENT_KERNEL):
+    '''Shade a DEM array with several light exposures, computing the
+    terrain derivatives in the threads.
+
+    As shade_exposures, but each thread computes the derivatives of its own
+    row band, read with a one row halo so they are the same as for the
+    whole DEM, instead of computing them for the whole DEM before the
+    threads start. See terrain_derivatives for the other arguments.
+    '''
+    rows = array.shape[0]
+    hillshade_arrays = [np.empty(array.shape, dtype=np.uint8)
+                        for _ in exposures]
+
+    def shade_band(start, stop):
+        halo_start = max(start - 1, 0)
+        halo_stop = min(stop + 1, rows)
+        band = terrain_derivatives(array[halo_start:halo_stop], dtype,
+                                   method, spacing, z_factor, kernel).band(
+                                           start - halo_start,
+                                           stop - halo_start)
+        for hillshade_array, (azimuth, angle_altitude) in zip(
+                hillshade_arrays, exposures):
+            shade(band, azimuth, angle_altitude,
+                  out=hillshade_array[start:stop])
+
+    with futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        for band_future in [executor.submit(shade_band, start, stop)
+                            for start, stop in row_bands(rows, threads)]:
+            band_future.result()
+
+    return hillshade_arrays
+
+def hillshade(array, no_data_value, azimuth, angle_altitude,
+              dtype=DEFAULT_DTYPE, method=DEFAULT_SHADING_METHOD,
+              spacing=(1., 1.), z_factor=1., kernel=DEFAULT_GRADIENT_KERNEL):
+    '''Hillshade the input numpy array and return a uint8 array.
+
+    This function calculates the value of the hillshade array,
+    given an altitudes array, an azimuth and an altitude angle
+    https://github.com/rveciana/geoexamples/blob/master/python/shaded_relief/shaded_relief.py
+    dtype is the precision of the computations (float32 by default) and
+    method the shading engine (see SHADING_METHODS). spacing is the
+    (rows, cols) pixel size, z_factor the elevations to pixel size units
+    factor and kernel the derivatives stencil (see GRADIENT_KERNELS)
+    '''
+    return shade(terrain_derivatives(array, dtype, method, spacing,
+                                     z_factor, kernel),
+                 azimuth, angle_altitude)
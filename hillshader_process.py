@@ -1,245 +1,661 @@
-# -*- coding: utf-8 -*-
-"""
-/***************************************************************************
- Batch_Hillshader
-                                 A QGIS plugin  to generate a three light 
-                                 exposure hillshade (shaded relief by 
-                                 combining three light exposures)
-  
-    For more information, see the program documentation.
-                                 
-    If you uses as input LiDAR data, note that plugin uses LASTools library.
-        See LASTools License at  <https://rapidlasso.com/lastools/>
-        
-    Plugin also use in LiDAR data mode FUSION LDV. 
-        See FUSION LDV License at <http://forsys.cfr.washington.edu/fusion.html>
-                              -------------------
-        begin                : 2016-07-13
-        git sha              : $Format:%H$
-        copyright            : (C) 2017 by PANOimagen S.L.
-        email                : info@panoimagen.com
- ***************************************************************************/
-
-/***************************************************************************
- *                                                                         *
- *   This program is free software: you can redistribute it and/or modify  *
- *   it under the terms of the GNU General Public License as published by  *
- *   the Free Software Foundation, either version 3 of the License, or     *
- *   (at your option) any later version.                                   *
- *                                                                         *
- *   This program is distributed in the hope that it will be useful,       * 
- *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
- *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
- *   GNU General Public License for more details.                          *
- *                                                                         *
- *   You should have received a copy of the GNU General Public License     *
- *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
- ***************************************************************************/
-"""
-
-import os
-
-from . import hillshade as hill
-from . import bandCalc
-from .plugin_utils import raster_funs
-from .plugin_utils import files_and_dirs_funs
-
-class LiDAR2DEM(object):
-
-    def __init__(self, input_filename, out_path,
-                 partials_create_and_load, size_dem, catalog_params=None):
-        """Function to start class variables and launch the process
-        """
-
-        self.input_file_full_path = input_filename
-        self.out_path = out_path
-        self.catalog_params = catalog_params
-        self.partials_create_and_load = partials_create_and_load
-        self.size_dem = size_dem
-
-        self.init_paths()
-        self.process()
-
-    def init_paths(self):
-        """Function to init the output directory and the results full paths.
-            Also launch the folder creation
-        """
-        self.path, self.file_name = os.path.split(self.input_file_full_path)
-
-        self.file_funs = files_and_dirs_funs.DirAndPaths()
-        self.input_base_name, self.input_ext = \
-                self.file_funs.init(self.file_name)
-
-        self.file_templates = self.file_funs.file_templates(
-                self.input_base_name)
-
-        self.temp_dirs, self.temp_paths = \
-                        self.file_funs.set_temp_dir()
-
-        self.out_dirs, self.out_paths = \
-                        self.file_funs.set_output_dir(
-                                self.out_path)
-
-        dirs = []
-
-        if self.partials_create_and_load:
-            self.paths = {'las': self.out_paths['las'],
-                          'dem': self.out_paths['dem']}
-            dirs.append(self.out_dirs['las'])
-            dirs.append(self.out_dirs['dem'])
-        else:
-            self.paths = {'las': self.temp_paths['las'],
-                          'dem': self.temp_paths['dem']}
-            dirs.append(self.temp_dirs['temp_dir'])
-            dirs.append(self.temp_dirs['temp_dir'])
-
-        if not self.catalog_params is None:
-            self.paths['catalog'] = self.out_paths['catalog']
-            self.paths['las_ground'] = self.out_paths['las_ground']
-            dirs.append(self.out_dirs['catalog'])
-            dirs.append(self.out_dirs['las_ground'])
-
-        for v in dirs:
-            self.file_funs.create_dir(v)
-
-    def process(self):
-        """This function runs the LiDAR processing
-        """
-
-        if  self.input_ext.lower() == '.laz':
-            self.las_full_path = self.paths['las']
-            lidar_funs.laz2las(self.input_file_full_path, self.las_full_path)
-        else:
-            self.las_full_path = self.input_file_full_path
-
-        if self.catalog_params is not None:
-            lidar_funs.filter_las_ground_points(
-                self.las_full_path, self.paths['las_ground'])
-            lidar_funs.create_catalog(self.paths['las_ground'],
-                               self.catalog_params,
-                               self.paths['catalog'])
-
-        lidar_funs.create_dem(
-            self.las_full_path, self.paths['dem'], self.size_dem)
-
-class HillshaderDEM(object):
-
-    def __init__(self, full_filename, dem_array, no_data_value,
-                 partialsCreateAndLoad, sombrasOutResults, hill_params,
-                 out_path):
-        """Function to start class variables and launch the process
-        """
-
-        self.path, self.file_name = os.path.split(full_filename)
-        
-        self.file_funs = files_and_dirs_funs.DirAndPaths()
-        self.out_path = out_path
-        self.input_base_name, _, = \
-                self.file_funs.init(self.file_name)
-        
-        if not os.path.exists(self.out_path):
-            os.makedirs(self.out_path)
-
-        self.dem_full_path = full_filename
-        self.hill_params = hill_params
-        self.partials_create_and_load = partialsCreateAndLoad
-        self.sombras_out = sombrasOutResults
-
-        self.init_paths()
-        self.process(dem_array, no_data_value)
-
-    def init_paths(self):
-        """Function to init the output directory and the results full paths.
-        """
-        self.file_templates = self.file_funs.file_templates(
-                self.input_base_name)
-
-        self.temp_dirs, self.temp_paths = \
-                        self.file_funs.set_temp_dir()
-
-        self.out_dirs, self.out_paths = \
-                        self.file_funs.set_output_dir(self.out_path)
-
-        self.paths = {}
-        self.dirs = {}
-        self.paths['composed_hillshade'] = self.out_paths['composed_hillshade']
-        self.dirs['composed_hillshade'] = self.out_dirs['composed_hillshade']
-        self.file_funs.create_dir(self.dirs['composed_hillshade'])
-        if self.partials_create_and_load:
-            self.paths['simple_hillshade'] = self.out_paths['simple_hillshade']
-            self.dirs['simple_hillshade'] = self.out_dirs['simple_hillshade']
-            self.file_funs.create_dir(self.dirs['simple_hillshade'])
-
-    def process(self, dem_array, no_data_value):
-        """This function works with the partial hillshades and generates the
-        composed hillshade
-        """
-        hillshade_1_array = hill.hillshade(dem_array, no_data_value,
-                                           self.hill_params['azimuth1'],
-                                           self.hill_params['angle_altitude1'])
-        hillshade_2_array = hill.hillshade(dem_array, no_data_value,
-                                           self.hill_params['azimuth2'],
-                                           self.hill_params['angle_altitude2'])
-        hillshade_3_array = hill.hillshade(dem_array, no_data_value,
-                                           self.hill_params['azimuth3'],
-                                           self.hill_params['angle_altitude3'])
-
-        if self.partials_create_and_load:
-            eroded_1 = raster_funs.raster_erosion(
-                    hillshade_1_array, dem_array, no_data_value)
-            hillshade1, hillshade1_filename = self.save_raster(
-                    eroded_1,
-                    self.hill_params['azimuth1'],
-                    self.hill_params['angle_altitude1'])
-
-            eroded_2 = raster_funs.raster_erosion(
-                    hillshade_2_array, dem_array, no_data_value)
-            hillshade2, hillshade2_filename = self.save_raster(
-                    eroded_2,
-                    self.hill_params['azimuth2'],
-                    self.hill_params['angle_altitude2'])
-            
-            eroded_3 = raster_funs.raster_erosion(
-                    hillshade_3_array, dem_array, no_data_value)
-            hillshade3, hillshade3_filename = self.save_raster(
-                    eroded_3,
-                    self.hill_params['azimuth3'],
-                    self.hill_params['angle_altitude3'])
-
-            self.partial_hills_dic = {hillshade1_filename: hillshade1,
-                                      hillshade2_filename: hillshade2,
-                                      hillshade3_filename: hillshade3}
-
-            for k, v in self.partial_hills_dic.items():
-                raster_funs.load_raster_layer(v, k)
-
-        three_exp_array = bandCalc.merge_arrays(
-                [hillshade_1_array, hillshade_2_array, hillshade_3_array],
-                [self.hill_params['transparency1'],
-                 self.hill_params['transparency2'],
-                 self.hill_params['transparency3']],
-                 dem_array, no_data_value)
-
-        fn_hillshade_filename = \
-            self.file_templates['composed_hillshade'].format(
-                    self.input_base_name)
-        raster_funs.array_2_raster(three_exp_array,
-                                   self.dem_full_path,
-                                   self.paths['composed_hillshade'])
-        if self.sombras_out:
-            raster_funs.load_raster_layer(
-                    self.paths['composed_hillshade'], fn_hillshade_filename)
-
-    def save_raster(self, hillshade_array, azimuth, altitude):
-        """This function save the arrays of the partial hillshades
-        """
-        hillshade_filename = self.file_templates['simple_hillshade'].format(
-                self.input_base_name, azimuth, altitude)
-
-        hillshade_path = os.path.join(self.dirs['simple_hillshade'],
-                                      hillshade_filename)
-        raster_funs.array_2_raster(hillshade_array,
-                                   self.dem_full_path,
-                                   hillshade_path)
-
-        return hillshade_path, hillshade_filename
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ Batch_Hillshader
+                                 A QGIS plugin  to generate a three light 
+                                 exposure hillshade (shaded relief by 
+                                 combining three light exposures)
+  
+    For more information, see the program documentation.
+                                 
+    If you uses as input LiDAR data, note that plugin uses LASTools library.
+        See LASTools License at  <https://rapidlasso.com/lastools/>
+        
+    Plugin also use in LiDAR data mode FUSION LDV. 
+        See FUSION LDV License at <http://forsys.cfr.washington.edu/fusion.html>
+                              -------------------
+        begin                : 2016-07-13
+        git sha              : $Format:%H$
+        copyright            : (C) 2017 by PANOimagen S.L.
+        email                : info@panoimagen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software: you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation, either version 3 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ *   This program is distributed in the hope that it will be useful,       * 
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+ *   GNU General Public License for more details.                          *
+ *                                                                         *
+ *   You should have received a copy of the GNU General Public License     *
+ *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
+ ***************************************************************************/
+"""
+
+import os
+
+from . import hillshade as hill
+from . import bandCalc
+from . import fused_shading
+from .plugin_utils import raster_funs
+from .plugin_utils import files_and_dirs_funs
+
+# Block side (pixels) used when the DEM is streamed from disk
+BLOCK_SIZE = 1024
+# DEMs with more pixels than this are streamed in blocks
+BLOCK_PROCESS_MIN_PIXELS = 8192 * 8192
+
+# Process stages reported to the stage callbacks
+READ_STAGE = 'read'
+RASTERIZE_STAGE = 'rasterize'
+SHADE_STAGE = 'shade'
+WRITE_STAGE = 'write'
+
+def light_exposures(hill_params):
+    """Get the light exposures defined in the hillshade params dictionary.
+
+    Returns a list of (azimuth, angle_altitude, transparency) tuples, one for
+    each azimuthN/angle_altitudeN/transparencyN group of keys
+    """
+    exposures = []
+    index = 1
+    while 'azimuth{}'.format(index) in hill_params:
+        exposures.append(
+                (hill_params['azimuth{}'.format(index)],
+                 hill_params['angle_altitude{}'.format(index)],
+                 hill_params['transparency{}'.format(index)]))
+        index += 1
+
+    return exposures
+
+def shading_options(hill_params, geotransform=None, projection=None,
+                    rows=0):
+    """Get the hillshade.terrain_derivatives keyword arguments for a DEM.
+
+    The shading method ('shading_method'), the gradient kernel
+    ('gradient_kernel') and the z factor ('z_factor') are taken from the
+    hillshade params dictionary, the defaults are used if they are not set
+    (the default (rows, cols) z factors depend on the DEM crs, see
+    raster_funs.default_z_factor). The pixel spacing is taken from the DEM
+    geotransform, rows is the DEM height
+    """
+    options = {'method': hill_params.get('shading_method',
+                                         hill.DEFAULT_SHADING_METHOD),
+               'kernel': hill_params.get('gradient_kernel',
+                                         hill.DEFAULT_GRADIENT_KERNEL)}
+    z_factor = hill_params.get('z_factor')
+    if geotransform is not None:
+        options['spacing'] = raster_funs.pixel_spacing(geotransform)
+        if z_factor is None:
+            z_factor = raster_funs.default_z_factor(geotransform, projection,
+                                                    rows)
+    if z_factor is not None:
+        options['z_factor'] = z_factor
+
+    return options
+
+def erosion_radius(hill_params):
+    """Get the pixels eroded around the no data areas ('erosion_radius' of
+    the hillshade params dictionary)
+    """
+    return hill_params.get('erosion_radius',
+                           raster_funs.DEFAULT_EROSION_RADIUS)
+
+def shading_threads(hill_params):
+    """Get the threads that shade each DEM ('shading_threads' of the
+    hillshade params dictionary)
+    """
+    return hill_params.get('shading_threads', hill.DEFAULT_SHADING_THREADS)
+
+def fused_kernel(hill_params):
+    """Check if the fused shading and blend kernel is asked for
+    ('fused_kernel' of the hillshade params dictionary)
+    """
+    return hill_params.get('fused_kernel', False)
+
+def shade_dem(dem_array, no_data_value, exposures, partials=False,
+              shading=None, erosion_radius=raster_funs.DEFAULT_EROSION_RADIUS,
+              on_partial=None, threads=hill.DEFAULT_SHADING_THREADS,
+              fused=False):
+    """Shade a DEM array with every light exposure and blend the results.
+
+    Returns (partial_arrays, composed_array). partial_arrays are the eroded
+    partial hillshades, in the exposures order, or None if partials is False.
+    shading are the hillshade.terrain_derivatives keyword arguments (see
+    shading_options). The no data mask is computed once and shared by the
+    partial and the composed hillshades. If partials is True, on_partial is
+    called with (index, eroded partial array) as soon as each partial is
+    ready, e.g. to write it while the next exposure is shaded. With several
+    threads the terrain derivatives and the exposures are computed in
+    parallel row bands (see hillshade.shade_dem_exposures). If fused is True
+    the shading and the blend are done in a single pass (see
+    fused_shading.shade_dem_fused, it always uses the normal vectors engine)
+    """
+    mask = raster_funs.ValidityMask(dem_array, no_data_value, erosion_radius)
+    if fused:
+        fused_options = dict(shading or {})
+        fused_options.pop('method', None)
+        partial_arrays, composed_array = fused_shading.shade_dem_fused(
+                dem_array, exposures, mask.array(), partials,
+                **fused_options)
+        if on_partial is not None:
+            for index, partial_array in enumerate(partial_arrays or []):
+                on_partial(index, partial_array)
+        return partial_arrays, composed_array
+
+    if threads > 1:
+        shaded_arrays = hill.shade_dem_exposures(
+                dem_array, [(azimuth, altitude)
+                            for azimuth, altitude, _ in exposures], threads,
+                **(shading or {}))
+    else:
+        # One by one, each partial is ready before the next is shaded
+        derivatives = hill.terrain_derivatives(dem_array, **(shading or {}))
+        shaded_arrays = (hill.shade(derivatives, azimuth, altitude)
+                         for azimuth, altitude, _ in exposures)
+
+    hillshade_arrays = []
+    for index, hillshade_array in enumerate(shaded_arrays):
+        if partials:
+            # Eroded in place: the composed hillshade is masked the same way
+            mask.apply(hillshade_array, out=hillshade_array)
+            if on_partial is not None:
+                on_partial(index, hillshade_array)
+        hillshade_arrays.append(hillshade_array)
+    del shaded_arrays
+
+    partial_arrays = hillshade_arrays if partials else None
+
+    composed_array = bandCalc.merge_arrays(
+            hillshade_arrays,
+            [transparency for _, _, transparency in exposures],
+            dem_array, no_data_value, mask=mask)
+
+    return partial_arrays, composed_array
+
+class LiDAR2DEM(object):
+
+    def __init__(self, input_filename, out_path,
+                 partials_create_and_load, size_dem, catalog_params=None):
+        """Function to start class variables and launch the process
+        """
+
+        self.input_file_full_path = input_filename
+        self.out_path = out_path
+        self.catalog_params = catalog_params
+        self.partials_create_and_load = partials_create_and_load
+        self.size_dem = size_dem
+
+        self.init_paths()
+        self.process()
+
+    def init_paths(self):
+        """Function to init the output directory and the results full paths.
+            Also launch the folder creation
+        """
+        self.path, self.file_name = os.path.split(self.input_file_full_path)
+
+        self.file_funs = files_and_dirs_funs.DirAndPaths()
+        self.input_base_name, self.input_ext = \
+                self.file_funs.init(self.file_name)
+
+        self.file_templates = self.file_funs.file_templates(
+                self.input_base_name)
+
+        self.temp_dirs, self.temp_paths = \
+                        self.file_funs.set_temp_dir()
+
+        self.out_dirs, self.out_paths = \
+                        self.file_funs.set_output_dir(
+                                self.out_path)
+
+        dirs = []
+
+        if self.partials_create_and_load:
+            self.paths = {'las': self.out_paths['las'],
+                          'dem': self.out_paths['dem']}
+            dirs.append(self.out_dirs['las'])
+            dirs.append(self.out_dirs['dem'])
+        else:
+            self.paths = {'las': self.temp_paths['las'],
+                          'dem': self.temp_paths['dem']}
+            dirs.append(self.temp_dirs['temp_dir'])
+            dirs.append(self.temp_dirs['temp_dir'])
+
+        if not self.catalog_params is None:
+            self.paths['catalog'] = self.out_paths['catalog']
+            self.paths['las_ground'] = self.out_paths['las_ground']
+            dirs.append(self.out_dirs['catalog'])
+            dirs.append(self.out_dirs['las_ground'])
+
+        for v in dirs:
+            self.file_funs.create_dir(v)
+
+    def process(self):
+        """This function runs the LiDAR processing
+        """
+
+        if  self.input_ext.lower() == '.laz':
+            self.las_full_path = self.paths['las']
+            lidar_funs.laz2las(self.input_file_full_path, self.las_full_path)
+        else:
+            self.las_full_path = self.input_file_full_path
+
+        if self.catalog_params is not None:
+            lidar_funs.filter_las_ground_points(
+                self.las_full_path, self.paths['las_ground'])
+            lidar_funs.create_catalog(self.paths['las_ground'],
+                               self.catalog_params,
+                               self.paths['catalog'])
+
+        lidar_funs.create_dem(
+            self.las_full_path, self.paths['dem'], self.size_dem)
+
+class HillshaderDEM(object):
+
+    def __init__(self, full_filename, dem_array, no_data_value,
+                 partialsCreateAndLoad, sombrasOutResults, hill_params,
+                 out_path, load_results=True,
+                 output_profile=raster_funs.DEFAULT_OUTPUT_PROFILE,
+                 template=None, stage_callback=None, cache=None,
+                 cache_key=None, windows=None, cancel_check=None):
+        """Function to start class variables and launch the process.
+
+        If load_results is False the results are not loaded into canvas,
+        see result_layers. output_profile sets the creation options of the
+        hillshade rasters (see raster_funs.OUTPUT_PROFILES). template gives
+        the georeference of the results, a raster path, a
+        raster_funs.RasterData or a raster_funs.GeoProfile, and defaults to
+        full_filename (that then must exist on disk). stage_callback is
+        called with SHADE_STAGE and WRITE_STAGE when they start, it can
+        stop the process raising an exception. cache is a
+        result_cache.ResultCache where the partial and the composed
+        hillshades are looked for and stored, cache_key identifies the DEM
+        in it. windows are (read_window, write_window) if dem_array has a
+        halo around the results area (see raster_funs.read_with_halo), the
+        results are cropped to write_window and template must give their
+        georeference. cancel_check is called inside the long loops (i.e.
+        each DEM block), it stops the process raising
+        bh_errors.ProcessCanceledError
+        """
+
+        self.path, self.file_name = os.path.split(full_filename)
+        
+        self.file_funs = files_and_dirs_funs.DirAndPaths()
+        self.out_path = out_path
+        self.input_base_name, _, = \
+                self.file_funs.init(self.file_name)
+        
+        if not os.path.exists(self.out_path):
+            os.makedirs(self.out_path)
+
+        self.dem_full_path = full_filename
+        self.template = template or full_filename
+        # Resolved once, for the shading and for every written raster
+        self.geo_profile = raster_funs.get_georeference(self.template)
+        self.hill_params = hill_params
+        self.partials_create_and_load = partialsCreateAndLoad
+        self.sombras_out = sombrasOutResults
+        self.load_results = load_results
+        self.output_profile = output_profile
+        self.stage_callback = stage_callback
+        self.cache = cache
+        self.cache_key = cache_key
+        self.windows = windows
+        self.cancel_check = cancel_check
+
+        self.init_paths()
+        self.process(dem_array, no_data_value)
+
+    def report_stage(self, stage):
+        """Report the start of a process stage to the stage callback
+        """
+        if self.stage_callback is not None:
+            self.stage_callback(stage)
+
+    def check_canceled(self):
+        """Stop the process if it has been canceled (see cancel_check)
+        """
+        if self.cancel_check is not None:
+            self.cancel_check()
+
+    def init_paths(self):
+        """Function to init the output directory and the results full paths.
+        """
+        self.file_templates = self.file_funs.file_templates(
+                self.input_base_name)
+
+        self.temp_dirs, self.temp_paths = \
+                        self.file_funs.set_temp_dir()
+
+        self.out_dirs, self.out_paths = \
+                        self.file_funs.set_output_dir(self.out_path)
+
+        self.paths = {}
+        self.dirs = {}
+        self.paths['composed_hillshade'] = self.out_paths['composed_hillshade']
+        self.dirs['composed_hillshade'] = self.out_dirs['composed_hillshade']
+        self.file_funs.create_dir(self.dirs['composed_hillshade'])
+        if self.partials_create_and_load:
+            self.paths['simple_hillshade'] = self.out_paths['simple_hillshade']
+            self.dirs['simple_hillshade'] = self.out_dirs['simple_hillshade']
+            self.file_funs.create_dir(self.dirs['simple_hillshade'])
+
+    def process(self, dem_array, no_data_value):
+        """This function works with the partial hillshades and generates the
+        composed hillshade.
+
+        With a cache, the cached composed hillshade is used as is (nothing
+        is shaded or blended), and if only the partial hillshades are cached
+        (e.g. only the transparencies changed) they are just blended again
+        """
+        exposures = light_exposures(self.hill_params)
+        geotransform, projection = self.geo_profile
+        shading = shading_options(self.hill_params, geotransform, projection,
+                                  dem_array.shape[0])
+        radius = erosion_radius(self.hill_params)
+        self.partial_hills_dic = {}
+
+        partial_keys = composed_key = None
+        cached_partials = three_exp_array = None
+        if self.cache is not None:
+            partial_keys, composed_key = self.cache_keys(exposures, shading,
+                                                         radius)
+            three_exp_array = self.cache.get_array(composed_key)
+            if three_exp_array is None or self.partials_create_and_load:
+                cached_partials = [self.cache.get_array(partial_key)
+                                   for partial_key in partial_keys]
+                if any(partial is None for partial in cached_partials):
+                    cached_partials = None
+        self.report_stage(SHADE_STAGE)
+
+        # The rasters are written in background while the next exposure is
+        # shaded, every write is done (or its error raised) at the end
+        with raster_funs.AsyncWriter() as writer:
+
+            def write_partial(index, eroded):
+                if self.partials_create_and_load:
+                    azimuth, altitude, _ = exposures[index]
+                    hillshade_path, hillshade_filename = self.partial_path(
+                            azimuth, altitude)
+                    self.partial_hills_dic[hillshade_filename] = \
+                            hillshade_path
+                    writer.submit(self.save_raster, self.crop(eroded),
+                                  azimuth, altitude)
+                if cached_partials is None and partial_keys is not None:
+                    writer.submit(self.cache.put_array, partial_keys[index],
+                                  eroded)
+
+            if cached_partials is not None:
+                for index, partial in enumerate(cached_partials):
+                    write_partial(index, partial)
+                if three_exp_array is None:
+                    three_exp_array = bandCalc.merge_arrays(
+                            cached_partials,
+                            [transparency for _, _, transparency in exposures],
+                            dem_array, no_data_value,
+                            mask=raster_funs.ValidityMask(
+                                    dem_array, no_data_value, radius))
+                    writer.submit(self.cache.put_array, composed_key,
+                                  three_exp_array)
+
+            elif three_exp_array is None or self.partials_create_and_load:
+                # The partials are kept when there is a cache to store them
+                _, three_exp_array = shade_dem(
+                        dem_array, no_data_value, exposures,
+                        self.partials_create_and_load or
+                        self.cache is not None,
+                        shading, radius, write_partial,
+                        shading_threads(self.hill_params),
+                        fused_kernel(self.hill_params))
+                if composed_key is not None:
+                    writer.submit(self.cache.put_array, composed_key,
+                                  three_exp_array)
+
+            writer.submit(raster_funs.array_2_raster,
+                          self.crop(three_exp_array), self.geo_profile,
+                          self.paths['composed_hillshade'],
+                          output_profile=self.output_profile)
+            self.report_stage(WRITE_STAGE)
+
+        if self.load_results:
+            self.load_layers()
+
+    def crop(self, result_array):
+        """Crop a result array to the results area (see windows)
+        """
+        if self.windows is None:
+            return result_array
+
+        return raster_funs.crop_to_window(result_array, *self.windows)
+
+    def cache_keys(self, exposures, shading, radius):
+        """Get the cache keys of the partial hillshades (in the exposures
+        order) and of the composed hillshade.
+
+        A partial depends on the DEM, its light exposure and the shading
+        params, the composed hillshade on the partials and the transparencies
+        """
+        fused = fused_kernel(self.hill_params)
+        partial_keys = [self.cache.key('partial_hillshade', self.cache_key,
+                                       azimuth, altitude, shading, radius,
+                                       fused)
+                        for azimuth, altitude, _ in exposures]
+        composed_key = self.cache.key(
+                'composed_hillshade', partial_keys,
+                [transparency for _, _, transparency in exposures])
+
+        return partial_keys, composed_key
+
+    def result_layers(self):
+        """Get the (full_path, layer_name) pairs of the results that the user
+        asked to load into canvas
+        """
+        layers = []
+        if self.partials_create_and_load:
+            layers.extend((v, k) for k, v in self.partial_hills_dic.items())
+
+        if self.sombras_out:
+            fn_hillshade_filename = \
+                self.file_templates['composed_hillshade'].format(
+                        self.input_base_name)
+            layers.append((self.paths['composed_hillshade'],
+                           fn_hillshade_filename))
+
+        return layers
+
+    def load_layers(self):
+        """Load the partial hillshades and the composed hillshade into canvas
+        if the user asked for them
+        """
+        for full_path, layer_name in self.result_layers():
+            raster_funs.load_raster_layer(full_path, layer_name)
+
+    def partial_path(self, azimuth, altitude):
+        """Get the full path and the filename of a partial hillshade
+        """
+        hillshade_filename = self.file_templates['simple_hillshade'].format(
+                self.input_base_name, azimuth, altitude)
+
+        hillshade_path = os.path.join(self.dirs['simple_hillshade'],
+                                      hillshade_filename)
+
+        return hillshade_path, hillshade_filename
+
+    def save_raster(self, hillshade_array, azimuth, altitude):
+        """This function save the arrays of the partial hillshades
+        """
+        hillshade_path, hillshade_filename = self.partial_path(azimuth,
+                                                               altitude)
+        raster_funs.array_2_raster(hillshade_array,
+                                   self.geo_profile,
+                                   hillshade_path,
+                                   output_profile=self.output_profile)
+
+        return hillshade_path, hillshade_filename
+
+class BlockHillshaderDEM(HillshaderDEM):
+    """HillshaderDEM that streams the DEM from disk in blocks.
+
+    Each block is read with a halo (one pixel, or the erosion radius if it
+    is wider), shaded, blended, eroded and written straight into the output
+    rasters, so the memory used depends on block_size and not on the DEM
+    size. Results are the same as with HillshaderDEM.
+    """
+
+    def __init__(self, full_filename, partialsCreateAndLoad,
+                 sombrasOutResults, hill_params, out_path,
+                 block_size=BLOCK_SIZE, load_results=True,
+                 output_profile=raster_funs.DEFAULT_OUTPUT_PROFILE,
+                 stage_callback=None, cancel_check=None):
+        """Function to start class variables and launch the process
+        """
+        self.block_size = block_size
+        super(BlockHillshaderDEM, self).__init__(
+                full_filename, None, None, partialsCreateAndLoad,
+                sombrasOutResults, hill_params, out_path, load_results,
+                output_profile, stage_callback=stage_callback,
+                cancel_check=cancel_check)
+
+    def process(self, dem_array=None, no_data_value=None):
+        """This function reads the DEM block by block and writes the partial
+        and composed hillshades as each block is processed
+        """
+        exposures = light_exposures(self.hill_params)
+
+        dem_ds, dem_band, no_data_value = raster_funs.open_raster_band(
+                self.dem_full_path)
+        rows, cols = dem_ds.RasterYSize, dem_ds.RasterXSize
+        geotransform, projection = self.geo_profile
+        shading = shading_options(self.hill_params, geotransform,
+                                  projection, rows)
+
+        radius = erosion_radius(self.hill_params)
+        threads = shading_threads(self.hill_params)
+        # Every raster created, removed if the process fails or is canceled
+        # so an unfinished raster is never taken for a result
+        output_rasters = []
+        try:
+            composed_raster = raster_funs.create_raster(
+                    self.geo_profile, self.paths['composed_hillshade'],
+                    cols, rows, output_profile=self.output_profile)
+            output_rasters.append(composed_raster)
+            partial_rasters = []
+            if self.partials_create_and_load:
+                self.partial_hills_dic = {}
+                for azimuth, altitude, _ in exposures:
+                    hillshade_path, hillshade_filename = self.partial_path(
+                            azimuth, altitude)
+                    partial_rasters.append(raster_funs.create_raster(
+                            self.geo_profile, hillshade_path, cols, rows,
+                            output_profile=self.output_profile))
+                    output_rasters.append(partial_rasters[-1])
+                    self.partial_hills_dic[hillshade_filename] = \
+                            hillshade_path
+
+            # Blocks are read, shaded and written at the same time
+            self.report_stage(SHADE_STAGE)
+            # A single writer thread: the blocks of a raster are written in
+            # order while the next block is read and shaded
+            with raster_funs.AsyncWriter(threads=1) as writer:
+                for read_window, write_window in raster_funs.block_windows(
+                        rows, cols, self.block_size, max(1, radius)):
+                    self.check_canceled()
+                    dem_block = dem_band.ReadAsArray(*read_window)
+                    partial_blocks, composed_block = shade_dem(
+                            dem_block, no_data_value, exposures,
+                            self.partials_create_and_load, shading, radius,
+                            threads=threads,
+                            fused=fused_kernel(self.hill_params))
+
+                    writer.submit(composed_raster.write,
+                                  raster_funs.crop_to_window(
+                                          composed_block, read_window,
+                                          write_window),
+                                  write_window[0], write_window[1])
+                    for partial_raster, partial_block in zip(
+                            partial_rasters, partial_blocks or []):
+                        writer.submit(partial_raster.write,
+                                      raster_funs.crop_to_window(
+                                              partial_block, read_window,
+                                              write_window),
+                                      write_window[0], write_window[1])
+
+                self.report_stage(WRITE_STAGE)
+                for output_raster in output_rasters:
+                    writer.submit(output_raster.close)
+        except Exception:
+            for output_raster in output_rasters:
+                output_raster.discard()
+            raise
+        finally:
+            dem_ds = None
+
+        if self.load_results:
+            self.load_layers()
+
+class ReblendHillshaderDEM(HillshaderDEM):
+    """HillshaderDEM that does not shade the DEM again: the partial
+    hillshades saved by a previous process in the simple_hillshades folder of
+    out_path are read and blended again with the transparencies of
+    hill_params. The DEM is only used for the no data mask, if it has a
+    halo (see windows) the partial hillshades are the size of the results
+    area.
+    """
+
+    def init_paths(self):
+        """Function to init the output directory and the results full paths.
+        The partial hillshades folder is always needed, they are read from it
+        """
+        super(ReblendHillshaderDEM, self).init_paths()
+        self.paths['simple_hillshade'] = self.out_paths['simple_hillshade']
+        self.dirs['simple_hillshade'] = self.out_dirs['simple_hillshade']
+
+    def process(self, dem_array, no_data_value):
+        """This function reads the partial hillshades and generates the
+        composed hillshade
+        """
+        exposures = light_exposures(self.hill_params)
+        self.partial_hills_dic = {}
+        self.report_stage(SHADE_STAGE)
+
+        partial_rasters = []
+        for azimuth, altitude, _ in exposures:
+            hillshade_path, hillshade_filename = self.partial_path(azimuth,
+                                                                   altitude)
+            if not os.path.exists(hillshade_path):
+                raise ValueError(
+                        u"Error: Partial hillshade {} not found, the file "
+                        u"must be processed with the intermediate "
+                        u"files".format(hillshade_filename))
+            partial_raster = raster_funs.read_raster(hillshade_path)
+            if partial_raster.array.shape != self.crop(dem_array).shape:
+                raise ValueError(
+                        u"Error: Partial hillshade {} does not match the "
+                        u"DEM size".format(hillshade_filename))
+            partial_rasters.append(partial_raster)
+            if self.partials_create_and_load:
+                self.partial_hills_dic[hillshade_filename] = hillshade_path
+
+        mask = raster_funs.ValidityMask(dem_array, no_data_value,
+                                        erosion_radius(self.hill_params))
+        if self.windows is not None:
+            mask = mask.crop(*self.windows)
+        three_exp_array = bandCalc.merge_arrays(
+                [partial_raster.array for partial_raster in partial_rasters],
+                [transparency for _, _, transparency in exposures],
+                self.crop(dem_array), no_data_value, mask=mask)
+        del partial_rasters
+
+        self.report_stage(WRITE_STAGE)
+        raster_funs.array_2_raster(three_exp_array, self.geo_profile,
+                                   self.paths['composed_hillshade'],
+                                   output_profile=self.output_profile)
+
+        if self.load_results:
+            self.load_layers()
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ Batch_Hillshader
+                                 A QGIS plugin  to generate a three light
+                                 exposure hillshade (shaded relief by
+                                 combining three light exposures)
+
+    For more information, see the program documentation.
+
+    Plugin uses LASzip, see <https://laszip.org/>
+                              -------------------
+        begin                : 2016-07-13
+        git sha              : $Format:%H$
+        copyright            : (C) 2017 by PANOimagen S.L.
+        email                : info@panoimagen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software: you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation, either version 3 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ *   This program is distributed in the hope that it will be useful,       *
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+ *   GNU General Public License for more details.                          *
+ *                                                                         *
+ *   You should have received a copy of the GNU General Public License     *
+ *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
+ ***************************************************************************/
+"""
+
+import os
+from concurrent import futures
+
+from qgis.core import QgsTask
+
+from . import batch_processing
+from .plugin_utils import raster_funs
+from .bh_errors import ProcessCanceledError
+
+class HillshaderTask(QgsTask):
+    """QGIS background task that processes one file (a batch_processing
+    job).
+
+    The progress advances as each stage of the job starts (see
+    batch_processing.job_stages). A canceled task stops at the start of the
+    next stage, or of the next LiDAR tile or DEM block, releasing the arrays
+    of the file. The results are loaded into canvas in finished, that runs
+    in the main thread. With a batch_processing.ProcessPool the file is
+    processed in a worker process and the task only follows it, so the
+    files of a batch do not share the GIL.
+    """
+
+    def __init__(self, job, on_finished=None, pool=None):
+        """on_finished is called with the task, in the main thread, once
+        the task has finished or has been canceled (see result). pool is
+        the batch_processing.ProcessPool that processes the file, None to
+        process it in the task thread
+        """
+        super(HillshaderTask, self).__init__(
+                u'Batch Hillshader: ' + os.path.basename(job['input_file']),
+                QgsTask.CanCancel)
+        self.job = job
+        self.on_finished = on_finished
+        self.pool = pool
+        self.stages = batch_processing.job_stages(job)
+        self.result = None
+
+    def check_canceled(self):
+        """Stop the process if the task has been canceled
+        """
+        if self.isCanceled():
+            raise ProcessCanceledError(u"Canceled")
+
+    def stage_started(self, stage):
+        """Update the progress when a stage starts, stop if canceled
+        """
+        self.check_canceled()
+        self.show_stage(stage)
+
+    def show_stage(self, stage):
+        """Set the progress of the task at the start of a stage
+        """
+        self.setProgress(100. * self.stages.index(stage) / len(self.stages))
+
+    def run(self):
+        """Process the file, in a background thread
+        """
+        if self.pool is None:
+            self.result = batch_processing.process_file(self.job,
+                                                        self.stage_started,
+                                                        self.check_canceled)
+        else:
+            self.result = self.run_in_pool()
+
+        return self.result['error'] is None
+
+    def run_in_pool(self):
+        """Process the file in a worker process of the pool and wait for
+        it, following its stages and passing it the cancel
+        """
+        pooled_job = self.pool.submit(self.job)
+        while True:
+            if self.isCanceled():
+                pooled_job.cancel()
+            try:
+                result = pooled_job.result(
+                        batch_processing.POOL_POLL_INTERVAL)
+            except futures.TimeoutError:
+                result = None
+            for stage in pooled_job.started_stages():
+                self.show_stage(stage)
+            if result is not None:
+                return result
+
+    def finished(self, result):
+        """Load the results into canvas, in the main thread
+        """
+        if self.result is None:
+            # Canceled before it started
+            self.result = batch_processing.empty_result(self.job,
+                                                        u"Canceled")
+            self.result['canceled'] = True
+
+        for full_path, layer_name in self.result['layers']:
+            raster_funs.load_raster_layer(full_path, layer_name)
+
+        if self.on_finished is not None:
+            self.on_finished(self)
+
+class MosaicTask(QgsTask):
+    """QGIS background task that builds the virtual mosaic of the composed
+    hillshades of a batch (see batch_processing.build_results_mosaic) and
+    loads it into canvas as a single layer.
+    """
+
+    def __init__(self, results, out_path, threads=1, load_mosaic=True,
+                 on_finished=None):
+        """results are the results of the batch jobs, the mosaic is built in
+        out_path. on_finished is called with the task, in the main thread,
+        once the task has finished (see mosaic_path and error)
+        """
+        super(MosaicTask, self).__init__(u'Batch Hillshader: mosaic')
+        self.results = results
+        self.out_path = out_path
+        self.threads = threads
+        self.load_mosaic = load_mosaic
+        self.on_finished = on_finished
+        self.mosaic_path = None
+        self.error = None
+
+    def run(self):
+        """Build the overviews and the mosaic, in a background thread
+        """
+        try:
+            self.mosaic_path = batch_processing.build_results_mosaic(
+                    self.results, self.out_path, self.threads)
+        except Exception as error:
+            self.error = str(error) or error.__class__.__name__
+            return False
+
+        return True
+
+    def finished(self, result):
+        """Load the mosaic into canvas, in the main thread
+        """
+        if self.mosaic_path is not None and self.load_mosaic:
+            layer_name, _ = os.path.splitext(
+                    os.path.basename(self.mosaic_path))
+            raster_funs.load_raster_layer(self.mosaic_path, layer_name)
+
+        if self.on_finished is not None:
+            self.on_finished(self)
@@ -1,465 +1,751 @@
-# -*- coding: utf-8 -*-
-"""
-/***************************************************************************
- Batch_Hillshader
-                                 A QGIS plugin  to generate a three light
-                                 exposure hillshade (shaded relief by
-                                 combining three light exposures)
-
-    For more information, see the program documentation.
-
-    Plugin uses LASzip, see <https://laszip.org/>
-                              -------------------
-        begin                : 2016-07-13
-        git sha              : $Format:%H$
-        copyright            : (C) 2017 by PANOimagen S.L.
-        email                : info@panoimagen.com
- ***************************************************************************/
-
-/***************************************************************************
- *                                                                         *
- *   This program is free software: you can redistribute it and/or modify  *
- *   it under the terms of the GNU General Public License as published by  *
- *   the Free Software Foundation, either version 3 of the License, or     *
- *   (at your option) any later version.                                   *
- *                                                                         *
- *   This program is distributed in the hope that it will be useful,       *
- *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
- *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
- *   GNU General Public License for more details.                          *
- *                                                                         *
- *   You should have received a copy of the GNU General Public License     *
- *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
- ***************************************************************************/
-"""
-
-import numpy as np
-import os
-from scipy.interpolate import griddata
-from osgeo import gdal, osr, gdalconst
-from .plugin_utils import files_and_dirs_funs
-
-from .bh_errors import LasPyNotFoundError
-try:
-    import laspy
-
-except ModuleNotFoundError:
-    raise LasPyNotFoundError
-
-class LiDAR(object):
-
-    def __init__(self, in_lidar_path, out_path, partials_create, 
-                 terrain=False, surfaces=False):
-        
-        """ Init variables
-        """
-        self.terrain = terrain
-        self.surfaces = surfaces
-        if self.terrain:
-            self.class_flag = 2
-        elif self.surfaces:
-            # TODO
-            pass
-        
-        """ Obtein laspy version"""
-        self.laspy_version = self.get_laspy_version()
-
-        self.in_lidar_path = in_lidar_path
-        self.path, full_name = os.path.split(in_lidar_path)
-        filename, ext = os.path.splitext(full_name)
-        if ext.lower() == '.las':
-            self.laz = False
-            self.in_las_path = self.in_lidar_path
-        else:
-            pass
-            
-        self.files_utils = files_and_dirs_funs.DirAndPaths()
-        self.name, self.extension = self.files_utils.init(full_name)
-        self.partials_create = partials_create
-        self.templates_dict = self.files_utils.file_templates(self.name)
-        self.out_path = out_path
-        self.read_las_file()
-        self.get_all_points()
-        self.get_scaled_points()
-        self.get_file_extent()
-        self.get_file_density()
-        self.get_points_arrays()
-
-    def get_laspy_version(self):
-        """ Obtein laspy version"""
-        version = laspy.__version__
-        return version[0]
-
-
-    def process(self):
-        
-        if self.partials_create and not self.surfaces:
-            self.out_dir = os.path.join(self.out_path, 'intermediate_results', 
-                                   'las')
-            self.files_utils.create_dir(self.out_dir)
-
-            self.write_las_file()
-        
-        if self.lidar_arrays_list[0].shape == (0, 2):
-            raise ValueError(u"Error: An error has occurred. The selected" +
-                                  u" file is not valid for the process, it is" +
-                                  u" possibly not classified.\nPlease, solve" +
-                                  u" it and restart the process!")
-        
-        return [self.lidar_arrays_list, 
-                self.las_file_extent, 
-                self.density['ground_dens_class']]
-        
-    def read_las_file(self):
-        """ Read the input LiDAR file in las format. Not laz format
-        """
-        if self.laspy_version == '1':
-            self.in_file = laspy.file.File(self.in_las_path, mode='r')
-            self.scale = self.in_file.header.scale
-            self.offset = self.in_file.header.offset
-        
-        else:
-            self.in_file = laspy.read(self.in_las_path)
-            self.scale = self.in_file.header.scales
-            self.offset = self.in_file.header.offsets
-        
-        
-    def get_all_points(self):
-        """ Get points for file (points information and coordinates)
-        """
-        if self.laspy_version == '1':
-            self.points_array = self.in_file.get_points()
-        else:
-            self.points_array = self.in_file.points.array
-
-        self.points_number = len(self.in_file)
-    
-    def get_scaled_points(self):
-        """ Get the coordinates scalated
-        """
-        x = self.in_file.X
-        y = self.in_file.Y
-        z = self.in_file.Z
-        
-        self.x_dimension = x * self.scale[0] + self.offset[0]
-        self.y_dimension = y * self.scale[1] + self.offset[1]
-        self.z_dimension = z * self.scale[-1] + self.offset[-1]
-    
-    def get_file_extent(self):
-        """ Get extent of the lidar file
-        """
-
-        self.las_file_extent = [(max(self.x_dimension), max(self.y_dimension)), 
-                                (max(self.x_dimension), min(self.y_dimension)), 
-                                (min(self.x_dimension), max(self.y_dimension)), 
-                                (min(self.x_dimension), min(self.y_dimension))]
-    
-    # for raster_geotransform= (min(self.x_dimension, max(self.y_dimension)))
-    # or the same self.las_file_extent[2]
-    
-    def get_ground_points(self):
-        """ Function to get the number of ground points. 
-            Source: laspy documentation
-        """
-        num_returns = self.in_file.num_returns
-        return_num = self.in_file.return_num
-        ground_points = self.in_file.points[num_returns == return_num]
-        self.ground_points_number = len(ground_points)
-        
-    def get_file_density(self):
-        """ Compute points density only with ground points -class: 2-. 
-        """
-        self.get_ground_points()
-            
-        self.density = {}
-        self.file_sup_m2 = (max(self.x_dimension) - min(self.x_dimension)) *\
-                            (max(self.y_dimension) - min(self.y_dimension))
-        # density of all lidar returns
-        self.density['all_dens'] = self.points_number / self.file_sup_m2
-        
-        class_2_points, _ = self.get_points_by_class(2)
-        class_0_points, _ = self.get_points_by_class(0)
-        class_1_points, _ = self.get_points_by_class(1)
-        class_7_points, _ = self.get_points_by_class(7)
-        class_8_points, _ = self.get_points_by_class(8)
-        # density of only ground points filtered by returns  
-        self.density['ground_dens_ret'] = (self.ground_points_number /
-                                      self.file_sup_m2)
-        # # density of only ground points filtered by class: 2 
-        self.density['ground_dens_class'] = (
-                            (len(class_2_points)) / self.file_sup_m2)
-        # density of lidar file excluding classes 0, 1, 7 and 8. ¿Where is overlap class?
-        self.density['util_points'] = ((self.points_number - 
-                                len(class_0_points) - len(class_1_points) - 
-                                len(class_7_points) - len(class_8_points)) /
-                                self.file_sup_m2)
-        
-        # compare ground points density (filtered points by class vs filtered points by returns)
-        if self.density[
-                'ground_dens_ret'] == self.density['ground_dens_class']:
-            return True
-        else:
-            return False # pass
-        
-    def get_points_by_class(self, classif=2):
-        """ Get points array with the given classification id (ASPRS classes)
-        """
-        if self.laspy_version == '1':
-            class_points_bool = self.in_file.Classification == classif
-        else:
-            class_points_bool = self.in_file.classification == classif
-        
-        return self.points_array[class_points_bool], class_points_bool
-        
-    def get_points_arrays(self):
-        """ Creates arrays for a given class (default=2) with the coordinates
-            of the points classificated by that class flag
-        """
-#        class_flags = 2, 3, 4, 5 para suelo, vegetación baja, media y alta respectivamente
-        if self.terrain:
-            class_2_points, class_2_bool = self.get_points_by_class(
-                    self.class_flag)
-            size = class_2_points.shape[0]
-            x_array = self.x_dimension[class_2_bool].reshape(size, 1)
-            y_array = self.y_dimension[class_2_bool].reshape(size, 1)
-            z_array = self.z_dimension[class_2_bool]
-            
-        elif self.surfaces:
-            # Guardo el archivo para poder leerlo
-            
-            self.out_dir = os.path.join(self.out_path, 'intermediate_results', 
-                                   'las')
-            
-            filename = ('Surfaces_' + 
-                                self.templates_dict['las'].format(self.name))
-
-            full_path = os.path.join(self.out_dir, filename)
-            
-            self.files_utils.create_dir(self.out_dir)
-            
-            if self.laspy_version == '1': 
-                out_file = laspy.file.File(full_path, mode='w', header=self.in_file.header)
-                out_file.points = self.in_file.points[
-                        self.in_file.return_num == 1]
-                out_file.close()
-            
-                #leo el archivo
-                in_file = laspy.file.File(full_path, mode='r')
-                scale = in_file.header.scale
-                offset = in_file.header.offset
-            else:
-                self.in_file = laspy.convert(self.in_file, point_format_id=1)
-                out_file = laspy.LasData(self.in_file.header)
-                out_file.points = self.in_file.points[
-                        self.in_file.return_num == 1]
-                out_file.write(full_path)
-            
-                #leo el archivo
-                in_file = laspy.read(full_path)
-                scale = in_file.header.scale
-                offset = in_file.header.offset
-
-            x = in_file.X
-            y = in_file.Y
-            z = in_file.Z
-            
-            x_dimension = x * scale[0] + offset[0]
-            y_dimension = y * scale[1] + offset[1]
-            z_dimension = z * scale[-1] + offset[-1]
-            
-            size = x_dimension.shape[0]
-            
-            x_array = x_dimension.reshape(size, 1)
-            y_array = y_dimension.reshape(size, 1)
-            z_array = z_dimension
-            
-            if self.laspy_version == '1': 
-                # Cerrar archivo para poder eliminarlo
-                in_file.close()
-            
-            if not self.partials_create:     
-                self.files_utils.remove_temp_file(full_path)
-                try:
-                    self.files_utils.remove_temp_dir(self.out_dir)
-                except OSError:
-                    pass
-                
-        xy_array = np.concatenate((x_array, y_array), axis=1)
-        self.lidar_arrays_list = [xy_array, z_array]
-    
-    def write_las_file(self):
-        """ Create and write a new lidar file with the desirable points
-        """ 
-        if self.surfaces:
-            self.out_full_path = os.path.join(self.out_dir, ('Surfaces_' + 
-                                self.templates_dict['las'].format(self.name)))
-        
-        elif self.terrain:
-            self.out_full_path = os.path.join(self.out_dir, ('Terrain_' + 
-                                self.templates_dict['las'].format(self.name)))
-        
-        if self.laspy_version == '1':
-            out_file = laspy.fileFile(self.out_full_path, mode='w', 
-                            header=self.in_file.header)
-        else:
-            self.in_file = laspy.convert(self.in_file, point_format_id=1)
-            out_file = laspy.LasData(self.in_file.header)              
-        
-        if self.terrain:
-            class_2_points, class_2_bool = self.get_points_by_class(
-                    self.class_flag)
-            out_file.points = self.in_file.points[class_2_bool]
-            
-        elif self.surfaces:
-            out_file.points = self.in_file.points[
-                    self.in_file.return_num == 1]
-        if self.laspy_version == '1':
-            out_file.close()
-        else:
-            out_file.write(self.out_full_path)
-
-        
-
-class RasterizeLiDAR(object):
-
-    def __init__(self, input_file_path, laspy_result, out_path, 
-                 terrain=False, surfaces=False,
-                 method='nearest', pixel_size=None):
-
-        self.lidar_arrays_list = laspy_result[0]
-        self.lidar_extent = laspy_result[1]
-        self.density = laspy_result[-1]
-        self.files_utils = files_and_dirs_funs.DirAndPaths() 
-        _, input_file = os.path.split(input_file_path)
-        name, _ = self.files_utils.init(input_file)
-        
-        self.lidar_xy_array = self.lidar_arrays_list[0]
-        self.lidar_altitudes_array = self.lidar_arrays_list[-1]
-        self.method = method
-        self.pixel_size = pixel_size
-        
-        templates_dict = self.files_utils.file_templates(name)
-        out_name = templates_dict['dem'].format(name)
-        self.dirs = self.files_utils.set_output_dir(out_path)[0]
-        
-        self.files_utils.create_dir(self.dirs['dem'])
-        if terrain:
-            prefix = 'Terrain_'
-        if surfaces:
-            prefix = 'Surfaces_'
-            
-        self.dem_full_path = os.path.join(self.dirs['dem'], (
-                        prefix + out_name))
-
-#        lidar_extent = [(max(self.x_dimension), max(self.y_dimension)), 
-#                        (max(self.x_dimension), min(self.y_dimension)), 
-#                        (min(self.x_dimension), max(self.y_dimension)), 
-#                        (min(self.x_dimension), min(self.y_dimension))]
-        
-#        if not pixel_size:
-#            # get the points density and create a pixel size that allows at least three points per pixel
-#            self.pixel_size = self.get_recommended_pixel_size(self.density)
-#        else:
-#            if self.check_pixel_size(pixel_size):
-#                self.pixel_size = pixel_size
-#            else:
-#                self.pixel_size = self.get_recommended_pixel_size(self.density)
-           
-#    def get_recommended_pixel_size(self, min_returns=3):
-#        """ Get the recomended pixel size for output raster file created
-#            from lidar data. Pixel size must contains at least 3 lidar
-#            returns
-#        """
-#        return np.round(min_returns / self.density)
-#        
-#    def check_pixel_size(self, pixel_size):
-#        """ Compare pixel size given by the user with the recomended in 
-#            accordance with the lidar file density
-#        """ 
-#        if pixel_size <= self.get_recommended_pixel_size():
-#            return False
-#    
-    def makegrid(self):
-        """ This function generates the center grid of the future raster.
-            This is needed to interpolate between the LiDAR points
-        """
-        corner0 = self.lidar_extent[2]
-        # px_center0 = (min_x, max_y)
-        px_center0 = ((corner0[0] + self.pixel_size / 2),
-                      (corner0[1] - self.pixel_size / 2))
-        corner1 = self.lidar_extent[1]
-        # px_center1 = (max_x, min_y)
-        px_center1 = ((corner1[0] - self.pixel_size / 2),
-                      (corner1[1] + self.pixel_size / 2))
-                
-        self.grid_x, self.grid_y = np.mgrid[
-                            px_center0[0]: px_center1[0]: self.pixel_size, 
-                            px_center0[-1]: px_center1[-1]: -self.pixel_size]
-
-    def interpolate_grid(self):
-        """ This function generates an interpolated array from point cloud.
-            lidar x-y points, z_values and mesh_grid is needed. 
-            Avaible methods are nearest, linear, cubic (1-D) and cubic (2-D) 
-        """
-        self.makegrid()
-        interpolate_grid = griddata(self.lidar_xy_array, 
-                                    self.lidar_altitudes_array,
-                                    (self.grid_x, self.grid_y), 
-                                    method=self.method)
-        return interpolate_grid.T
-
-    def array_2_raster(self, raster_array, epsg_code=None,
-                   data_type=gdalconst.GDT_Float64, no_data_value=-99999):
-        """ Create a raster file in geotiff format from a numpy array.
-            Geotransform information for the output file is taken from the 
-            input lidar file.
-            data_type specifies the data type to be used in the output_file 
-            (types are defined in gdalconst)
-        """
-#        data_driver = raster.GetDriver() # Sometimes doesn't work
-        try:
-            data_driver = gdal.GetDriverByName("GTiff") # for QGIS3
-        except TypeError:
-            data_driver = gdal.GetDriverByName(b"GTiff") # for QGIS2
-        data_set_geotransform = self.set_raster_geotransform()
-    
-        rows = raster_array.shape[0]
-        cols = raster_array.shape[-1]
-        
-        target_ds = data_driver.Create(
-                self.dem_full_path, cols, rows, 1, data_type)
-        target_ds.SetGeoTransform(data_set_geotransform)
-        
-        if epsg_code:
-            data_set_out_SRS = self.set_crs(epsg_code)
-            target_ds.SetProjection(data_set_out_SRS.ExportToWkt())
-            
-        data_set_out_band = target_ds.GetRasterBand(1)
-        data_set_out_band.SetNoDataValue(no_data_value)
-        data_set_out_band.WriteArray(raster_array)
-        
-        data_set_out_band.FlushCache()
-        target_ds = None
-        
-        return self.dem_full_path
-
-    def set_raster_geotransform(self):
-        """ Set the extent for the output raster
-            geotransform = (x_origin, pixel_x, 0, y_origin, 0, pixel_y)
-            pixel_y is frecuently defined < 0
-        """
-        self.raster_origin = self.lidar_extent[2] # this is min_x and max_y
-        return (self.raster_origin[0], 
-                self.pixel_size, 
-                0, 
-                self.raster_origin[-1], 
-                0,
-                -self.pixel_size)
-    
-    def set_crs(self, epsg_code):
-        """ Set the output raster crs by a given EPSG code
-        """
-        data_set_out_SRS = osr.SpatialReference()
-        data_set_out_SRS.ImportFromEPSG(epsg_code)
-        
-        return data_set_out_SRS
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ Batch_Hillshader
+                                 A QGIS plugin  to generate a three light
+                                 exposure hillshade (shaded relief by
+                                 combining three light exposures)
+
+    For more information, see the program documentation.
+
+    Plugin uses LASzip, see <https://laszip.org/>
+                              -------------------
+        begin                : 2016-07-13
+        git sha              : $Format:%H$
+        copyright            : (C) 2017 by PANOimagen S.L.
+        email                : info@panoimagen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software: you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation, either version 3 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ *   This program is distributed in the hope that it will be useful,       *
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+ *   GNU General Public License for more details.                          *
+ *                                                                         *
+ *   You should have received a copy of the GNU General Public License     *
+ *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
+ ***************************************************************************/
+"""
+
+import numpy as np
+import os
+import threading
+from scipy.interpolate import griddata
+from scipy.spatial import cKDTree
+try:
+    from scipy.spatial import QhullError
+except ImportError:
+    # scipy < 1.8
+    from scipy.spatial.qhull import QhullError
+from osgeo import osr, gdalconst
+from .plugin_utils import files_and_dirs_funs
+from .plugin_utils import raster_funs
+
+from .bh_errors import LasPyNotFoundError
+try:
+    import laspy
+
+except ModuleNotFoundError:
+    raise LasPyNotFoundError
+
+# Interpolation methods that triangulate the points of each tile
+TRIANGULATION_METHODS = ('linear', 'cubic')
+# Methods that aggregate the points that fall inside each pixel
+BINNING_METHODS = ('min', 'max', 'mean')
+# Points read at once when the LiDAR file is streamed
+CHUNK_SIZE = 2 ** 21
+# Point format of the intermediate las files (laspy 2)
+LAS_POINT_FORMAT = 1
+# Grid tile side (pixels) used to interpolate the point cloud
+TILE_SIZE = 512
+# Minimum buffer around each tile, in pixels and in mean point spacings
+TILE_BUFFER_PIXELS = 8
+TILE_BUFFER_SPACINGS = 10
+# Inverse distance weighting parameters
+IDW_NEIGHBOURS = 8
+IDW_POWER = 2
+# Points binned at once (binning methods)
+BIN_CHUNK_SIZE = 2 ** 20
+
+class LasStatistics(object):
+    """ Points statistics of a LiDAR file: points by class and by return,
+        extent and densities. Each group of points (the whole file or a
+        chunk) is added with one vectorised pass, see update
+    """
+
+    def __init__(self, scale, offset):
+        """ scale and offset are the las header ones, the coordinates given
+            to update are the raw (integer) X and Y
+        """
+        self.scale = scale
+        self.offset = offset
+        self.class_counts = np.zeros(256, dtype=np.int64)
+        self.points_number = 0
+        self.ground_points_number = 0
+        self.first_returns_number = 0
+        self.raw_min_x = self.raw_min_y = float('inf')
+        self.raw_max_x = self.raw_max_y = -float('inf')
+
+    def update(self, raw_x, raw_y, classification, return_number,
+               number_of_returns):
+        """ Add the statistics of a group of points
+        """
+        if not len(raw_x):
+            return
+
+        return_number = np.asarray(return_number)
+        self.class_counts += np.bincount(np.asarray(classification),
+                                         minlength=256)
+        self.points_number += len(raw_x)
+        # ground points by returns. Source: laspy documentation
+        self.ground_points_number += np.count_nonzero(
+                np.asarray(number_of_returns) == return_number)
+        self.first_returns_number += np.count_nonzero(return_number == 1)
+
+        self.raw_min_x = min(self.raw_min_x, raw_x.min())
+        self.raw_max_x = max(self.raw_max_x, raw_x.max())
+        self.raw_min_y = min(self.raw_min_y, raw_y.min())
+        self.raw_max_y = max(self.raw_max_y, raw_y.max())
+
+    def class_points_number(self, *classes):
+        """ Get the number of points of the given classes (ASPRS classes)
+        """
+        return int(self.class_counts[list(classes)].sum())
+
+    def extent(self):
+        """ Get the extent of the points, as LiDAR.las_file_extent
+        """
+        min_x = self.raw_min_x * self.scale[0] + self.offset[0]
+        max_x = self.raw_max_x * self.scale[0] + self.offset[0]
+        min_y = self.raw_min_y * self.scale[1] + self.offset[1]
+        max_y = self.raw_max_y * self.scale[1] + self.offset[1]
+
+        return [(max_x, max_y), (max_x, min_y),
+                (min_x, max_y), (min_x, min_y)]
+
+    def surface(self):
+        """ Get the surface of the extent (m2)
+        """
+        (max_x, max_y), _, _, (min_x, min_y) = self.extent()
+
+        return (max_x - min_x) * (max_y - min_y)
+
+    def density(self):
+        """ Get the points densities dictionary (points / m2)
+        """
+        file_sup_m2 = self.surface()
+        density = {}
+        # density of all lidar returns
+        density['all_dens'] = self.points_number / file_sup_m2
+        # density of only ground points filtered by returns
+        density['ground_dens_ret'] = self.ground_points_number / file_sup_m2
+        # density of only ground points filtered by class: 2
+        density['ground_dens_class'] = (self.class_points_number(2) /
+                                        file_sup_m2)
+        # density of lidar file excluding classes 0, 1, 7 and 8. ¿Where is overlap class?
+        density['util_points'] = ((self.points_number -
+                                   self.class_points_number(0, 1, 7, 8)) /
+                                  file_sup_m2)
+
+        return density
+
+class LiDAR(object):
+
+    def __init__(self, in_lidar_path, out_path, partials_create, 
+                 terrain=False, surfaces=False, streaming=False,
+                 chunk_size=CHUNK_SIZE):
+        
+        """ Init variables.
+            With streaming (only laspy 2) the file is read in chunks of
+            chunk_size points and only the needed points are kept in memory
+        """
+        self.terrain = terrain
+        self.surfaces = surfaces
+        if self.terrain:
+            self.class_flag = 2
+        elif self.surfaces:
+            # TODO
+            pass
+        
+        """ Obtein laspy version"""
+        self.laspy_version = self.get_laspy_version()
+
+        self.in_lidar_path = in_lidar_path
+        self.path, full_name = os.path.split(in_lidar_path)
+        filename, ext = os.path.splitext(full_name)
+        if ext.lower() == '.las':
+            self.laz = False
+            self.in_las_path = self.in_lidar_path
+        else:
+            pass
+            
+        self.files_utils = files_and_dirs_funs.DirAndPaths()
+        self.name, self.extension = self.files_utils.init(full_name)
+        self.partials_create = partials_create
+        self.templates_dict = self.files_utils.file_templates(self.name)
+        self.out_path = out_path
+        self.streaming = streaming and self.laspy_version != '1'
+        if self.streaming:
+            self.read_las_chunks(chunk_size)
+        else:
+            self.read_las_file()
+            self.get_all_points()
+            self.get_scaled_points()
+            self.get_file_extent()
+            self.get_file_density()
+            self.get_points_arrays()
+
+    def get_laspy_version(self):
+        """ Obtein laspy version"""
+        version = laspy.__version__
+        return version[0]
+
+
+    def process(self):
+        """ Check the points used by the process and return them with the
+            file extent and density. If partials are created, the las file
+            with those points is written in a background thread, see
+            wait_las_file
+        """
+        if self.lidar_arrays_list[0].shape == (0, 2):
+            raise ValueError(u"Error: An error has occurred. The selected" +
+                                  u" file is not valid for the process, it is" +
+                                  u" possibly not classified.\nPlease, solve" +
+                                  u" it and restart the process!")
+
+        if self.partials_create and not self.streaming:
+            self.las_export_error = None
+            self.las_export = threading.Thread(target=self.export_las_file)
+            self.las_export.start()
+
+        return [self.lidar_arrays_list, 
+                self.las_file_extent, 
+                self.density['ground_dens_class']]
+
+    def export_las_file(self):
+        """ Write the las file keeping the error to raise it in
+            wait_las_file (background thread target)
+        """
+        try:
+            self.write_las_file()
+        except Exception as error:
+            self.las_export_error = error
+
+    def wait_las_file(self):
+        """ Wait until the las file written in background is finished.
+            Raises the error of the writing, if any
+        """
+        las_export = getattr(self, 'las_export', None)
+        if las_export is None:
+            return
+
+        las_export.join()
+        self.las_export = None
+        if self.las_export_error is not None:
+            raise self.las_export_error
+
+    def get_las_out_path(self):
+        """ Get the full path of the las file with the points used by the
+            process (intermediate result)
+        """
+        self.out_dir = os.path.join(self.out_path, 'intermediate_results', 
+                                    'las')
+        if self.surfaces:
+            prefix = 'Surfaces_'
+        else:
+            prefix = 'Terrain_'
+
+        return os.path.join(self.out_dir, (prefix + 
+                            self.templates_dict['las'].format(self.name)))
+
+    def get_points_mask(self, classification, return_number):
+        """ Get the mask of the points used by the process: points of the
+            class_flag class (terrain) or first returns (surfaces)
+        """
+        if self.terrain:
+            return classification == self.class_flag
+
+        return return_number == 1
+
+    def read_las_chunks(self, chunk_size):
+        """ Read the input LiDAR file chunk by chunk (laspy 2).
+            Only the points used by the process are kept, as int32 X-Y and
+            float32 Z buffers. The extent and the density of the file are
+            computed in the same pass and, if partials are created, the
+            used points are written to the intermediate las file
+        """
+        x_chunks = []
+        y_chunks = []
+        z_chunks = []
+
+        with laspy.open(self.in_lidar_path) as reader:
+            self.scale = reader.header.scales
+            self.offset = reader.header.offsets
+            self.statistics = LasStatistics(self.scale, self.offset)
+
+            writer = None
+            if self.partials_create:
+                self.out_full_path = self.get_las_out_path()
+                self.files_utils.create_dir(self.out_dir)
+                # Converted as in write_las_file, the intermediate file is
+                # the same whichever reader is used
+                out_header = laspy.convert(
+                        laspy.LasData(reader.header),
+                        point_format_id=LAS_POINT_FORMAT).header
+                writer = laspy.open(self.out_full_path, mode='w',
+                                    header=out_header)
+            try:
+                for points in reader.chunk_iterator(chunk_size):
+                    if not len(points):
+                        continue
+                    classification = np.asarray(points.classification)
+                    return_number = np.asarray(points.return_number)
+                    self.statistics.update(points.X, points.Y,
+                                           classification, return_number,
+                                           points.number_of_returns)
+
+                    mask = self.get_points_mask(classification,
+                                                return_number)
+                    x_chunks.append(points.X[mask].astype(np.int32))
+                    y_chunks.append(points.Y[mask].astype(np.int32))
+                    z_chunks.append((points.Z[mask] * self.scale[-1] +
+                                     self.offset[-1]).astype(np.float32))
+                    if writer is not None:
+                        writer.write_points(
+                                laspy.PackedPointRecord.from_point_record(
+                                        points[mask],
+                                        out_header.point_format))
+            finally:
+                if writer is not None:
+                    writer.close()
+
+        self.points_number = self.statistics.points_number
+        self.las_file_extent = self.statistics.extent()
+        self.get_file_density()
+
+        x_array = np.concatenate(x_chunks or [np.zeros(0, np.int32)])
+        y_array = np.concatenate(y_chunks or [np.zeros(0, np.int32)])
+        del x_chunks, y_chunks
+        xy_array = np.empty((len(x_array), 2))
+        xy_array[:, 0] = x_array * self.scale[0] + self.offset[0]
+        xy_array[:, 1] = y_array * self.scale[1] + self.offset[1]
+        del x_array, y_array
+        self.lidar_arrays_list = [
+                xy_array, np.concatenate(z_chunks or [np.zeros(0, np.float32)])]
+
+    def read_las_file(self):
+        """ Read the input LiDAR file in las format. Not laz format
+        """
+        if self.laspy_version == '1':
+            self.in_file = laspy.file.File(self.in_las_path, mode='r')
+            self.scale = self.in_file.header.scale
+            self.offset = self.in_file.header.offset
+        
+        else:
+            self.in_file = laspy.read(self.in_las_path)
+            self.scale = self.in_file.header.scales
+            self.offset = self.in_file.header.offsets
+        
+        
+    def get_all_points(self):
+        """ Get points for file (points information and coordinates)
+        """
+        if self.laspy_version == '1':
+            self.points_array = self.in_file.get_points()
+        else:
+            self.points_array = self.in_file.points.array
+
+        self.points_number = len(self.in_file)
+    
+    def get_scaled_points(self):
+        """ Get the coordinates scalated
+        """
+        x = self.in_file.X
+        y = self.in_file.Y
+        z = self.in_file.Z
+        
+        self.x_dimension = x * self.scale[0] + self.offset[0]
+        self.y_dimension = y * self.scale[1] + self.offset[1]
+        self.z_dimension = z * self.scale[-1] + self.offset[-1]
+    
+    def get_classification(self):
+        """ Get the classification array of the points
+        """
+        if self.laspy_version == '1':
+            return self.in_file.Classification
+
+        return self.in_file.classification
+
+    def get_file_extent(self):
+        """ Get extent of the lidar file. Also computes the points
+            statistics of the file (see LasStatistics)
+        """
+        self.statistics = LasStatistics(self.scale, self.offset)
+        self.statistics.update(self.in_file.X, self.in_file.Y,
+                               self.get_classification(),
+                               self.in_file.return_num,
+                               self.in_file.num_returns)
+
+        self.las_file_extent = self.statistics.extent()
+    
+    # for raster_geotransform= (min(self.x_dimension, max(self.y_dimension)))
+    # or the same self.las_file_extent[2]
+        
+    def get_file_density(self):
+        """ Compute points density only with ground points -class: 2-. 
+        """
+        self.ground_points_number = self.statistics.ground_points_number
+        self.file_sup_m2 = self.statistics.surface()
+        self.density = self.statistics.density()
+        
+        # compare ground points density (filtered points by class vs filtered points by returns)
+        if self.density[
+                'ground_dens_ret'] == self.density['ground_dens_class']:
+            return True
+        else:
+            return False # pass
+        
+    def get_points_by_class(self, classif=2):
+        """ Get points array with the given classification id (ASPRS classes)
+        """
+        class_points_bool = self.get_classification() == classif
+        
+        return self.points_array[class_points_bool], class_points_bool
+        
+    def get_points_arrays(self):
+        """ Creates arrays for a given class (default=2) with the coordinates
+            of the points classificated by that class flag
+        """
+#        class_flags = 2, 3, 4, 5 para suelo, vegetación baja, media y alta respectivamente
+        if self.terrain:
+            class_2_bool = np.asarray(
+                    self.get_classification() == self.class_flag)
+            size = np.count_nonzero(class_2_bool)
+            x_array = self.x_dimension[class_2_bool].reshape(size, 1)
+            y_array = self.y_dimension[class_2_bool].reshape(size, 1)
+            z_array = self.z_dimension[class_2_bool]
+            
+        elif self.surfaces:
+            first_returns_bool = np.asarray(self.in_file.return_num == 1)
+            size = np.count_nonzero(first_returns_bool)
+            x_array = self.x_dimension[first_returns_bool].reshape(size, 1)
+            y_array = self.y_dimension[first_returns_bool].reshape(size, 1)
+            z_array = self.z_dimension[first_returns_bool]
+
+        xy_array = np.concatenate((x_array, y_array), axis=1)
+        self.lidar_arrays_list = [xy_array, z_array]
+    
+    def write_las_file(self):
+        """ Create and write a new lidar file with the desirable points
+        """ 
+        self.out_full_path = self.get_las_out_path()
+        self.files_utils.create_dir(self.out_dir)
+
+        if self.terrain:
+            points_bool = self.get_classification() == self.class_flag
+        else:
+            points_bool = self.in_file.return_num == 1
+
+        if self.laspy_version == '1':
+            out_file = laspy.file.File(self.out_full_path, mode='w', 
+                            header=self.in_file.header)
+            out_file.points = self.in_file.points[points_bool]
+            out_file.close()
+        else:
+            out_file = laspy.LasData(self.in_file.header)
+            out_file.points = self.in_file.points[points_bool]
+            out_file = laspy.convert(out_file,
+                                     point_format_id=LAS_POINT_FORMAT)
+            out_file.write(self.out_full_path)
+
+        
+
+def dem_output_path(input_file_path, out_path, terrain=False,
+                    surfaces=False):
+    """Get the full path of the DEM rasterized from a LiDAR file
+    (intermediate_results/dem folder of out_path)
+    """
+    files_utils = files_and_dirs_funs.DirAndPaths()
+    name, _ = files_utils.init(os.path.basename(input_file_path))
+    out_name = files_utils.file_templates(name)['dem'].format(name)
+    dem_dir = files_utils.set_output_dir(out_path)[0]['dem']
+
+    prefix = ''
+    if terrain:
+        prefix = 'Terrain_'
+    if surfaces:
+        prefix = 'Surfaces_'
+
+    return os.path.join(dem_dir, prefix + out_name)
+
+class RasterizeLiDAR(object):
+
+    def __init__(self, input_file_path, laspy_result, out_path, 
+                 terrain=False, surfaces=False,
+                 method='nearest', pixel_size=None):
+
+        self.lidar_arrays_list = laspy_result[0]
+        self.lidar_extent = laspy_result[1]
+        self.density = laspy_result[-1]
+        self.files_utils = files_and_dirs_funs.DirAndPaths() 
+        _, input_file = os.path.split(input_file_path)
+        name, _ = self.files_utils.init(input_file)
+        
+        self.lidar_xy_array = self.lidar_arrays_list[0]
+        self.lidar_altitudes_array = self.lidar_arrays_list[-1]
+        self.method = method
+        self.pixel_size = pixel_size
+        
+        self.files_utils.file_templates(name)
+        self.dirs = self.files_utils.set_output_dir(out_path)[0]
+        self.dem_full_path = dem_output_path(input_file_path, out_path,
+                                             terrain, surfaces)
+
+#        lidar_extent = [(max(self.x_dimension), max(self.y_dimension)), 
+#                        (max(self.x_dimension), min(self.y_dimension)), 
+#                        (min(self.x_dimension), max(self.y_dimension)), 
+#                        (min(self.x_dimension), min(self.y_dimension))]
+        
+#        if not pixel_size:
+#            # get the points density and create a pixel size that allows at least three points per pixel
+#            self.pixel_size = self.get_recommended_pixel_size(self.density)
+#        else:
+#            if self.check_pixel_size(pixel_size):
+#                self.pixel_size = pixel_size
+#            else:
+#                self.pixel_size = self.get_recommended_pixel_size(self.density)
+           
+#    def get_recommended_pixel_size(self, min_returns=3):
+#        """ Get the recomended pixel size for output raster file created
+#            from lidar data. Pixel size must contains at least 3 lidar
+#            returns
+#        """
+#        return np.round(min_returns / self.density)
+#        
+#    def check_pixel_size(self, pixel_size):
+#        """ Compare pixel size given by the user with the recomended in 
+#            accordance with the lidar file density
+#        """ 
+#        if pixel_size <= self.get_recommended_pixel_size():
+#            return False
+#    
+    def makegrid(self):
+        """ This function generates the pixel centers of the future raster,
+            as an x coordinates array (columns) and an y coordinates array
+            (rows, from north to south).
+            This is needed to interpolate between the LiDAR points
+        """
+        corner0 = self.lidar_extent[2]
+        # px_center0 = (min_x, max_y)
+        px_center0 = ((corner0[0] + self.pixel_size / 2),
+                      (corner0[1] - self.pixel_size / 2))
+        corner1 = self.lidar_extent[1]
+        # px_center1 = (max_x, min_y)
+        px_center1 = ((corner1[0] - self.pixel_size / 2),
+                      (corner1[1] + self.pixel_size / 2))
+                
+        self.grid_x = np.mgrid[px_center0[0]: px_center1[0]: self.pixel_size]
+        self.grid_y = np.mgrid[
+                px_center0[-1]: px_center1[-1]: -self.pixel_size]
+
+    def get_tile_buffer(self):
+        """ Get the distance around each tile whose points are also used to
+            interpolate the tile, so the tile edges do not show seams
+        """
+        tile_buffer = TILE_BUFFER_PIXELS * self.pixel_size
+        if self.density > 0:
+            tile_buffer = max(tile_buffer,
+                              TILE_BUFFER_SPACINGS / np.sqrt(self.density))
+
+        return tile_buffer
+
+    def interpolate_grid(self, cancel_check=None):
+        """ This function generates an interpolated array from point cloud.
+            lidar x-y points, z_values and mesh_grid is needed. 
+            The grid is interpolated in tiles of TILE_SIZE pixels, so memory
+            and time depend on the tile and not on the whole file.
+            Avaible methods are nearest, idw (inverse distance weighting),
+            linear and cubic (triangulation of the points of the tile and
+            its buffer) and min, max and mean (binning of the points of each
+            pixel). Pixels without value are NaN. cancel_check is called
+            before each tile (or chunk of binned points), it stops the
+            process raising bh_errors.ProcessCanceledError
+        """
+        if not (self.method in ('nearest', 'idw') or
+                self.method in TRIANGULATION_METHODS or
+                self.method in BINNING_METHODS):
+            raise ValueError(u"Error: Unknown interpolation method " +
+                             u"{}".format(self.method))
+
+        self.makegrid()
+        # float32, as the DEM raster (see array_2_raster)
+        interpolated_grid = np.full((len(self.grid_y), len(self.grid_x)),
+                                    np.nan, dtype=np.float32)
+
+        if self.method in BINNING_METHODS:
+            self.bin_points(interpolated_grid, cancel_check)
+            return interpolated_grid
+
+        tree = cKDTree(self.lidar_xy_array)
+        tile_buffer = self.get_tile_buffer()
+        rows, cols = interpolated_grid.shape
+        for row in range(0, rows, TILE_SIZE):
+            tile_y = self.grid_y[row:row + TILE_SIZE]
+            for col in range(0, cols, TILE_SIZE):
+                if cancel_check is not None:
+                    cancel_check()
+                tile_x = self.grid_x[col:col + TILE_SIZE]
+                interpolated_grid[row:row + len(tile_y),
+                                  col:col + len(tile_x)] = \
+                    self.interpolate_tile(tree, tile_x, tile_y, tile_buffer)
+
+        return interpolated_grid
+
+    def interpolate_tile(self, tree, tile_x, tile_y, tile_buffer):
+        """ Interpolate the pixel centers of a tile, given by its x and y
+            coordinates arrays. tree is the spatial index (KD-tree) of the
+            LiDAR x-y points
+        """
+        grid_x, grid_y = np.meshgrid(tile_x, tile_y)
+
+        if self.method in TRIANGULATION_METHODS:
+            tile_center = ((tile_x[0] + tile_x[-1]) / 2,
+                           (tile_y[0] + tile_y[-1]) / 2)
+            half_side = (max(tile_x[-1] - tile_x[0], tile_y[0] - tile_y[-1])
+                         / 2 + tile_buffer)
+            # p=inf: points inside the square tile plus its buffer
+            indexes = tree.query_ball_point(tile_center, half_side,
+                                            p=np.inf)
+            try:
+                return griddata(self.lidar_xy_array[indexes],
+                                self.lidar_altitudes_array[indexes],
+                                (grid_x, grid_y),
+                                method=self.method)
+            except (QhullError, ValueError):
+                # not enough points in the tile to triangulate
+                return np.nan
+
+        centers = np.column_stack((grid_x.ravel(), grid_y.ravel()))
+        if self.method == 'nearest':
+            _, nearest = tree.query(centers)
+            return self.lidar_altitudes_array[nearest].reshape(grid_x.shape)
+
+        # The nearest points whatever their distance, so sparse areas are
+        # interpolated too (not found only if the file has less points)
+        distances, indexes = tree.query(centers, k=IDW_NEIGHBOURS)
+        found = np.isfinite(distances)
+        weights = np.where(
+                found, 1. / np.maximum(distances, 1e-12) ** IDW_POWER, 0.)
+        altitudes = self.lidar_altitudes_array[np.where(found, indexes, 0)]
+        weights_sum = weights.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            idw = (weights * altitudes).sum(axis=1) / weights_sum
+
+        return idw.reshape(grid_x.shape)
+
+    def bin_points(self, interpolated_grid, cancel_check=None):
+        """ Fill the grid with the minimum, maximum or mean altitude of the
+            points that fall inside each pixel. The points are binned in
+            chunks of BIN_CHUNK_SIZE, cancel_check is called before each one
+        """
+        rows, cols = interpolated_grid.shape
+        grid_values = interpolated_grid.reshape(-1)
+        if self.method == 'mean':
+            sums = np.zeros(rows * cols)
+            counts = np.zeros(rows * cols)
+        x_origin, y_origin = self.lidar_extent[2] # this is min_x and max_y
+
+        for start in range(0, len(self.lidar_altitudes_array),
+                           BIN_CHUNK_SIZE):
+            if cancel_check is not None:
+                cancel_check()
+            xy_points = self.lidar_xy_array[start:start + BIN_CHUNK_SIZE]
+            altitudes = self.lidar_altitudes_array[
+                    start:start + BIN_CHUNK_SIZE]
+            cols_index = np.clip(
+                    ((xy_points[:, 0] - x_origin) / self.pixel_size).astype(
+                            np.int64), 0, cols - 1)
+            rows_index = np.clip(
+                    ((y_origin - xy_points[:, 1]) / self.pixel_size).astype(
+                            np.int64), 0, rows - 1)
+            pixels = rows_index * cols + cols_index
+
+            if self.method == 'min':
+                np.fmin.at(grid_values, pixels, altitudes)
+            elif self.method == 'max':
+                np.fmax.at(grid_values, pixels, altitudes)
+            else:
+                np.add.at(sums, pixels, altitudes)
+                np.add.at(counts, pixels, 1)
+
+        if self.method == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                grid_values[:] = sums / counts
+
+    def grid_2_raster(self, raster_array, epsg_code=None,
+                      no_data_value=-99999):
+        """ Wrap an interpolated grid into an in memory raster
+            (raster_funs.RasterData). Geotransform information is taken from
+            the input lidar file. The pixels without value (NaN) are set to
+            no_data_value, so they are masked when the DEM is shaded
+        """
+        raster_array[~np.isfinite(raster_array)] = no_data_value
+
+        projection = None
+        if epsg_code:
+            projection = self.set_crs(epsg_code).ExportToWkt()
+
+        return raster_funs.RasterData(raster_array,
+                                      self.set_raster_geotransform(),
+                                      projection, no_data_value)
+
+    def save_dem(self, dem_raster, data_type=gdalconst.GDT_Float32,
+                 output_profile=raster_funs.DEFAULT_OUTPUT_PROFILE):
+        """ Write an in memory DEM (see grid_2_raster) to dem_full_path.
+            data_type specifies the data type to be used in the output_file 
+            (types are defined in gdalconst) and output_profile the creation
+            options (see raster_funs.OUTPUT_PROFILES)
+        """
+        self.files_utils.create_dir(self.dirs['dem'])
+        return dem_raster.save(self.dem_full_path, data_type, output_profile)
+
+    def array_2_raster(self, raster_array, epsg_code=None,
+                   data_type=gdalconst.GDT_Float32, no_data_value=-99999,
+                   output_profile=raster_funs.DEFAULT_OUTPUT_PROFILE):
+        """ Create a raster file in geotiff format from a numpy array.
+            Geotransform information for the output file is taken from the 
+            input lidar file.
+            data_type specifies the data type to be used in the output_file 
+            (types are defined in gdalconst) and output_profile the creation
+            options (see raster_funs.OUTPUT_PROFILES)
+        """
+        return self.save_dem(
+                self.grid_2_raster(raster_array, epsg_code, no_data_value),
+                data_type, output_profile)
+
+    def set_raster_geotransform(self):
+        """ Set the extent for the output raster
+            geotransform = (x_origin, pixel_x, 0, y_origin, 0, pixel_y)
+            pixel_y is frecuently defined < 0
+        """
+        self.raster_origin = self.lidar_extent[2] # this is min_x and max_y
+        return (self.raster_origin[0], 
+                self.pixel_size, 
+                0, 
+                self.raster_origin[-1], 
+                0,
+                -self.pixel_size)
+    
+    def set_crs(self, epsg_code):
+        """ Set the output raster crs by a given EPSG code
+        """
+        data_set_out_SRS = osr.SpatialReference()
+        data_set_out_SRS.ImportFromEPSG(epsg_code)
+        
+        return data_set_out_SRS
@@ -1,121 +1,775 @@
-# -*- coding: utf-8 -*-
-"""
-/***************************************************************************
- Batch_Hillshader
-                                 A QGIS plugin  to generate a three light 
-                                 exposure hillshade (shaded relief by 
-                                 combining three light exposures)
-  
-    For more information, see the program documentation.
-                                 
-    If you uses as input LiDAR data, note that plugin uses LASTools library.
-        See LASTools License at  <https://rapidlasso.com/lastools/>
-        
-    Plugin also use in LiDAR data mode FUSION LDV. 
-        See FUSION LDV License at <http://forsys.cfr.washington.edu/fusion.html>
-                              -------------------
-        begin                : 2016-07-13
-        git sha              : $Format:%H$
-        copyright            : (C) 2017 by PANOimagen S.L.
-        email                : info@panoimagen.com
- ***************************************************************************/
-
-/***************************************************************************
- *                                                                         *
- *   This program is free software: you can redistribute it and/or modify  *
- *   it under the terms of the GNU General Public License as published by  *
- *   the Free Software Foundation, either version 3 of the License, or     *
- *   (at your option) any later version.                                   *
- *                                                                         *
- *   This program is distributed in the hope that it will be useful,       * 
- *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
- *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
- *   GNU General Public License for more details.                          *
- *                                                                         *
- *   You should have received a copy of the GNU General Public License     *
- *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
- ***************************************************************************/
-"""
-
-from __future__ import unicode_literals
-import scipy
-from scipy import ndimage
-from osgeo import gdal, osr
-import osgeo.gdalnumeric as gnum
-from osgeo import gdalconst
-from qgis.core import QgsRasterLayer, QgsProject
-
-def raster_2_array(raster_full_path):
-    """Read a raster dem as array
-    """
-    data_set = gdal.Open(raster_full_path)
-    data_set_band = data_set.GetRasterBand(1)
-    raster_array = gnum.BandReadAsArray(data_set_band)
-    no_data_value = data_set_band.GetNoDataValue()
-    
-    return raster_array, no_data_value
-
-def raster_erosion(raster_array, dem_array, no_data_value):
-    """ Function to eroded a raster array
-    """
-    try:
-        eroded_array = raster_array * ndimage.binary_erosion(
-                dem_array - no_data_value)
-        return eroded_array
-    
-    except TypeError:
-        # no_data_value is None, issue #3
-        return raster_array
-
-def array_2_raster(raster_array, input_template_path, output_path, 
-                   data_type=gdalconst.GDT_Byte,
-                   no_data_value=0):
-    """Create a raster file in geotiff format from a numpy array.
-
-    Geotransform information for the output file is taken from the file at
-    input_template_path.
-    data_type specifies the data type to be used in the output_file (types
-    are defined in gdalconst)
-    """
-
-    raster = gdal.Open(input_template_path)
-#    data_driver = raster.GetDriver() # Sometimes doesn't work
-    try:
-        data_driver = gdal.GetDriverByName("GTiff") # for QGIS3
-    except TypeError:
-        data_driver = gdal.GetDriverByName(b"GTiff") # for QGIS2
-    data_set_geotransform = raster.GetGeoTransform()
-    data_set_origin_x = data_set_geotransform[0]
-    data_set_origin_y = data_set_geotransform[3]
-    data_set_pixel_width = data_set_geotransform[1]
-    data_set_pixel_height = data_set_geotransform[5]
-
-    cols = raster_array.shape[1]
-    rows = raster_array.shape[0]
-
-    target_ds = data_driver.Create(
-            output_path, cols, rows, 1, data_type)
-    target_ds.SetGeoTransform((
-            data_set_origin_x, data_set_pixel_width, 0,
-            data_set_origin_y, 0, data_set_pixel_height))
-
-    data_set_out_SRS = osr.SpatialReference()
-    data_set_out_SRS.ImportFromWkt(raster.GetProjectionRef())
-    target_ds.SetProjection(data_set_out_SRS.ExportToWkt())
-    data_set_out_band = target_ds.GetRasterBand(1)
-    data_set_out_band.SetNoDataValue(no_data_value)
-    data_set_out_band.WriteArray(raster_array)
-
-    data_set_out_band.FlushCache()
-    target_ds = None
-
-def load_raster_layer(raster_full_path, raster_filename):
-        """Add the result combined hillshade to canvas.
-        """
-        rlayer = QgsRasterLayer(raster_full_path,
-                raster_filename)
-        try:
-            from qgis.core import QgsMapLayerRegistry
-            QgsMapLayerRegistry.instance().addMapLayer(rlayer)
-        except ImportError:
-            QgsProject.instance().addMapLayer(rlayer)      
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ Batch_Hillshader
+                                 A QGIS plugin  to generate a three light 
+                                 exposure hillshade (shaded relief by 
+                                 combining three light exposures)
+  
+    For more information, see the program documentation.
+                                 
+    If you uses as input LiDAR data, note that plugin uses LASTools library.
+        See LASTools License at  <https://rapidlasso.com/lastools/>
+        
+    Plugin also use in LiDAR data mode FUSION LDV. 
+        See FUSION LDV License at <http://forsys.cfr.washington.edu/fusion.html>
+                              -------------------
+        begin                : 2016-07-13
+        git sha              : $Format:%H$
+        copyright            : (C) 2017 by PANOimagen S.L.
+        email                : info@panoimagen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software: you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation, either version 3 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ *   This program is distributed in the hope that it will be useful,       * 
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+ *   GNU General Public License for more details.                          *
+ *                                                                         *
+ *   You should have received a copy of the GNU General Public License     *
+ *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
+ ***************************************************************************/
+"""
+
+from __future__ import unicode_literals
+import collections
+import copy
+import functools
+import math
+import os
+import threading
+from concurrent import futures
+import numpy
+from scipy import ndimage
+from osgeo import gdal, osr
+import osgeo.gdalnumeric as gnum
+from osgeo import gdalconst
+
+_TILED_OPTIONS = ['TILED=YES', 'BLOCKXSIZE=256', 'BLOCKYSIZE=256',
+                  'BIGTIFF=IF_SAFER']
+
+# Creation options of the output rasters. {predictor} is replaced by the
+# predictor that suits the data type (2: integers, 3: floating point)
+OUTPUT_PROFILES = {
+        'default': {'driver': 'GTiff', 'options': []},
+        'tiled': {'driver': 'GTiff', 'options': _TILED_OPTIONS},
+        'deflate': {'driver': 'GTiff',
+                    'options': _TILED_OPTIONS + ['COMPRESS=DEFLATE',
+                                                 'PREDICTOR={predictor}']},
+        'lzw': {'driver': 'GTiff',
+                'options': _TILED_OPTIONS + ['COMPRESS=LZW',
+                                             'PREDICTOR={predictor}']},
+        'zstd': {'driver': 'GTiff',
+                 'options': _TILED_OPTIONS + ['COMPRESS=ZSTD',
+                                              'PREDICTOR={predictor}']},
+        # Cloud Optimized GeoTIFF with internal overviews
+        'cog': {'driver': 'COG',
+                'options': ['COMPRESS=DEFLATE', 'PREDICTOR=YES',
+                            'OVERVIEWS=AUTO', 'RESAMPLING=AVERAGE',
+                            'BIGTIFF=IF_SAFER']}}
+DEFAULT_OUTPUT_PROFILE = 'default'
+
+# Drivers whose uncompressed rasters can be mapped in memory, see read_raster
+MMAP_DRIVERS = ('GTiff', 'ENVI', 'EHdr')
+
+# Template rasters whose georeference is kept by get_georeference
+GEO_PROFILE_CACHE_SIZE = 64
+
+# Writer threads and writes waiting to be done of an AsyncWriter
+WRITER_THREADS = 2
+WRITER_QUEUE_SIZE = 4
+
+# Overview factors of COG outputs when GDAL has no COG driver (GDAL < 3.1)
+_COG_OVERVIEW_LEVELS = [2, 4, 8, 16, 32, 64]
+# Overview factors of the rasters of a mosaic (see build_mosaic)
+MOSAIC_OVERVIEW_LEVELS = [2, 4, 8, 16, 32, 64]
+
+def raster_2_array(raster_full_path):
+    """Read a raster dem as array
+    """
+    data_set = gdal.Open(raster_full_path)
+    data_set_band = data_set.GetRasterBand(1)
+    raster_array = gnum.BandReadAsArray(data_set_band)
+    no_data_value = data_set_band.GetNoDataValue()
+    
+    return raster_array, no_data_value
+
+def mapped_band_array(data_set, data_set_band):
+    """Get a read only array of the band data mapped in memory from the
+    file (no copy), or None if the raster can not be mapped.
+
+    Only uncompressed MMAP_DRIVERS rasters are mapped, and only where GDAL
+    supports it (virtual memory API). Keep the data set referenced while
+    the array is used.
+    """
+    if data_set.GetDriver().ShortName not in MMAP_DRIVERS:
+        return None
+    if data_set.GetMetadataItem('COMPRESSION', 'IMAGE_STRUCTURE'):
+        return None
+
+    try:
+        return data_set_band.GetVirtualMemAutoArray(gdalconst.GF_Read)
+    except (AttributeError, RuntimeError, TypeError, ValueError):
+        # GDAL without virtual memory support or raster not mappable
+        return None
+
+def read_raster(raster_full_path, mmap=True):
+    """Read a raster dem as a RasterData (array, georeference and no data).
+
+    If mmap is True eligible rasters (see mapped_band_array) are mapped in
+    memory instead of read, the others are read as with raster_2_array
+    """
+    data_set, data_set_band, no_data_value = open_raster_band(
+            raster_full_path)
+    geotransform, projection = data_set_georeference(data_set)
+
+    raster_array = None
+    if mmap:
+        raster_array = mapped_band_array(data_set, data_set_band)
+    if raster_array is None:
+        raster_array = gnum.BandReadAsArray(data_set_band)
+        data_set = None
+
+    return RasterData(raster_array, geotransform, projection, no_data_value,
+                      data_set)
+
+def pixel_spacing(geotransform):
+    """Get the (rows, cols) spacing of the pixels of a geotransform
+    """
+    return abs(geotransform[5]), abs(geotransform[1])
+
+def default_z_factor(geotransform, projection, rows=0):
+    """Get the (rows, cols) factors that convert the elevations (meters) to
+    the horizontal units of the raster along each axis.
+
+    They are 1 for projected rasters. For geographic ones a degree of
+    latitude (rows) is 111320 meters and a degree of longitude (cols)
+    111320 * cos(latitude) meters, with the latitude of the center of the
+    raster (rows is the raster height)
+    """
+    if not projection:
+        return 1., 1.
+
+    data_set_SRS = osr.SpatialReference()
+    data_set_SRS.ImportFromWkt(projection)
+    if not data_set_SRS.IsGeographic():
+        return 1., 1.
+
+    latitude = geotransform[3] + geotransform[5] * rows / 2.
+    return (1. / 111320.,
+            1. / (111320. * math.cos(math.radians(latitude))))
+
+def open_raster_band(raster_full_path):
+    """Open a raster without reading its data.
+
+    Returns the data set, its first band and the band no data value. Keep
+    the data set referenced while the band is used.
+    """
+    data_set = gdal.Open(raster_full_path)
+    data_set_band = data_set.GetRasterBand(1)
+    no_data_value = data_set_band.GetNoDataValue()
+
+    return data_set, data_set_band, no_data_value
+
+# Pixels eroded around the no data areas of the DEM
+DEFAULT_EROSION_RADIUS = 1
+
+class ValidityMask(object):
+    """Pixels of a DEM with data, eroded erosion_radius pixels.
+
+    It is computed once per DEM and shared by the partial hillshades and the
+    composed hillshade. If packed is True it is kept bit packed (8 pixels
+    per byte). A DEM without no data value has every pixel valid.
+    """
+
+    def __init__(self, dem_array, no_data_value,
+                 erosion_radius=DEFAULT_EROSION_RADIUS, packed=False):
+        """Compute the mask from dem_array != no_data_value
+        """
+        # dem_array can be None when no_data_value is None
+        self.shape = None if dem_array is None else dem_array.shape
+        self.packed = packed
+        self._mask = None
+        if no_data_value is None:
+            # issue #3
+            return
+
+        mask = dem_array != no_data_value
+        if erosion_radius:
+            mask = ndimage.binary_erosion(mask, iterations=erosion_radius)
+        if packed:
+            mask = numpy.packbits(mask, axis=-1)
+        self._mask = mask
+
+    @property
+    def all_valid(self):
+        """True if every pixel is valid (the DEM has no no data value)
+        """
+        return self._mask is None
+
+    def array(self):
+        """Get the mask as a boolean array, None if every pixel is valid
+        """
+        if self._mask is None or not self.packed:
+            return self._mask
+
+        return numpy.unpackbits(self._mask, axis=-1,
+                                count=self.shape[-1]).view(bool)
+
+    def apply(self, raster_array, out=None):
+        """Set to 0 the invalid pixels of raster_array, into out if given
+        (it can be raster_array itself)
+        """
+        mask = self.array()
+        if mask is None:
+            if out is None:
+                return raster_array
+            out[...] = raster_array
+            return out
+
+        return numpy.multiply(raster_array, mask, out=out)
+
+    def crop(self, read_window, write_window):
+        """Get the mask of the write_window pixels of a DEM read with
+        read_window (see crop_to_window)
+        """
+        cropped = copy.copy(self)
+        cropped.shape = (write_window[3], write_window[2])
+        cropped.packed = False
+        if self._mask is not None:
+            cropped._mask = crop_to_window(self.array(), read_window,
+                                           write_window)
+
+        return cropped
+
+def erosion_mask(dem_array, no_data_value):
+    """Get the boolean mask of the DEM pixels with data, eroded one pixel.
+
+    Returns None if no_data_value is None (every pixel has data)
+    """
+    return ValidityMask(dem_array, no_data_value).array()
+
+def raster_erosion(raster_array, dem_array, no_data_value):
+    """ Function to eroded a raster array
+    """
+    return ValidityMask(dem_array, no_data_value).apply(raster_array)
+
+def raster_shape(raster_full_path):
+    """Get the (rows, cols) size of a raster without reading its data
+    """
+    data_set = gdal.Open(raster_full_path)
+
+    return data_set.RasterYSize, data_set.RasterXSize
+
+def block_windows(rows, cols, block_size, halo=1):
+    """Split a raster of rows x cols pixels in square blocks.
+
+    Yields (read_window, write_window) pairs, both as
+    (xoff, yoff, xsize, ysize) tuples. The read window is the write window
+    grown by halo pixels on each side (clipped to the raster), so
+    neighbourhood operations (gradient, erosion) give the same values at
+    the block edges as when the whole raster is processed.
+    """
+    for row in range(0, rows, block_size):
+        block_rows = min(block_size, rows - row)
+        for col in range(0, cols, block_size):
+            block_cols = min(block_size, cols - col)
+            write_window = (col, row, block_cols, block_rows)
+            yield (halo_window(write_window, rows, cols, halo),
+                   write_window)
+
+def halo_window(write_window, rows, cols, halo=1):
+    """Grow a (xoff, yoff, xsize, ysize) window of a raster of rows x cols
+    pixels by halo pixels on each side, clipped to the raster
+    """
+    col, row, window_cols, window_rows = write_window
+    read_col = max(col - halo, 0)
+    read_row = max(row - halo, 0)
+    read_cols = min(col + window_cols + halo, cols) - read_col
+    read_rows = min(row + window_rows + halo, rows) - read_row
+
+    return read_col, read_row, read_cols, read_rows
+
+def crop_to_window(block_array, read_window, write_window):
+    """Crop an array read with read_window to the pixels of write_window
+    """
+    col = write_window[0] - read_window[0]
+    row = write_window[1] - read_window[1]
+
+    return block_array[row:row + write_window[3], col:col + write_window[2]]
+
+def raster_footprint(raster_full_path):
+    """Get the (min_x, min_y, max_x, max_y) extent of a north up raster
+    without reading its data
+    """
+    data_set = gdal.Open(raster_full_path)
+    geotransform = data_set.GetGeoTransform()
+    corner_x = geotransform[0] + data_set.RasterXSize * geotransform[1]
+    corner_y = geotransform[3] + data_set.RasterYSize * geotransform[5]
+
+    return (min(geotransform[0], corner_x), min(geotransform[3], corner_y),
+            max(geotransform[0], corner_x), max(geotransform[3], corner_y))
+
+def build_vrt(vrt_path, raster_paths, no_data_value=None):
+    """Build a GDAL virtual mosaic (VRT) of rasters with the same pixel size
+    and return it open. no_data_value is set to the mosaic pixels without
+    data, the rasters no data value is used if it is not given
+    """
+    options = {}
+    if no_data_value is not None:
+        options['VRTNodata'] = no_data_value
+    vrt = gdal.BuildVRT(vrt_path, list(raster_paths),
+                        options=gdal.BuildVRTOptions(**options))
+    if vrt is None:
+        raise ValueError(u"Error: The virtual mosaic {} could not be "
+                         u"created".format(vrt_path))
+
+    return vrt
+
+def build_overviews(raster_full_path, levels=MOSAIC_OVERVIEW_LEVELS,
+                    resampling='AVERAGE'):
+    """Build the overviews of a raster file in an external .ovr file, if it
+    has none yet (i.e. COG outputs have internal overviews). Levels smaller
+    than one pixel are left out
+    """
+    data_set = gdal.Open(raster_full_path)
+    if data_set.GetRasterBand(1).GetOverviewCount():
+        return
+
+    size = min(data_set.RasterXSize, data_set.RasterYSize)
+    levels = [level for level in levels if level <= size]
+    if levels:
+        data_set.BuildOverviews(resampling, levels)
+
+def build_mosaic(vrt_path, raster_paths, threads=1,
+                 levels=MOSAIC_OVERVIEW_LEVELS):
+    """Build a virtual mosaic (VRT) file of several rasters, to use them as
+    a single layer.
+
+    The overviews of the rasters are built first, several at the same time
+    with threads > 1. The VRT has no overviews of its own so GDAL uses the
+    rasters ones (implicit overviews). Returns vrt_path
+    """
+    build = functools.partial(build_overviews, levels=levels)
+    with futures.ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        # list: raise the first error, if any
+        list(executor.map(build, raster_paths))
+
+    vrt = build_vrt(vrt_path, raster_paths)
+    # Written to disk when closed
+    vrt = None
+
+    return vrt_path
+
+def read_with_halo(raster_full_path, neighbour_paths, halo=1,
+                   no_data_value=None):
+    """Read a raster tile grown by halo pixels on each side with the data
+    of its neighbour tiles (same pixel size and grid).
+
+    The tiles are read through an in memory VRT mosaic. Returns
+    (halo_raster, read_window, write_window): halo_raster is the RasterData
+    of the grown tile and the windows are as in block_windows (use
+    crop_to_window to get the tile pixels back). If the tile has its own no
+    data value the pixels that no tile covers are no data, as in a mosaic
+    of the tiles. Otherwise no_data_value only marks them while they are
+    read: they are filled with the nearest tile pixels (see fill_uncovered)
+    and the halo raster has no no data value, so the tile is shaded and
+    masked as a DEM without no data
+    """
+    data_set, _, tile_no_data = open_raster_band(raster_full_path)
+    tile_geotransform, projection = data_set_georeference(data_set)
+    tile_cols, tile_rows = data_set.RasterXSize, data_set.RasterYSize
+    data_set = None
+    has_no_data = tile_no_data is not None
+    if has_no_data:
+        no_data_value = tile_no_data
+
+    vrt_path = '/vsimem/{}_{}_halo.vrt'.format(
+            os.path.splitext(os.path.basename(raster_full_path))[0],
+            threading.get_ident())
+    vrt = build_vrt(vrt_path, [raster_full_path] + list(neighbour_paths),
+                    no_data_value)
+    try:
+        vrt_geotransform = vrt.GetGeoTransform()
+        col = int(round((tile_geotransform[0] - vrt_geotransform[0]) /
+                        vrt_geotransform[1]))
+        row = int(round((tile_geotransform[3] - vrt_geotransform[3]) /
+                        vrt_geotransform[5]))
+        write_window = (col, row, tile_cols, tile_rows)
+        read_window = halo_window(write_window, vrt.RasterYSize,
+                                  vrt.RasterXSize, halo)
+        halo_array = vrt.GetRasterBand(1).ReadAsArray(*read_window)
+    finally:
+        vrt = None
+        gdal.Unlink(vrt_path)
+
+    if not has_no_data and no_data_value is not None:
+        halo_array = fill_uncovered(halo_array, halo_array == no_data_value)
+        no_data_value = None
+
+    halo_geotransform = (
+            tile_geotransform[0] +
+            (read_window[0] - col) * tile_geotransform[1],
+            tile_geotransform[1], 0,
+            tile_geotransform[3] +
+            (read_window[1] - row) * tile_geotransform[5],
+            0, tile_geotransform[5])
+
+    return (RasterData(halo_array, halo_geotransform, projection,
+                       no_data_value),
+            read_window, write_window)
+
+def fill_uncovered(halo_array, uncovered):
+    """Fill the uncovered pixels of a halo array (e.g. where a neighbour
+    tile is missing) with the value of the nearest covered pixel, as the
+    edge pixels are repeated past the border of a DEM
+    """
+    if not uncovered.any():
+        return halo_array
+
+    nearest = ndimage.distance_transform_edt(uncovered,
+                                             return_distances=False,
+                                             return_indices=True)
+    return halo_array[tuple(nearest)]
+
+def get_driver(driver_name):
+    """Get a GDAL driver by its name
+    """
+    try:
+        return gdal.GetDriverByName(driver_name) # for QGIS3
+    except TypeError:
+        return gdal.GetDriverByName(driver_name.encode()) # for QGIS2
+
+def get_creation_options(output_profile, data_type):
+    """Get the GTiff creation options of an output profile (see
+    OUTPUT_PROFILES) for the given data type
+    """
+    if data_type in (gdalconst.GDT_Float32, gdalconst.GDT_Float64):
+        predictor = 3
+    else:
+        predictor = 2
+
+    return [option.format(predictor=predictor)
+            for option in OUTPUT_PROFILES[output_profile]['options']]
+
+class OutputRaster(object):
+    """Single band raster file, written at once or block by block.
+
+    The creation options come from an output profile (see OUTPUT_PROFILES).
+    Call close when every block is written, or discard if the process fails.
+    """
+
+    def __init__(self, output_path, cols, rows, geotransform, projection,
+                 data_type=gdalconst.GDT_Byte, no_data_value=0,
+                 output_profile=DEFAULT_OUTPUT_PROFILE):
+        """Create the raster with the given geotransform and projection (wkt)
+        """
+        self.output_path = output_path
+        self.output_profile = output_profile
+
+        if OUTPUT_PROFILES[output_profile]['driver'] == 'COG':
+            # COG is a copy only driver: a temporal tiled geotiff is written
+            # and converted on close
+            self.data_set_path = output_path + '.tmp.tif'
+            options = _TILED_OPTIONS
+        else:
+            self.data_set_path = output_path
+            options = get_creation_options(output_profile, data_type)
+
+        data_driver = get_driver("GTiff")
+        self.data_set = data_driver.Create(
+                self.data_set_path, cols, rows, 1, data_type,
+                options=options)
+        self.data_set.SetGeoTransform(geotransform)
+        if projection:
+            self.data_set.SetProjection(projection)
+        if no_data_value is not None:
+            self.data_set.GetRasterBand(1).SetNoDataValue(no_data_value)
+
+    def write(self, raster_array, xoff=0, yoff=0):
+        """Write an array with its upper left pixel at (xoff, yoff)
+        """
+        self.data_set.GetRasterBand(1).WriteArray(raster_array, xoff, yoff)
+
+    def close(self):
+        """Flush and close the file. Cloud Optimized GeoTIFFs are created
+        here from the temporal geotiff
+        """
+        self.data_set.FlushCache()
+        self.data_set = None
+        if self.data_set_path == self.output_path:
+            return
+
+        temp_ds = gdal.Open(self.data_set_path)
+        cog_driver = get_driver("COG")
+        if cog_driver is not None:
+            cog_ds = cog_driver.CreateCopy(
+                    self.output_path, temp_ds,
+                    options=OUTPUT_PROFILES[self.output_profile]['options'])
+        else:
+            # GDAL < 3.1: tiled geotiff with internal overviews
+            temp_ds.BuildOverviews('AVERAGE', _COG_OVERVIEW_LEVELS)
+            cog_ds = get_driver("GTiff").CreateCopy(
+                    self.output_path, temp_ds,
+                    options=get_creation_options(
+                            'deflate', temp_ds.GetRasterBand(1).DataType) +
+                            ['COPY_SRC_OVERVIEWS=YES'])
+        cog_ds = None
+        temp_ds = None
+        get_driver("GTiff").Delete(self.data_set_path)
+
+    def discard(self):
+        """Close the file, if it is still open, and remove it (e.g. the
+        process failed before every block was written), so an unfinished
+        raster is never taken for a result
+        """
+        self.data_set = None
+        for file_path in {self.data_set_path, self.output_path}:
+            if os.path.exists(file_path):
+                get_driver("GTiff").Delete(file_path)
+
+class AsyncWriter(object):
+    """Run raster writes in background threads.
+
+    submit queues a write (any function, e.g. array_2_raster) and returns at
+    once, so the next exposure or block is shaded while GDAL encodes the
+    previous one. When queue_size writes are pending submit waits for one
+    to end (backpressure). The first write error is raised by the next
+    submit or by flush (fail fast). Used as a context manager, every write
+    is flushed on exit.
+
+    Writes to the same data set (e.g. OutputRaster blocks) must use a single
+    thread, so they run in the submit order.
+    """
+
+    def __init__(self, threads=WRITER_THREADS, queue_size=WRITER_QUEUE_SIZE):
+        """Start the writer threads
+        """
+        self._executor = futures.ThreadPoolExecutor(max_workers=threads)
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._error = None
+
+    def submit(self, function, *args, **kwargs):
+        """Queue the call function(*args, **kwargs)
+        """
+        self._raise_error()
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(function, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._write_done)
+
+    def _write_done(self, future):
+        """Free the queue slot of a finished write and keep its error
+        """
+        with self._lock:
+            self._pending.discard(future)
+            if (self._error is None and not future.cancelled()
+                    and future.exception() is not None):
+                self._error = future.exception()
+        self._slots.release()
+
+    def _raise_error(self):
+        """Raise the first write error, if any
+        """
+        if self._error is not None:
+            raise self._error
+
+    def flush(self):
+        """Wait for every queued write and raise the first write error
+        """
+        with self._lock:
+            pending = list(self._pending)
+        futures.wait(pending)
+        self._raise_error()
+
+    def close(self):
+        """Flush the writes and stop the writer threads
+        """
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # The process already failed, its error is the one raised
+            self._executor.shutdown(wait=True)
+
+class RasterData(object):
+    """Single band raster kept in memory: the array and its georeference.
+
+    It carries a raster between the process stages without writing it to
+    disk. Use save to write it and to_dataset when a GDAL data set is needed
+    """
+
+    def __init__(self, array, geotransform, projection=None,
+                 no_data_value=None, data_set=None):
+        """geotransform is a GDAL geotransform and projection a wkt string.
+        data_set is the GDAL data set array is mapped from (see read_raster),
+        kept open while the RasterData is used
+        """
+        self.array = array
+        self.geotransform = geotransform
+        self.projection = projection
+        self.no_data_value = no_data_value
+        self.data_set = data_set
+
+    def to_dataset(self, data_type=None):
+        """Get a GDAL MEM data set that uses the array memory (no copy if
+        data_type matches the array type)
+        """
+        array = self.array
+        if data_type is not None:
+            array = array.astype(
+                    gnum.GDALTypeCodeToNumericTypeCode(data_type),
+                    copy=False)
+        data_set = gnum.OpenArray(array)
+        data_set.SetGeoTransform(self.geotransform)
+        if self.projection:
+            data_set.SetProjection(self.projection)
+        if self.no_data_value is not None:
+            data_set.GetRasterBand(1).SetNoDataValue(self.no_data_value)
+
+        return data_set
+
+    def save(self, output_path, data_type=gdalconst.GDT_Float32,
+             output_profile=DEFAULT_OUTPUT_PROFILE):
+        """Write the raster to output_path with the given data type and
+        output profile (see OUTPUT_PROFILES). Returns output_path
+        """
+        cog_driver = None
+        if OUTPUT_PROFILES[output_profile]['driver'] == 'COG':
+            cog_driver = get_driver("COG")
+
+        if cog_driver is not None:
+            # Copied straight from memory, no temporal geotiff
+            cog_ds = cog_driver.CreateCopy(
+                    output_path, self.to_dataset(data_type),
+                    options=OUTPUT_PROFILES[output_profile]['options'])
+            cog_ds = None
+            return output_path
+
+        rows, cols = self.array.shape
+        output_raster = OutputRaster(output_path, cols, rows,
+                                     self.geotransform, self.projection,
+                                     data_type, self.no_data_value,
+                                     output_profile)
+        output_raster.write(self.array)
+        output_raster.close()
+
+        return output_path
+
+class GeoProfile(collections.namedtuple('GeoProfile',
+                                        ['geotransform', 'projection'])):
+    """Georeference of a raster: GDAL geotransform and projection wkt.
+
+    Resolved once per input (see get_georeference) and given to every
+    writer of its results as their template.
+    """
+    __slots__ = ()
+
+def get_georeference(input_template):
+    """Get the GeoProfile of a raster file, a RasterData or a GeoProfile.
+
+    Raster files are opened only the first time, their profile is kept in
+    a cache keyed by the file path, modification time and size
+    """
+    if isinstance(input_template, GeoProfile):
+        return input_template
+    if isinstance(input_template, RasterData):
+        return GeoProfile(input_template.geotransform,
+                          input_template.projection)
+
+    try:
+        file_stat = os.stat(input_template)
+    except OSError:
+        # GDAL virtual file systems paths
+        return data_set_georeference(gdal.Open(input_template))
+
+    return _file_georeference(os.path.abspath(input_template),
+                              file_stat.st_mtime, file_stat.st_size)
+
+@functools.lru_cache(maxsize=GEO_PROFILE_CACHE_SIZE)
+def _file_georeference(raster_full_path, modification_time, size):
+    """Cached GeoProfile of a raster file, see get_georeference
+    """
+    return data_set_georeference(gdal.Open(raster_full_path))
+
+def data_set_georeference(raster):
+    """Get the GeoProfile of an open GDAL data set
+    """
+    data_set_geotransform = raster.GetGeoTransform()
+    data_set_origin_x = data_set_geotransform[0]
+    data_set_origin_y = data_set_geotransform[3]
+    data_set_pixel_width = data_set_geotransform[1]
+    data_set_pixel_height = data_set_geotransform[5]
+
+    projection = raster.GetProjectionRef()
+    if projection:
+        data_set_SRS = osr.SpatialReference()
+        data_set_SRS.ImportFromWkt(projection)
+        projection = data_set_SRS.ExportToWkt()
+
+    return GeoProfile((data_set_origin_x, data_set_pixel_width, 0,
+                       data_set_origin_y, 0, data_set_pixel_height),
+                      projection)
+
+def create_raster(input_template, output_path, cols, rows,
+                  data_type=gdalconst.GDT_Byte, no_data_value=0,
+                  output_profile=DEFAULT_OUTPUT_PROFILE):
+    """Create an empty raster georeferenced as input_template (a raster
+    file path, a RasterData or a GeoProfile). Returns an OutputRaster
+    """
+    geotransform, projection = get_georeference(input_template)
+
+    return OutputRaster(output_path, cols, rows, geotransform, projection,
+                        data_type, no_data_value, output_profile)
+
+def array_2_raster(raster_array, input_template, output_path, 
+                   data_type=gdalconst.GDT_Byte,
+                   no_data_value=0, output_profile=DEFAULT_OUTPUT_PROFILE):
+    """Create a raster file in geotiff format from a numpy array.
+
+    Geotransform information for the output file is taken from
+    input_template, the path of a raster file, a RasterData or a
+    GeoProfile.
+    data_type specifies the data type to be used in the output_file (types
+    are defined in gdalconst) and output_profile the creation options (see
+    OUTPUT_PROFILES)
+    """
+    geotransform, projection = get_georeference(input_template)
+    RasterData(raster_array, geotransform, projection,
+               no_data_value).save(output_path, data_type, output_profile)
+
+def load_raster_layer(raster_full_path, raster_filename):
+        """Add the result combined hillshade to canvas.
+
+        QGIS is only imported here, so the rest of the module can be used
+        without QGIS (see batch_processing and __main__)
+        """
+        from qgis.core import QgsRasterLayer, QgsProject
+        rlayer = QgsRasterLayer(raster_full_path,
+                raster_filename)
+        try:
+            from qgis.core import QgsMapLayerRegistry
+            QgsMapLayerRegistry.instance().addMapLayer(rlayer)
+        except ImportError:
+            QgsProject.instance().addMapLayer(rlayer)      
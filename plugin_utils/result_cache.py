@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ Batch_Hillshader
+                                 A QGIS plugin  to generate a three light
+                                 exposure hillshade (shaded relief by
+                                 combining three light exposures)
+
+    For more information, see the program documentation.
+
+    Plugin uses LASzip, see <https://laszip.org/>
+                              -------------------
+        begin                : 2016-07-13
+        git sha              : $Format:%H$
+        copyright            : (C) 2017 by PANOimagen S.L.
+        email                : info@panoimagen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software: you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation, either version 3 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ *   This program is distributed in the hope that it will be useful,       *
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+ *   GNU General Public License for more details.                          *
+ *                                                                         *
+ *   You should have received a copy of the GNU General Public License     *
+ *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
+ ***************************************************************************/
+"""
+
+from __future__ import unicode_literals
+import hashlib
+import json
+import os
+import threading
+
+import numpy
+
+from . import raster_funs
+
+# Changing it invalidates every cached result (i.e. after a change in the
+# shading code that changes the results)
+CACHE_VERSION = 1
+# Name of the cache folder created by the plugin dialog in the output folder
+CACHE_FOLDER_NAME = 'hillshader_cache'
+# Bytes read at once when the content hash of an input file is computed
+HASH_CHUNK_SIZE = 2 ** 22
+# Default size limit of the cache (bytes), see ResultCache.prune
+DEFAULT_MAX_SIZE = 10 * 2 ** 30
+
+class ResultCache(object):
+    """Persistent on disk cache of the process results.
+
+    Each result is stored under a key that is the hash of everything it
+    depends on (the input file fingerprint and the parameters of every stage
+    up to it), so unchanged inputs and parameters skip the recomputation and
+    a changed parameter only runs again the stages that depend on it. The
+    arrays are stored as .npy files (mapped in memory when read) and the
+    raster georeference, if any, in a .json file next to them. The least
+    recently used results are removed when the cache grows over max_size
+    (see prune).
+    """
+
+    def __init__(self, cache_dir, content_hash=False,
+                 max_size=DEFAULT_MAX_SIZE):
+        """cache_dir is created if it does not exist. With content_hash the
+        input files are identified by the hash of their content, not only by
+        their name, size and modification time. max_size is the size limit
+        of the cache in bytes
+        """
+        self.cache_dir = cache_dir
+        self.content_hash = content_hash
+        self.max_size = max_size
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def fingerprint(self, file_path):
+        """Get the fingerprint of an input file: its name, size and
+        modification time, and the hash of its content if content_hash
+        """
+        stat = os.stat(file_path)
+        fingerprint = [os.path.basename(file_path), stat.st_size,
+                       stat.st_mtime_ns]
+        if self.content_hash:
+            sha = hashlib.sha1()
+            with open(file_path, 'rb') as input_file:
+                for chunk in iter(lambda: input_file.read(HASH_CHUNK_SIZE),
+                                  b''):
+                    sha.update(chunk)
+            fingerprint.append(sha.hexdigest())
+
+        return fingerprint
+
+    def key(self, *parts):
+        """Get the cache key of a result from the parts it depends on
+        (fingerprints, parameters or other keys, json serializable)
+        """
+        description = json.dumps([CACHE_VERSION] + list(parts),
+                                 sort_keys=True, default=str)
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+    def path(self, key, extension='.npy'):
+        """Get the path of a cached file, the results are spread in
+        subfolders by the first characters of their key
+        """
+        return os.path.join(self.cache_dir, key[:2], key + extension)
+
+    def get_array(self, key):
+        """Get a cached array, None if it is not in the cache. The array is
+        mapped in memory copy on write: changing it does not change the cache
+        """
+        array_path = self.path(key)
+        if not os.path.exists(array_path):
+            return None
+        try:
+            array = numpy.load(array_path, mmap_mode='c')
+            # Recently used, the last result to be pruned
+            os.utime(array_path)
+        except (IOError, OSError, ValueError):
+            # Damaged or pruned file, computed again and replaced
+            return None
+
+        return array
+
+    def put_array(self, key, array):
+        """Store an array in the cache
+        """
+        with _ReplacingFile(self.path(key)) as array_file:
+            numpy.save(array_file, numpy.asarray(array))
+
+    def get_raster(self, key):
+        """Get a cached raster as a raster_funs.RasterData, None if it is
+        not in the cache
+        """
+        array = self.get_array(key)
+        if array is None:
+            return None
+        try:
+            with open(self.path(key, '.json')) as meta_file:
+                meta = json.load(meta_file)
+        except (IOError, ValueError):
+            return None
+
+        return raster_funs.RasterData(array, tuple(meta['geotransform']),
+                                      meta['projection'],
+                                      meta['no_data_value'])
+
+    def put_raster(self, key, raster_data):
+        """Store a raster_funs.RasterData in the cache
+        """
+        meta = {'geotransform': list(raster_data.geotransform),
+                'projection': raster_data.projection,
+                'no_data_value': raster_data.no_data_value}
+        # The georeference goes first: the array marks the result as cached
+        with _ReplacingFile(self.path(key, '.json'), 'w') as meta_file:
+            json.dump(meta, meta_file, default=float)
+        self.put_array(key, raster_data.array)
+
+    def prune(self):
+        """Remove the least recently used results (by the modification time
+        of their files, updated when they are read) until the cache is not
+        bigger than max_size
+        """
+        results = {}
+        for folder, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    # Being written
+                    continue
+                file_path = os.path.join(folder, filename)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                key = filename.split('.')[0]
+                size, used, paths = results.get(key, (0, 0, []))
+                results[key] = (size + stat.st_size,
+                                max(used, stat.st_mtime),
+                                paths + [file_path])
+
+        total_size = sum(size for size, _, _ in results.values())
+        for size, _, paths in sorted(results.values(),
+                                     key=lambda result: result[1]):
+            if total_size <= self.max_size:
+                break
+            for file_path in paths:
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    # Already removed by another process
+                    pass
+            total_size -= size
+
+class _ReplacingFile(object):
+    """Context manager that writes a temporary file and moves it to its
+    final path on success, so other processes never read a half written
+    result
+    """
+
+    def __init__(self, file_path, mode='wb'):
+        self.file_path = file_path
+        self.temp_path = '{}.{}.{}.tmp'.format(file_path, os.getpid(),
+                                                threading.get_ident())
+        folder = os.path.dirname(file_path)
+        if not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        self.file = open(self.temp_path, mode)
+
+    def __enter__(self):
+        return self.file
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.temp_path, self.file_path)
+        else:
+            os.remove(self.temp_path)
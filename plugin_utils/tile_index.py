@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ Batch_Hillshader
+                                 A QGIS plugin  to generate a three light
+                                 exposure hillshade (shaded relief by
+                                 combining three light exposures)
+
+    For more information, see the program documentation.
+
+    Plugin uses LASzip, see <https://laszip.org/>
+                              -------------------
+        begin                : 2016-07-13
+        git sha              : $Format:%H$
+        copyright            : (C) 2017 by PANOimagen S.L.
+        email                : info@panoimagen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software: you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation, either version 3 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ *   This program is distributed in the hope that it will be useful,       *
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+ *   GNU General Public License for more details.                          *
+ *                                                                         *
+ *   You should have received a copy of the GNU General Public License     *
+ *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
+ ***************************************************************************/
+"""
+
+from __future__ import unicode_literals
+import numpy
+
+from . import raster_funs
+
+class TileIndex(object):
+    """Spatial index of the footprints of a set of raster tiles (i.e. the
+    DEMs of a tiled delivery), to find the neighbours of each tile.
+
+    The footprints are read once, without reading the rasters data, and
+    kept in an array so each query checks every tile at once.
+    """
+
+    def __init__(self, raster_paths):
+        """raster_paths are the tiles, north up rasters
+        """
+        self.paths = list(raster_paths)
+        self.footprints = numpy.array(
+                [raster_funs.raster_footprint(raster_path)
+                 for raster_path in self.paths],
+                dtype=numpy.float64).reshape(-1, 4)
+
+    def intersecting(self, bounds):
+        """Get the paths of the tiles that intersect or touch a
+        (min_x, min_y, max_x, max_y) extent
+        """
+        min_x, min_y, max_x, max_y = bounds
+        footprints = self.footprints
+        hits = ((footprints[:, 0] <= max_x) & (footprints[:, 2] >= min_x) &
+                (footprints[:, 1] <= max_y) & (footprints[:, 3] >= min_y))
+
+        return [self.paths[index] for index in numpy.flatnonzero(hits)]
+
+    def neighbours(self, raster_path, margin=0.):
+        """Get the paths of the tiles closer than margin (map units) to a
+        tile of the index, itself excluded
+        """
+        min_x, min_y, max_x, max_y = self.footprints[
+                self.paths.index(raster_path)]
+
+        return [path for path in self.intersecting(
+                        (min_x - margin, min_y - margin,
+                         max_x + margin, max_y + margin))
+                if path != raster_path]
+
+def tile_neighbours(raster_paths, halo=1):
+    """Get a dictionary with the neighbour tiles of each raster path: the
+    ones that give data to its halo (halo pixels around it)
+    """
+    index = TileIndex(raster_paths)
+    neighbours = {}
+    for raster_path in index.paths:
+        geotransform, _ = raster_funs.get_georeference(raster_path)
+        margin = halo * max(raster_funs.pixel_spacing(geotransform))
+        neighbours[raster_path] = index.neighbours(raster_path, margin)
+
+    return neighbours
@@ -1,167 +1,704 @@
-# -*- coding: utf-8 -*-
-"""
-/***************************************************************************
- Batch_Hillshader
-                                 A QGIS plugin  to generate a three light
-                                 exposure hillshade (shaded relief by
-                                 combining three light exposures)
-
-    For more information, see the program documentation.
-
-    Plugin uses LASzip, see <https://laszip.org/>
-                              -------------------
-        begin                : 2016-07-13
-        git sha              : $Format:%H$
-        copyright            : (C) 2017 by PANOimagen S.L.
-        email                : info@panoimagen.com
- ***************************************************************************/
-
-/***************************************************************************
- *                                                                         *
- *   This program is free software: you can redistribute it and/or modify  *
- *   it under the terms of the GNU General Public License as published by  *
- *   the Free Software Foundation, either version 3 of the License, or     *
- *   (at your option) any later version.                                   *
- *                                                                         *
- *   This program is distributed in the hope that it will be useful,       *
- *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
- *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
- *   GNU General Public License for more details.                          *
- *                                                                         *
- *   You should have received a copy of the GNU General Public License     *
- *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
- ***************************************************************************/
-"""
-import unittest
-import tempfile
-import os
-
-from qgis.core import QgsApplication
-
-import hillshader_process
-import hillshade
-import bandCalc
-
-from plugin_utils import raster_funs
-
-class DEMProcessTestCase(unittest.TestCase):
-
-    def setUp(self):
-        """Initializing input data and dictionaries
-        """
-        self.input_dem_file = '.\\test_data\\dem_input'
-        ext = '.tif'
-        # ext = '.asc'
-        self.input_dem = self.input_dem_file + ext
-
-        hillshade_params = {}
-        hillshade_params['azimuth1'] = 350
-        hillshade_params['azimuth2'] = 15
-        hillshade_params['azimuth3'] = 270
-        hillshade_params['angle_altitude1'] = 70
-        hillshade_params['angle_altitude2'] = 60
-        hillshade_params['angle_altitude3'] = 55
-        hillshade_params['transparency1'] = 50
-        hillshade_params['transparency2'] = 65
-        hillshade_params['transparency3'] = 70
-        self.hill_params = hillshade_params
-
-    def test_input(self):
-        """Test for input data
-        """
-        self.assertTrue(os.path.exists(self.input_dem))
-
-    def test_generating_hillshades_array(self):
-        """test generating partial hillshades arrays from dem
-        """
-        dem_array = raster_funs.raster_2_array(self.input_dem)
-        hillshade_1 = hillshade.hillshade(dem_array,
-                                          self.hill_params['azimuth1'],
-                                          self.hill_params['angle_altitude1'])
-        hillshade_2 = hillshade.hillshade(dem_array,
-                                          self.hill_params['azimuth2'],
-                                          self.hill_params['angle_altitude2'])
-        hillshade_3 = hillshade.hillshade(dem_array,
-                                          self.hill_params['azimuth3'],
-                                          self.hill_params['angle_altitude3'])
-
-        self.assertIsNotNone(hillshade_1)
-        self.assertIsNotNone(hillshade_2)
-        self.assertIsNotNone(hillshade_3)
-
-    def test_generating_hillshades_raster(self):
-        """test generating partial hillshades rasters from dem
-        """
-        temp_dir = tempfile.mkdtemp()
-
-        output_folder = os.path.join(temp_dir,'hillshader_results')
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
-
-        array = raster_funs.raster_2_array(self.input_dem)
-
-        raster_funs.array_2_raster(array,
-                                   self.input_dem,
-                                   os.path.join(output_folder, 'file.tif'))
-
-        self.assertTrue(os.path.exists(
-                os.path.join(output_folder, 'file.tif')))
-
-    def test_combinig_hillshades_arrays(self):
-        """test combining arrays (band calculator)
-        """
-        dem_array = raster_funs.raster_2_array(self.input_dem)
-        hillshade_1_array = hillshade.hillshade(dem_array,
-                                          self.hill_params['azimuth1'],
-                                          self.hill_params['angle_altitude1'])
-        hillshade_2_array = hillshade.hillshade(dem_array,
-                                          self.hill_params['azimuth2'],
-                                          self.hill_params['angle_altitude2'])
-        hillshade_3_array = hillshade.hillshade(dem_array,
-                                          self.hill_params['azimuth3'],
-                                          self.hill_params['angle_altitude3'])
-
-        combined_array = bandCalc.merge_arrays(
-                [hillshade_1_array, hillshade_2_array, hillshade_3_array],
-                [self.hill_params['transparency1'],
-                 self.hill_params['transparency2'],
-                 self.hill_params['transparency3']])
-
-        output_folder = os.path.join(tempfile.mkdtemp(),
-                                          'hillshader_results')
-        if not os.path.exists(output_folder):
-            os.mkdir(output_folder)
-
-        out_put = os.path.join(output_folder, 'combined_hillshade.tif')
-        raster_funs.array_2_raster(combined_array, self.input_dem, out_put)
-
-        self.assertTrue(os.path.exists(out_put))
-
-        self.assertNotAlmostEquals(0, combined_array.any())
-        self.assertEqual(combined_array.shape, (100, 100))
-        self.assertAlmostEqual(int(combined_array.max()), 255)
-        self.assertAlmostEqual(int(combined_array.min()), 0)
-        self.assertAlmostEqual(int(combined_array.mean()), 255/2)
-
-    def tearDown(self):
-        pass
-
-def qgis_app_init():
-    from qgis.PyQt import QtWidgets
-    import os
-    import atexit
-    atexit.register(QgsApplication.exitQgis)
-
-    app = QtWidgets.QApplication([])
-    qgis_prefix = os.getenv("QGIS_PREFIX_PATH")
-    # Initialize qgis libraries
-    QgsApplication.setPrefixPath(qgis_prefix, True)
-    QgsApplication.initQgis()
-    return app
-
-
-app = qgis_app_init()
-
-if __name__ == "__main__":
-
-    unittest.main()
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ Batch_Hillshader
+                                 A QGIS plugin  to generate a three light
+                                 exposure hillshade (shaded relief by
+                                 combining three light exposures)
+
+    For more information, see the program documentation.
+
+    Plugin uses LASzip, see <https://laszip.org/>
+                              -------------------
+        begin                : 2016-07-13
+        git sha              : $Format:%H$
+        copyright            : (C) 2017 by PANOimagen S.L.
+        email                : info@panoimagen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software: you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation, either version 3 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ *   This program is distributed in the hope that it will be useful,       *
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+ *   GNU General Public License for more details.                          *
+ *                                                                         *
+ *   You should have received a copy of the GNU General Public License     *
+ *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
+ ***************************************************************************/
+"""
+import unittest
+import tempfile
+import os
+
+import numpy
+
+from qgis.core import QgsApplication
+
+import hillshader_process
+import batch_processing
+import hillshade
+import bandCalc
+import fused_shading
+import bh_errors
+
+from plugin_utils import raster_funs
+from plugin_utils import result_cache
+from plugin_utils import tile_index
+
+class DEMProcessTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Initializing input data and dictionaries
+        """
+        self.input_dem_file = '.\\test_data\\dem_input'
+        ext = '.tif'
+        # ext = '.asc'
+        self.input_dem = self.input_dem_file + ext
+
+        hillshade_params = {}
+        hillshade_params['azimuth1'] = 350
+        hillshade_params['azimuth2'] = 15
+        hillshade_params['azimuth3'] = 270
+        hillshade_params['angle_altitude1'] = 70
+        hillshade_params['angle_altitude2'] = 60
+        hillshade_params['angle_altitude3'] = 55
+        hillshade_params['transparency1'] = 50
+        hillshade_params['transparency2'] = 65
+        hillshade_params['transparency3'] = 70
+        self.hill_params = hillshade_params
+
+    def test_input(self):
+        """Test for input data
+        """
+        self.assertTrue(os.path.exists(self.input_dem))
+
+    def test_generating_hillshades_array(self):
+        """test generating partial hillshades arrays from dem
+        """
+        dem_array = raster_funs.raster_2_array(self.input_dem)
+        hillshade_1 = hillshade.hillshade(dem_array,
+                                          self.hill_params['azimuth1'],
+                                          self.hill_params['angle_altitude1'])
+        hillshade_2 = hillshade.hillshade(dem_array,
+                                          self.hill_params['azimuth2'],
+                                          self.hill_params['angle_altitude2'])
+        hillshade_3 = hillshade.hillshade(dem_array,
+                                          self.hill_params['azimuth3'],
+                                          self.hill_params['angle_altitude3'])
+
+        self.assertIsNotNone(hillshade_1)
+        self.assertIsNotNone(hillshade_2)
+        self.assertIsNotNone(hillshade_3)
+
+    def test_shared_terrain_derivatives(self):
+        """test shading all the exposures from the same terrain derivatives
+        """
+        dem_array, no_data_value = raster_funs.raster_2_array(self.input_dem)
+        exposures = [(self.hill_params['azimuth1'],
+                      self.hill_params['angle_altitude1']),
+                     (self.hill_params['azimuth2'],
+                      self.hill_params['angle_altitude2']),
+                     (self.hill_params['azimuth3'],
+                      self.hill_params['angle_altitude3'])]
+
+        derivatives = hillshade.TerrainDerivatives(dem_array)
+        hillshade_arrays = hillshade.shade_exposures(derivatives, exposures)
+
+        self.assertEqual(len(hillshade_arrays), 3)
+        for hillshade_array, (azimuth, altitude) in zip(hillshade_arrays,
+                                                       exposures):
+            expected = hillshade.hillshade(dem_array, no_data_value,
+                                           azimuth, altitude)
+            self.assertEqual(hillshade_array.dtype, expected.dtype)
+            self.assertTrue((hillshade_array == expected).all())
+
+    def test_shading_precision(self):
+        """test that shading in float32 and in float64 differ at most in one
+        gray level
+        """
+        dem_array, no_data_value = raster_funs.raster_2_array(self.input_dem)
+        single = hillshade.hillshade(dem_array, no_data_value,
+                                     self.hill_params['azimuth1'],
+                                     self.hill_params['angle_altitude1'])
+        double = hillshade.hillshade(dem_array, no_data_value,
+                                     self.hill_params['azimuth1'],
+                                     self.hill_params['angle_altitude1'],
+                                     dtype='float64')
+
+        self.assertEqual(single.dtype, double.dtype)
+        self.assertLessEqual(
+                abs(single.astype(int) - double.astype(int)).max(), 1)
+
+    def test_normal_vector_shading(self):
+        """test that the normal vectors shading gives the same hillshade as
+        the slope and aspect shading
+        """
+        dem_array, no_data_value = raster_funs.raster_2_array(self.input_dem)
+        for index in range(1, 4):
+            azimuth = self.hill_params['azimuth{}'.format(index)]
+            altitude = self.hill_params['angle_altitude{}'.format(index)]
+            trigonometric = hillshade.hillshade(dem_array, no_data_value,
+                                                azimuth, altitude,
+                                                method='trigonometric')
+            normal = hillshade.hillshade(dem_array, no_data_value,
+                                         azimuth, altitude, method='normal')
+
+            self.assertLessEqual(
+                    abs(trigonometric.astype(int) - normal.astype(int)).max(),
+                    1)
+
+    def test_threaded_shading(self):
+        """test that shading in parallel row bands gives the same hillshades
+        as shading in a single thread
+        """
+        dem_array, no_data_value = raster_funs.raster_2_array(self.input_dem)
+        exposures = hillshader_process.light_exposures(self.hill_params)
+
+        partials, composed = hillshader_process.shade_dem(
+                dem_array, no_data_value, exposures, True)
+        threaded_partials, threaded_composed = hillshader_process.shade_dem(
+                dem_array, no_data_value, exposures, True, threads=3)
+
+        self.assertTrue((composed == threaded_composed).all())
+        for partial, threaded_partial in zip(partials, threaded_partials):
+            self.assertTrue((partial == threaded_partial).all())
+
+    def test_banded_derivatives(self):
+        """test that computing the terrain derivatives in row bands with a
+        halo gives the same hillshades as computing them for the whole DEM
+        """
+        dem_array = numpy.random.RandomState(0).rand(50, 40).cumsum(axis=0)
+        exposures = [(315, 60), (15, 60), (75, 60)]
+
+        for method in hillshade.SHADING_METHODS:
+            for kernel in hillshade.GRADIENT_KERNELS:
+                derivatives = hillshade.terrain_derivatives(
+                        dem_array, method=method, kernel=kernel)
+                expected = hillshade.shade_exposures(derivatives, exposures)
+                banded = hillshade.shade_dem_exposures(
+                        dem_array, exposures, 4, method=method,
+                        kernel=kernel)
+                for banded_array, expected_array in zip(banded, expected):
+                    self.assertTrue(numpy.array_equal(banded_array,
+                                                      expected_array))
+
+    def test_fused_kernel(self):
+        """test that the fused shading and blend kernels give the same
+        hillshades as shading and blending each exposure
+        """
+        dem_array, no_data_value = raster_funs.raster_2_array(self.input_dem)
+        exposures = hillshader_process.light_exposures(self.hill_params)
+        partials, composed = hillshader_process.shade_dem(
+                dem_array, no_data_value, exposures, True)
+        valid = raster_funs.ValidityMask(dem_array, no_data_value).array()
+
+        kernels = [False]
+        if fused_shading.HAS_NUMBA:
+            kernels.append(True)
+        for use_numba in kernels:
+            fused_partials, fused_composed = fused_shading.shade_dem_fused(
+                    dem_array, exposures, valid, True, use_numba=use_numba)
+
+            self.assertLessEqual(abs(composed.astype(int) -
+                                     fused_composed.astype(int)).max(), 1)
+            for partial, fused_partial in zip(partials, fused_partials):
+                self.assertLessEqual(abs(partial.astype(int) -
+                                         fused_partial.astype(int)).max(), 1)
+
+    def test_gradient_spacing(self):
+        """test that the derivatives take the pixel size and the z factor
+        into account with every kernel
+        """
+        rows, cols = numpy.mgrid[0:20, 0:30]
+        plane = 3. * rows + 2. * cols
+
+        for kernel in hillshade.GRADIENT_KERNELS:
+            x, y = hillshade.gradients(plane, spacing=(2., 4.), z_factor=2.,
+                                       kernel=kernel)
+            self.assertTrue(numpy.allclose(x[1:-1, 1:-1], 3.))
+            self.assertTrue(numpy.allclose(y[1:-1, 1:-1], 1.))
+
+            x, y = hillshade.gradients(plane, spacing=(2., 4.),
+                                       z_factor=(2., 4.), kernel=kernel)
+            self.assertTrue(numpy.allclose(x[1:-1, 1:-1], 3.))
+            self.assertTrue(numpy.allclose(y[1:-1, 1:-1], 2.))
+
+        geotransform = (500000., 2., 0, 4500000., 0, -2.)
+        spacing = raster_funs.pixel_spacing(geotransform)
+        self.assertEqual(spacing, (2., 2.))
+        self.assertEqual(raster_funs.default_z_factor(geotransform, None),
+                         (1., 1.))
+
+    def test_generating_hillshades_raster(self):
+        """test generating partial hillshades rasters from dem
+        """
+        temp_dir = tempfile.mkdtemp()
+
+        output_folder = os.path.join(temp_dir,'hillshader_results')
+        if not os.path.exists(output_folder):
+            os.makedirs(output_folder)
+
+        array = raster_funs.raster_2_array(self.input_dem)
+
+        raster_funs.array_2_raster(array,
+                                   self.input_dem,
+                                   os.path.join(output_folder, 'file.tif'))
+
+        self.assertTrue(os.path.exists(
+                os.path.join(output_folder, 'file.tif')))
+
+    def test_output_profiles(self):
+        """test writing rasters with every output profile
+        """
+        output_folder = tempfile.mkdtemp()
+        array, _ = raster_funs.raster_2_array(self.input_dem)
+
+        for output_profile in raster_funs.OUTPUT_PROFILES:
+            out_put = os.path.join(output_folder,
+                                   '{}.tif'.format(output_profile))
+            raster_funs.array_2_raster(array, self.input_dem, out_put,
+                                       output_profile=output_profile)
+
+            self.assertTrue(os.path.exists(out_put))
+            self.assertFalse(os.path.exists(out_put + '.tmp.tif'))
+            written_array, _ = raster_funs.raster_2_array(out_put)
+            self.assertEqual(written_array.shape, array.shape)
+
+    def test_mapped_read(self):
+        """test that mapping the dem in memory gives the same raster as
+        reading it
+        """
+        mapped = raster_funs.read_raster(self.input_dem)
+        read = raster_funs.read_raster(self.input_dem, mmap=False)
+
+        self.assertTrue((mapped.array == read.array).all())
+        self.assertEqual(mapped.geotransform, read.geotransform)
+        self.assertEqual(mapped.no_data_value, read.no_data_value)
+        self.assertIsNone(read.data_set)
+
+    def test_georeference_cache(self):
+        """test that the georeference of a template raster is resolved once
+        """
+        geo_profile = raster_funs.get_georeference(self.input_dem)
+
+        self.assertIs(raster_funs.get_georeference(self.input_dem),
+                      geo_profile)
+        self.assertIs(raster_funs.get_georeference(geo_profile), geo_profile)
+        self.assertEqual(
+                raster_funs.get_georeference(
+                        raster_funs.read_raster(self.input_dem)),
+                geo_profile)
+
+    def test_in_memory_template(self):
+        """test that a raster georeferenced from an in memory raster is the
+        same as one georeferenced from the file
+        """
+        output_folder = tempfile.mkdtemp()
+        array, no_data_value = raster_funs.raster_2_array(self.input_dem)
+        geotransform, projection = raster_funs.get_georeference(
+                self.input_dem)
+        dem_raster = raster_funs.RasterData(array, geotransform, projection,
+                                            no_data_value)
+
+        from_file = os.path.join(output_folder, 'from_file.tif')
+        from_memory = os.path.join(output_folder, 'from_memory.tif')
+        raster_funs.array_2_raster(array, self.input_dem, from_file)
+        raster_funs.array_2_raster(array, dem_raster, from_memory)
+
+        self.assertEqual(raster_funs.get_georeference(from_file),
+                         raster_funs.get_georeference(from_memory))
+        self.assertEqual(dem_raster.to_dataset().ReadAsArray().shape,
+                         array.shape)
+
+    def test_layer_weights(self):
+        """test that blending with the closed form weights gives the same
+        result as blending the layers one by one
+        """
+        alpha_values = [0.65, 0.5, 0.7, 0.2, 0.9]
+        layers = [numpy.full((4, 4), 40 * index, dtype=numpy.uint8)
+                  for index in range(len(alpha_values))]
+
+        expected = 255. * numpy.ones((4, 4))
+        for layer, alpha in zip(layers, alpha_values):
+            expected = layer * alpha + (1 - alpha) * expected
+
+        merged = bandCalc.merge_arrays(layers, alpha_values, None, None)
+
+        self.assertEqual(merged.dtype, numpy.uint8)
+        self.assertLessEqual(
+                abs(merged.astype(int) - expected.astype(int)).max(), 1)
+
+    def test_combinig_hillshades_arrays(self):
+        """test combining arrays (band calculator)
+        """
+        dem_array = raster_funs.raster_2_array(self.input_dem)
+        hillshade_1_array = hillshade.hillshade(dem_array,
+                                          self.hill_params['azimuth1'],
+                                          self.hill_params['angle_altitude1'])
+        hillshade_2_array = hillshade.hillshade(dem_array,
+                                          self.hill_params['azimuth2'],
+                                          self.hill_params['angle_altitude2'])
+        hillshade_3_array = hillshade.hillshade(dem_array,
+                                          self.hill_params['azimuth3'],
+                                          self.hill_params['angle_altitude3'])
+
+        combined_array = bandCalc.merge_arrays(
+                [hillshade_1_array, hillshade_2_array, hillshade_3_array],
+                [self.hill_params['transparency1'],
+                 self.hill_params['transparency2'],
+                 self.hill_params['transparency3']])
+
+        output_folder = os.path.join(tempfile.mkdtemp(),
+                                          'hillshader_results')
+        if not os.path.exists(output_folder):
+            os.mkdir(output_folder)
+
+        out_put = os.path.join(output_folder, 'combined_hillshade.tif')
+        raster_funs.array_2_raster(combined_array, self.input_dem, out_put)
+
+        self.assertTrue(os.path.exists(out_put))
+
+        self.assertNotAlmostEquals(0, combined_array.any())
+        self.assertEqual(combined_array.shape, (100, 100))
+        self.assertAlmostEqual(int(combined_array.max()), 255)
+        self.assertAlmostEqual(int(combined_array.min()), 0)
+        self.assertAlmostEqual(int(combined_array.mean()), 255/2)
+
+    def test_block_process(self):
+        """test that shading the dem in blocks gives the same composed
+        hillshade as shading the whole dem
+        """
+        dem_array, no_data_value = raster_funs.raster_2_array(self.input_dem)
+        exposures = hillshader_process.light_exposures(self.hill_params)
+        _, composed_array = hillshader_process.shade_dem(
+                dem_array, no_data_value, exposures)
+
+        blocks_array = composed_array * 0
+        rows, cols = dem_array.shape
+        for read_window, write_window in raster_funs.block_windows(
+                rows, cols, 32):
+            col, row, block_cols, block_rows = read_window
+            _, composed_block = hillshader_process.shade_dem(
+                    dem_array[row:row + block_rows, col:col + block_cols],
+                    no_data_value, exposures)
+            col, row, block_cols, block_rows = write_window
+            blocks_array[row:row + block_rows, col:col + block_cols] = \
+                raster_funs.crop_to_window(composed_block, read_window,
+                                           write_window)
+
+        self.assertTrue((blocks_array == composed_array).all())
+
+    def test_block_process_cancel(self):
+        """test that a canceled block process removes its unfinished output
+        rasters
+        """
+        output_folder = tempfile.mkdtemp()
+
+        def cancel():
+            raise bh_errors.ProcessCanceledError()
+
+        with self.assertRaises(bh_errors.ProcessCanceledError):
+            hillshader_process.BlockHillshaderDEM(
+                    self.input_dem, True, False, self.hill_params,
+                    output_folder, block_size=64, load_results=False,
+                    cancel_check=cancel)
+        for folder, _, filenames in os.walk(output_folder):
+            self.assertEqual(filenames, [])
+
+    def test_validity_mask(self):
+        """test the shared no data mask, packed and not packed
+        """
+        dem_array = numpy.ones((20, 30))
+        dem_array[5:10, 5:10] = -9999
+
+        mask = raster_funs.ValidityMask(dem_array, -9999)
+        packed_mask = raster_funs.ValidityMask(dem_array, -9999, packed=True)
+        wide_mask = raster_funs.ValidityMask(dem_array, -9999,
+                                             erosion_radius=2)
+
+        self.assertTrue((mask.array() == packed_mask.array()).all())
+        self.assertTrue((mask.array() == raster_funs.erosion_mask(
+                dem_array, -9999)).all())
+        self.assertFalse(mask.array()[4, 7])
+        self.assertTrue(mask.array()[3, 7])
+        self.assertFalse(wide_mask.array()[3, 7])
+        self.assertTrue(raster_funs.ValidityMask(dem_array, None).all_valid)
+
+    def test_async_writer(self):
+        """test that the background writer does every write and raises the
+        write errors
+        """
+        written = []
+        with raster_funs.AsyncWriter(queue_size=2) as writer:
+            for index in range(6):
+                writer.submit(written.append, index)
+        self.assertEqual(sorted(written), list(range(6)))
+
+        def failed_write():
+            raise IOError('disk full')
+
+        writer = raster_funs.AsyncWriter()
+        writer.submit(failed_write)
+        self.assertRaises(IOError, writer.close)
+
+    def test_job_stages(self):
+        """test the stages reported by a job and its cancelation
+        """
+        output_folder = tempfile.mkdtemp()
+        job = batch_processing.create_job(self.input_dem, output_folder,
+                                          batch_processing.DEM_MODE,
+                                          self.hill_params)
+        stages = []
+        result = batch_processing.process_file(job, stages.append)
+
+        self.assertIsNone(result['error'])
+        self.assertEqual(tuple(stages), batch_processing.job_stages(job))
+
+        def cancel(stage):
+            if stage == hillshader_process.SHADE_STAGE:
+                raise bh_errors.ProcessCanceledError()
+
+        result = batch_processing.process_file(job, cancel)
+        self.assertTrue(result['canceled'])
+        self.assertIsNone(result['composed_hillshade'])
+
+    def test_result_cache(self):
+        """test that the cached results are reused without shading or
+        blending and that a change in the transparencies only blends the
+        cached partial hillshades again
+        """
+        output_folder = tempfile.mkdtemp()
+        cache = result_cache.ResultCache(os.path.join(output_folder, 'cache'))
+        dem = raster_funs.read_raster(self.input_dem)
+        dem_key = cache.key('dem', cache.fingerprint(self.input_dem))
+
+        def process(hill_params):
+            return hillshader_process.HillshaderDEM(
+                    self.input_dem, dem.array, dem.no_data_value, False,
+                    True, hill_params, output_folder, load_results=False,
+                    template=dem, cache=cache, cache_key=dem_key)
+
+        hill_dem = process(self.hill_params)
+        composed_path = hill_dem.paths['composed_hillshade']
+        composed_array, _ = raster_funs.raster_2_array(composed_path)
+        partial_keys, composed_key = hill_dem.cache_keys(
+                hillshader_process.light_exposures(self.hill_params),
+                hillshader_process.shading_options(
+                        self.hill_params, dem.geotransform, dem.projection,
+                        dem.array.shape[0]), 1)
+        for partial_key in partial_keys:
+            self.assertIsNotNone(cache.get_array(partial_key))
+        self.assertTrue(numpy.array_equal(cache.get_array(composed_key),
+                                          composed_array))
+
+        shade_dem = hillshader_process.shade_dem
+        merge_arrays = bandCalc.merge_arrays
+        def not_shaded(*args, **kwargs):
+            raise AssertionError(u"The DEM is shaded again")
+        def not_blended(*args, **kwargs):
+            raise AssertionError(u"The partial hillshades are blended again")
+        hillshader_process.shade_dem = not_shaded
+        try:
+            os.remove(composed_path)
+            bandCalc.merge_arrays = not_blended
+            try:
+                process(self.hill_params)
+            finally:
+                bandCalc.merge_arrays = merge_arrays
+            cached_array, _ = raster_funs.raster_2_array(composed_path)
+            self.assertTrue(numpy.array_equal(cached_array, composed_array))
+
+            blend_params = dict(self.hill_params, transparency1=0.2)
+            process(blend_params)
+        finally:
+            hillshader_process.shade_dem = shade_dem
+
+        blended_array, _ = raster_funs.raster_2_array(composed_path)
+        expected = bandCalc.merge_arrays(
+                [cache.get_array(partial_key) for partial_key in partial_keys],
+                [0.2, 65, 70], dem.array, dem.no_data_value,
+                mask=raster_funs.ValidityMask(dem.array, dem.no_data_value))
+        self.assertTrue(numpy.array_equal(blended_array, expected))
+
+    def test_cache_prune(self):
+        """test that the cache removes the least recently used results when
+        it is over its size limit
+        """
+        array = numpy.zeros((64, 64), dtype=numpy.float32)
+        cache = result_cache.ResultCache(tempfile.mkdtemp(),
+                                         max_size=2.5 * array.nbytes)
+        keys = [cache.key('partial_hillshade', index) for index in range(3)]
+        for index, key in enumerate(keys):
+            cache.put_array(key, array)
+            os.utime(cache.path(key, '.npy'), (index, index))
+        # A hit makes the first result the most recently used
+        self.assertIsNotNone(cache.get_array(keys[0]))
+
+        cache.prune()
+        self.assertIsNotNone(cache.get_array(keys[0]))
+        self.assertIsNone(cache.get_array(keys[1]))
+        self.assertIsNotNone(cache.get_array(keys[2]))
+
+    def test_reblend(self):
+        """test that blending again the saved partial hillshades gives the
+        same composed hillshade as shading the DEM again
+        """
+        output_folder = tempfile.mkdtemp()
+        base_name, _ = os.path.splitext(os.path.basename(self.input_dem))
+        job = batch_processing.create_job(
+                self.input_dem,
+                batch_processing.job_result_dir(output_folder, base_name),
+                batch_processing.DEM_MODE, self.hill_params, partials=True)
+        self.assertIsNone(batch_processing.process_file(job)['error'])
+
+        blend_params = dict(self.hill_params, transparency1=20)
+        reblend_job = batch_processing.create_job(
+                self.input_dem,
+                batch_processing.job_result_dir(output_folder, base_name,
+                                                reblend=True),
+                batch_processing.DEM_MODE, blend_params, reblend=True)
+        self.assertEqual(reblend_job['out_path'], job['out_path'])
+        reblend_result = batch_processing.process_file(reblend_job)
+        self.assertIsNone(reblend_result['error'])
+
+        shade_job = batch_processing.create_job(
+                self.input_dem,
+                batch_processing.job_result_dir(output_folder, base_name),
+                batch_processing.DEM_MODE, blend_params)
+        shade_result = batch_processing.process_file(shade_job)
+
+        reblended_array, _ = raster_funs.raster_2_array(
+                reblend_result['composed_hillshade'])
+        shaded_array, _ = raster_funs.raster_2_array(
+                shade_result['composed_hillshade'])
+        self.assertTrue(numpy.array_equal(reblended_array, shaded_array))
+
+    def test_tile_set(self):
+        """test that the tiles of a DEM shaded as a tile set give the same
+        hillshade as the whole DEM, without seams
+        """
+        output_folder = tempfile.mkdtemp()
+        dem = raster_funs.read_raster(self.input_dem)
+        rows, cols = dem.array.shape
+        tile_rows, tile_cols = rows // 2, cols // 2
+        geotransform = dem.geotransform
+
+        tiles = {}
+        for row in (0, tile_rows):
+            for col in (0, tile_cols):
+                tile_path = os.path.join(output_folder,
+                                         'tile_{}_{}.tif'.format(row, col))
+                tile_geotransform = (
+                        geotransform[0] + col * geotransform[1],
+                        geotransform[1], 0,
+                        geotransform[3] + row * geotransform[5],
+                        0, geotransform[5])
+                raster_funs.RasterData(
+                        dem.array[row:row + tile_rows, col:col + tile_cols],
+                        tile_geotransform, dem.projection,
+                        dem.no_data_value).save(tile_path)
+                tiles[tile_path] = (row, col)
+
+        neighbours = tile_index.tile_neighbours(list(tiles))
+        for tile_path in tiles:
+            self.assertEqual(len(neighbours[tile_path]), 3)
+
+        # The area covered by the tiles
+        whole_dem = hillshader_process.HillshaderDEM(
+                self.input_dem, dem.array[:2 * tile_rows, :2 * tile_cols],
+                dem.no_data_value, False, True, self.hill_params,
+                os.path.join(output_folder, 'whole'), load_results=False,
+                template=dem)
+        whole_array, _ = raster_funs.raster_2_array(
+                whole_dem.paths['composed_hillshade'])
+
+        results = batch_processing.hillshade_files(
+                list(tiles), os.path.join(output_folder, 'tiles'),
+                self.hill_params, tile_set=True)
+        for result in results:
+            self.assertIsNone(result['error'])
+            row, col = tiles[result['input_file']]
+            tile_array, _ = raster_funs.raster_2_array(
+                    result['composed_hillshade'])
+            self.assertTrue(numpy.array_equal(
+                    tile_array,
+                    whole_array[row:row + tile_rows, col:col + tile_cols]))
+
+    def test_fill_uncovered(self):
+        """test that the halo pixels that no tile covers repeat the nearest
+        tile pixels
+        """
+        halo_array = numpy.arange(25.).reshape(5, 5)
+        uncovered = numpy.ones((5, 5), dtype=bool)
+        uncovered[:3, :3] = False
+
+        filled = raster_funs.fill_uncovered(halo_array, uncovered)
+        self.assertTrue(numpy.array_equal(
+                filled, numpy.pad(halo_array[:3, :3], ((0, 2), (0, 2)),
+                                  mode='edge')))
+
+    def test_results_mosaic(self):
+        """test the virtual mosaic of the composed hillshades of a batch
+        """
+        output_folder = tempfile.mkdtemp()
+        results = batch_processing.hillshade_files(
+                [self.input_dem, self.input_dem_file + '_missing.tif'],
+                output_folder, self.hill_params)
+        mosaic_path = batch_processing.build_results_mosaic(
+                results, output_folder, threads=2)
+
+        self.assertEqual(mosaic_path, os.path.join(
+                output_folder, batch_processing.MOSAIC_FILENAME))
+        self.assertEqual(raster_funs.raster_shape(mosaic_path),
+                         raster_funs.raster_shape(self.input_dem))
+        composed_ds, composed_band, _ = raster_funs.open_raster_band(
+                results[0]['composed_hillshade'])
+        self.assertTrue(composed_band.GetOverviewCount() > 0)
+        self.assertIsNone(batch_processing.build_results_mosaic(
+                results[1:], output_folder))
+
+    def test_batch_error_isolation(self):
+        """test that an error in one file does not stop the batch
+        """
+        output_folder = tempfile.mkdtemp()
+        jobs = [batch_processing.create_job(
+                    input_dem, os.path.join(output_folder, str(index)),
+                    batch_processing.DEM_MODE, self.hill_params)
+                for index, input_dem in enumerate(
+                        [self.input_dem_file + '_missing.tif',
+                         self.input_dem])]
+
+        results = batch_processing.run_batch(jobs, workers=2)
+
+        self.assertIsNotNone(results[0]['error'])
+        self.assertIsNone(results[1]['error'])
+        self.assertTrue(os.path.exists(results[1]['composed_hillshade']))
+
+    def tearDown(self):
+        pass
+
+def qgis_app_init():
+    from qgis.PyQt import QtWidgets
+    import os
+    import atexit
+    atexit.register(QgsApplication.exitQgis)
+
+    app = QtWidgets.QApplication([])
+    qgis_prefix = os.getenv("QGIS_PREFIX_PATH")
+    # Initialize qgis libraries
+    QgsApplication.setPrefixPath(qgis_prefix, True)
+    QgsApplication.initQgis()
+    return app
+
+
+app = qgis_app_init()
+
+if __name__ == "__main__":
+
+    unittest.main()
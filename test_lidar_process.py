@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ Batch_Hillshader
+                                 A QGIS plugin  to generate a three light
+                                 exposure hillshade (shaded relief by
+                                 combining three light exposures)
+
+    For more information, see the program documentation.
+
+    Plugin uses LASzip, see <https://laszip.org/>
+                              -------------------
+        begin                : 2016-07-13
+        git sha              : $Format:%H$
+        copyright            : (C) 2017 by PANOimagen S.L.
+        email                : info@panoimagen.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software: you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation, either version 3 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ *   This program is distributed in the hope that it will be useful,       *
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+ *   GNU General Public License for more details.                          *
+ *                                                                         *
+ *   You should have received a copy of the GNU General Public License     *
+ *   along with this program.  If not, see <https://www.gnu.org/licenses/> *
+ ***************************************************************************/
+ Test lidar mode processing
+"""
+
+import unittest
+import tempfile
+import os
+
+import numpy as np
+from scipy.interpolate import griddata
+
+import laspy_utils
+import bh_errors
+
+class LiDARTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Creating a synthetic las file
+        """
+        import laspy
+        random_generator = np.random.RandomState(0)
+        points_number = 100000
+        header = laspy.LasHeader(point_format=1, version='1.2')
+        header.scales = [0.01, 0.01, 0.01]
+        header.offsets = [500000., 4000000., 0.]
+        las_data = laspy.LasData(header)
+        las_data.x = random_generator.uniform(500000., 500500., points_number)
+        las_data.y = random_generator.uniform(4000000., 4000400.,
+                                              points_number)
+        las_data.z = random_generator.uniform(100., 200., points_number)
+        las_data.classification = random_generator.choice(
+                [1, 2, 2, 5, 7], points_number).astype(np.uint8)
+        returns_number = random_generator.randint(1, 4, points_number)
+        las_data.number_of_returns = returns_number
+        las_data.return_number = np.minimum(
+                random_generator.randint(1, 4, points_number), returns_number)
+
+        self.las_path = os.path.join(tempfile.mkdtemp(), 'file.las')
+        las_data.write(self.las_path)
+
+    def test_streaming_read(self):
+        """test that reading the file in chunks gives the same points,
+        extent and density as reading the whole file
+        """
+        for terrain, surfaces in ((True, False), (False, True)):
+            lidar = laspy_utils.LiDAR(self.las_path, tempfile.mkdtemp(),
+                                      False, terrain, surfaces)
+            streamed_lidar = laspy_utils.LiDAR(
+                    self.las_path, tempfile.mkdtemp(), False, terrain,
+                    surfaces, streaming=True, chunk_size=30000)
+            lidar_result = lidar.process()
+            streamed_result = streamed_lidar.process()
+
+            np.testing.assert_array_equal(lidar_result[0][0],
+                                          streamed_result[0][0])
+            np.testing.assert_allclose(lidar_result[0][1],
+                                       streamed_result[0][1], atol=1e-4)
+            self.assertEqual(lidar_result[1], streamed_result[1])
+            self.assertEqual(lidar.density, streamed_lidar.density)
+
+    def test_intermediate_las_format(self):
+        """test that reading the file in chunks writes the same
+        intermediate las file as reading the whole file
+        """
+        import laspy
+        las_path = os.path.join(tempfile.mkdtemp(), 'format3.las')
+        laspy.convert(laspy.read(self.las_path),
+                      point_format_id=3).write(las_path)
+
+        las_files = []
+        for streaming in (False, True):
+            lidar = laspy_utils.LiDAR(las_path, tempfile.mkdtemp(), True,
+                                      terrain=True, streaming=streaming,
+                                      chunk_size=30000)
+            lidar.process()
+            lidar.wait_las_file()
+            las_files.append(laspy.read(lidar.out_full_path))
+
+        for las_file in las_files:
+            self.assertEqual(las_file.header.point_format.id,
+                             laspy_utils.LAS_POINT_FORMAT)
+        np.testing.assert_array_equal(las_files[0].X, las_files[1].X)
+        np.testing.assert_array_equal(las_files[0].Z, las_files[1].Z)
+
+    def test_statistics(self):
+        """test the points statistics of the file
+        """
+        import laspy
+        las_data = laspy.read(self.las_path)
+        lidar = laspy_utils.LiDAR(self.las_path, tempfile.mkdtemp(), False,
+                                  terrain=True)
+        statistics = lidar.statistics
+
+        self.assertEqual(statistics.points_number, len(las_data.points))
+        self.assertEqual(statistics.class_points_number(2),
+                         np.count_nonzero(las_data.classification == 2))
+        self.assertEqual(statistics.class_points_number(1, 7),
+                         np.count_nonzero(las_data.classification == 1) +
+                         np.count_nonzero(las_data.classification == 7))
+        self.assertEqual(statistics.first_returns_number,
+                         np.count_nonzero(las_data.return_number == 1))
+        self.assertEqual(lidar.las_file_extent[2],
+                         (las_data.x.min(), las_data.y.max()))
+
+class RasterizeLiDARTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Creating a synthetic point cloud
+        """
+        random_generator = np.random.RandomState(0)
+        points_number = 20000
+        x = random_generator.uniform(1000., 1200., points_number)
+        y = random_generator.uniform(5000., 5150., points_number)
+        z = np.sin(x / 20.) * 10 + y / 10.
+        extent = [(max(x), max(y)), (max(x), min(y)),
+                  (min(x), max(y)), (min(x), min(y))]
+        density = points_number / (200. * 150.)
+
+        self.laspy_result = [[np.column_stack((x, y)), z], extent, density]
+        self.out_path = tempfile.mkdtemp()
+
+    def rasterize(self, method):
+        return laspy_utils.RasterizeLiDAR(
+                os.path.join(self.out_path, 'file.las'), self.laspy_result,
+                self.out_path, terrain=True, method=method, pixel_size=1.)
+
+    def test_tiled_interpolation(self):
+        """test that the tiled interpolation gives the same grid as
+        interpolating the whole point cloud at once
+        """
+        for method in ('nearest', 'linear'):
+            rasterize = self.rasterize(method)
+            interpolated_grid = rasterize.interpolate_grid()
+            grid_x, grid_y = np.meshgrid(rasterize.grid_x, rasterize.grid_y)
+            expected_grid = griddata(self.laspy_result[0][0],
+                                     self.laspy_result[0][1],
+                                     (grid_x, grid_y), method=method)
+
+            self.assertEqual(interpolated_grid.shape, expected_grid.shape)
+            np.testing.assert_allclose(interpolated_grid, expected_grid,
+                                       rtol=1e-6)
+
+    def test_idw_sparse_areas(self):
+        """test that the inverse distance weighting interpolates the pixels
+        far from every point (wider gaps than the tiles buffer)
+        """
+        xy_array, altitudes = self.laspy_result[0]
+        outside_gap = (xy_array[:, 0] < 1070.) | (xy_array[:, 0] > 1130.)
+        self.laspy_result[0] = [xy_array[outside_gap],
+                                altitudes[outside_gap]]
+
+        interpolated_grid = self.rasterize('idw').interpolate_grid()
+        self.assertTrue(np.isfinite(interpolated_grid).all())
+
+    def test_binning_methods(self):
+        """test the min, max and mean binning methods
+        """
+        min_grid = self.rasterize('min').interpolate_grid()
+        max_grid = self.rasterize('max').interpolate_grid()
+        mean_grid = self.rasterize('mean').interpolate_grid()
+
+        valid = np.isfinite(mean_grid)
+        self.assertTrue(valid.any())
+        self.assertTrue((min_grid[valid] <= mean_grid[valid] + 1e-9).all())
+        self.assertTrue((max_grid[valid] >= mean_grid[valid] - 1e-9).all())
+
+    def test_empty_pixels_no_data(self):
+        """test that the pixels without value of the interpolated grid are
+        no data in the DEM raster
+        """
+        for method in ('linear', 'mean'):
+            rasterize = self.rasterize(method)
+            interpolated_grid = rasterize.interpolate_grid()
+            empty = ~np.isfinite(interpolated_grid)
+            self.assertTrue(empty.any())
+
+            dem_raster = rasterize.grid_2_raster(interpolated_grid)
+            self.assertTrue(np.isfinite(dem_raster.array).all())
+            self.assertTrue(
+                    (dem_raster.array[empty] ==
+                     dem_raster.no_data_value).all())
+
+    def test_interpolation_cancel(self):
+        """test that a canceled interpolation stops in its first tile (or
+        chunk of binned points)
+        """
+        def cancel():
+            raise bh_errors.ProcessCanceledError()
+
+        for method in ('nearest', 'mean'):
+            with self.assertRaises(bh_errors.ProcessCanceledError):
+                self.rasterize(method).interpolate_grid(cancel)
+
+    def tearDown(self):
+        pass
+
+if __name__ == "__main__":
+
+    unittest.main()